@@ -16,9 +16,11 @@ from requests.exceptions import RequestException
 from account.decorators import super_admin_required
 from account.models import User
 from contest.models import Contest
-from judge.dispatcher import process_pending_task
+from judge.dispatcher import process_pending_task, get_judge_server_loads, get_judge_server_stats
 from options.options import SysOptions
 from problem.models import Problem
+from problem.test_case_archive import delete_test_case_archives
+from problem.test_case_store import prune_blobs
 from submission.models import Submission
 from utils.api import APIView, CSRFExemptAPIView, validate_serializer
 from utils.shortcuts import send_email, get_env
@@ -109,8 +111,15 @@ class JudgeServerAPI(APIView):
     @super_admin_required
     def get(self, request):
         servers = JudgeServer.objects.all().order_by("-last_heartbeat")
+        data = JudgeServerSerializer(servers, many=True).data
+        # 判题槽位由 redis 租约记录, task_number 以租约数为准
+        loads = get_judge_server_loads(item["id"] for item in data)
+        stats = get_judge_server_stats(item["id"] for item in data)
+        for item in data:
+            item["task_number"] = loads[item["id"]]
+            item["request_stats"] = stats[item["id"]]
         return self.success({"token": SysOptions.judge_server_token,
-                             "servers": JudgeServerSerializer(servers, many=True).data})
+                             "servers": data})
 
     @super_admin_required
     def delete(self, request):
@@ -188,13 +197,19 @@ class TestCasePruneAPI(APIView):
         test_case_id = request.GET.get("id")
         if test_case_id:
             self.delete_one(test_case_id)
-            return self.success()
-        for id in self.get_orphan_ids():
-            self.delete_one(id)
+        else:
+            for id in self.get_orphan_ids():
+                self.delete_one(id)
+        # 删除测试用例目录后, 不再被任何目录硬链接的 blob 也一并删除
+        prune_blobs()
         return self.success()
 
     @staticmethod
     def get_orphan_ids():
+        """
+        测试用例目录中的文件是 blob 的硬链接, 删除目录只会减少 blob 的引用计数, 不会影响其他题目
+        blob 目录的名字不是 32 位 id, 不会出现在这里
+        """
         db_ids = Problem.objects.all().values_list("test_case_id", flat=True)
         disk_ids = os.listdir(settings.TEST_CASE_DIR)
         test_case_re = re.compile(r"^[a-zA-Z0-9]{32}$")
@@ -206,6 +221,7 @@ class TestCasePruneAPI(APIView):
         test_case_dir = os.path.join(settings.TEST_CASE_DIR, id)
         if os.path.isdir(test_case_dir):
             shutil.rmtree(test_case_dir, ignore_errors=True)
+        delete_test_case_archives(id)
 
 
 class ReleaseNotesAPI(APIView):
@@ -0,0 +1,113 @@
+import json
+
+from account.models import AdminType
+from utils.cache import cache
+from utils.constants import CacheKey, ContestRuleType
+
+from .models import ACMContestRank, OIContestRank
+from .serializers import ACMContestRankSerializer, OIContestRankSerializer
+
+
+class Scoreboard(object):
+    """
+    比赛排名保存在 redis 中, 判题结束后只更新提交用户的那一行
+    - zset: user_id -> 排序分数, ACM 为 accepted_number * 10^10 - total_time, OI 为 total_score
+    - hash: user_id -> 序列化后的 rank (包含 real_name, 非管理员读取时去掉)
+    数据库中的 rank 是唯一的数据来源, redis 中的数据丢失或失效时从数据库重建
+
+    实现了切片和 count, 可以直接交给 APIView.paginate_data 分页
+    """
+    def __init__(self, contest, need_real_name=False):
+        self.contest = contest
+        self.need_real_name = need_real_name
+        self.zset_key = f"{CacheKey.contest_rank}:{contest.id}"
+        self.rows_key = f"{self.zset_key}:rows"
+        self.built_key = f"{self.zset_key}:built"
+        if contest.rule_type == ContestRuleType.ACM:
+            self.model, self.serializer = ACMContestRank, ACMContestRankSerializer
+        else:
+            self.model, self.serializer = OIContestRank, OIContestRankSerializer
+
+    def get_rank(self):
+        qs = self.model.objects.filter(contest=self.contest,
+                                       user__admin_type=AdminType.REGULAR_USER,
+                                       user__is_disabled=False).select_related("user")
+        if self.contest.rule_type == ContestRuleType.ACM:
+            return qs.order_by("-accepted_number", "total_time")
+        return qs.order_by("-total_score")
+
+    def _score(self, rank):
+        if self.contest.rule_type == ContestRuleType.ACM:
+            return rank.accepted_number * 10 ** 10 - rank.total_time
+        return rank.total_score
+
+    def _write(self, pipe, ranks):
+        rows = self.serializer(ranks, many=True, is_contest_admin=True).data
+        for rank, row in zip(ranks, rows):
+            pipe.zadd(self.zset_key, {rank.user_id: self._score(rank)})
+            pipe.hset(self.rows_key, rank.user_id, json.dumps(row))
+
+    def rebuild(self):
+        ranks = list(self.get_rank().select_related("user__userprofile"))
+        pipe = cache.pipeline()
+        pipe.delete(self.zset_key, self.rows_key)
+        self._write(pipe, ranks)
+        pipe.set(self.built_key, 1)
+        pipe.execute()
+
+    def invalidate(self):
+        cache.get_client(write=True).delete(self.built_key, self.zset_key, self.rows_key)
+
+    def update(self, user_id):
+        """
+        从数据库读取该用户最新的 rank 并写入 redis, 应在 rank 所在事务提交后调用
+        """
+        if not cache.exists(self.built_key):
+            # 下次读取时会整体重建
+            return
+        pipe = cache.pipeline()
+        try:
+            rank = self.get_rank().select_related("user__userprofile").get(user_id=user_id)
+            self._write(pipe, [rank])
+        except self.model.DoesNotExist:
+            # 管理员和被禁用的用户不参与排名
+            pipe.zrem(self.zset_key, user_id)
+            pipe.hdel(self.rows_key, user_id)
+        pipe.execute()
+
+    def count(self):
+        if not cache.exists(self.built_key):
+            self.rebuild()
+        return cache.zcard(self.zset_key)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError("Scoreboard only supports slicing")
+        start, stop = item.start or 0, item.stop
+        if stop is not None and stop <= start:
+            return []
+        if not cache.exists(self.built_key):
+            self.rebuild()
+        user_ids = cache.zrevrange(self.zset_key, start, -1 if stop is None else stop - 1)
+        if not user_ids:
+            return []
+        results = []
+        for row in cache.hmget(self.rows_key, user_ids):
+            if row is None:
+                continue
+            row = json.loads(row)
+            if not self.need_real_name:
+                row["user"]["real_name"] = None
+            results.append(row)
+        return results
+
+
+def notify_rank_update(contest_id, user_id):
+    """
+    通知微服务重新计算该用户在比赛排名快照中的数据
+    """
+    pipe = cache.pipeline()
+    pipe.rpush(CacheKey.contest_rank_updates, json.dumps({"contest_id": contest_id, "user_id": user_id}))
+    # 微服务没有运行时避免无限增长
+    pipe.ltrim(CacheKey.contest_rank_updates, -10000, -1)
+    pipe.execute()
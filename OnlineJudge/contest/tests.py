@@ -5,7 +5,8 @@ from django.utils import timezone
 
 from utils.api.tests import APITestCase
 
-from .models import ContestAnnouncement, ContestRuleType, Contest
+from .models import ContestAnnouncement, ContestRuleType, Contest, ACMContestRank
+from .scoreboard import Scoreboard
 
 DEFAULT_CONTEST_DATA = {"title": "test title", "description": "test description",
                         "start_time": timezone.localtime(timezone.now()),
@@ -160,3 +161,34 @@ class ContestRankAPITest(APITestCase):
     def get_contest_rank(self):
         resp = self.client.get(self.url + "?contest_id=" + self.acm_contest.id)
         self.assertSuccess(resp)
+
+
+class ScoreboardTest(APITestCase):
+    def setUp(self):
+        admin = self.create_admin(login=False)
+        self.contest = Contest.objects.create(created_by=admin, **DEFAULT_CONTEST_DATA)
+        self.users = [self.create_user(f"test{i}", "test123", login=False) for i in range(3)]
+        for user, (accepted_number, total_time) in zip(self.users, [(1, 100), (2, 300), (1, 50)]):
+            ACMContestRank.objects.create(user=user, contest=self.contest, submission_number=accepted_number,
+                                          accepted_number=accepted_number, total_time=total_time)
+        ACMContestRank.objects.create(user=admin, contest=self.contest, accepted_number=10)
+        self.scoreboard = Scoreboard(self.contest)
+
+    def tearDown(self):
+        self.scoreboard.invalidate()
+
+    def test_rank_order(self):
+        self.assertEqual(self.scoreboard.count(), 3)
+        self.assertEqual([item["user"]["username"] for item in self.scoreboard[0:10]], ["test1", "test2", "test0"])
+        self.assertEqual([item["user"]["username"] for item in self.scoreboard[1:2]], ["test2"])
+        self.assertIsNone(self.scoreboard[0:1][0]["user"]["real_name"])
+
+    def test_update(self):
+        self.scoreboard.rebuild()
+        ACMContestRank.objects.filter(user=self.users[0]).update(accepted_number=3)
+        self.scoreboard.update(self.users[0].id)
+        self.assertEqual(self.scoreboard[0:1][0]["user"]["username"], "test0")
+        self.users[1].is_disabled = True
+        self.users[1].save()
+        self.scoreboard.update(self.users[1].id)
+        self.assertEqual(self.scoreboard.count(), 2)
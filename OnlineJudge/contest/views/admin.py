@@ -1,20 +1,15 @@
-import copy
-import os
-import zipfile
 from ipaddress import ip_network
 
 import dateutil.parser
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
 
 from account.decorators import check_contest_permission, ensure_created_by
-from account.models import User
+from account.models import AdminType, User
 from submission.models import Submission, JudgeStatus
 from utils.api import APIView, validate_serializer
-from utils.cache import cache
-from utils.constants import CacheKey
-from utils.shortcuts import rand_str
-from utils.tasks import delete_files
+from utils.zipstream import ZipStream
 from ..models import Contest, ContestAnnouncement, ACMContestRank
+from ..scoreboard import Scoreboard, notify_rank_update
 from ..serializers import (ContestAnnouncementSerializer, ContestAdminSerializer,
                            CreateConetestSeriaizer, CreateContestAnnouncementSerializer,
                            EditConetestSeriaizer, EditContestAnnouncementSerializer,
@@ -60,8 +55,7 @@ class ContestAPI(APIView):
             except ValueError:
                 return self.error(f"{ip_range} is not a valid cidr network")
         if not contest.real_time_rank and data.get("real_time_rank"):
-            cache_key = f"{CacheKey.contest_rank_cache}:{contest.id}"
-            cache.delete(cache_key)
+            Scoreboard(contest).invalidate()
 
         for k, v in data.items():
             setattr(contest, k, v)
@@ -192,35 +186,39 @@ class ACMContestHelper(APIView):
             return self.error("Problem id does not exist")
         problem_rank_status["checked"] = data["checked"]
         rank.save(update_fields=("submission_info",))
+        Scoreboard(rank.contest).update(rank.user_id)
+        notify_rank_update(rank.contest_id, rank.user_id)
         return self.success()
 
 
 class DownloadContestSubmissions(APIView):
+    @staticmethod
+    def last_accepted_submissions(contest):
+        """
+        每个用户每道题最后一次 AC 的 (user_id, problem_id, code)
+        DISTINCT ON 在数据库中去重, iterator 使用服务端游标分批读取, 只扫描一遍数据
+        """
+        return Submission.objects.filter(contest=contest, result=JudgeStatus.ACCEPTED) \
+            .order_by("user_id", "problem_id", "-create_time") \
+            .distinct("user_id", "problem_id") \
+            .values_list("user_id", "problem_id", "code") \
+            .iterator(chunk_size=500)
+
     def _dump_submissions(self, contest, exclude_admin=True):
-        problem_ids = contest.problem_set.all().values_list("id", "_id")
-        id2display_id = {k[0]: k[1] for k in problem_ids}
-        ac_map = {k[0]: False for k in problem_ids}
-        submissions = Submission.objects.filter(contest=contest, result=JudgeStatus.ACCEPTED).order_by("-create_time")
-        user_ids = submissions.values_list("user_id", flat=True)
-        users = User.objects.filter(id__in=user_ids)
-        path = f"/tmp/{rand_str()}.zip"
-        with zipfile.ZipFile(path, "w") as zip_file:
-            for user in users:
-                if user.is_admin_role() and exclude_admin:
-                    continue
-                user_ac_map = copy.deepcopy(ac_map)
-                user_submissions = submissions.filter(user_id=user.id)
-                for submission in user_submissions:
-                    problem_id = submission.problem_id
-                    if user_ac_map[problem_id]:
-                        continue
-                    file_name = f"{user.username}_{id2display_id[submission.problem_id]}.txt"
-                    compression = zipfile.ZIP_DEFLATED
-                    zip_file.writestr(zinfo_or_arcname=f"{file_name}",
-                                      data=submission.code,
-                                      compress_type=compression)
-                    user_ac_map[problem_id] = True
-        return path
+        """
+        边查询边生成 zip
+        """
+        id2display_id = dict(contest.problem_set.all().values_list("id", "_id"))
+        users = User.objects.filter(id__in=Submission.objects.filter(contest=contest).values("user_id"))
+        if exclude_admin:
+            users = users.exclude(admin_type__in=[AdminType.ADMIN, AdminType.SUPER_ADMIN])
+        id2username = dict(users.values_list("id", "username"))
+        stream = ZipStream()
+        for user_id, problem_id, code in self.last_accepted_submissions(contest):
+            username = id2username.get(user_id)
+            if username is not None:
+                yield from stream.write_bytes(f"{username}_{id2display_id[problem_id]}.txt", code)
+        yield from stream.finish()
 
     def get(self, request):
         contest_id = request.GET.get("contest_id")
@@ -233,9 +231,6 @@ class DownloadContestSubmissions(APIView):
             return self.error("Contest does not exist")
 
         exclude_admin = request.GET.get("exclude_admin") == "1"
-        zip_path = self._dump_submissions(contest, exclude_admin)
-        delete_files.send_with_options(args=(zip_path,), delay=300_000)
-        resp = FileResponse(open(zip_path, "rb"))
-        resp["Content-Type"] = "application/zip"
-        resp["Content-Disposition"] = f"attachment;filename={os.path.basename(zip_path)}"
+        resp = StreamingHttpResponse(self._dump_submissions(contest, exclude_admin), content_type="application/zip")
+        resp["Content-Disposition"] = f"attachment;filename=contest_{contest.id}_submissions.zip"
         return resp
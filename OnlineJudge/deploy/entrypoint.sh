@@ -4,7 +4,7 @@ set -e
 APP=/app
 DATA=/data
 
-mkdir -p $DATA/log $DATA/config $DATA/test_case $DATA/public/upload $DATA/public/avatar $DATA/public/website
+mkdir -p $DATA/log $DATA/config $DATA/test_case $DATA/test_case_archive $DATA/public/upload $DATA/public/avatar $DATA/public/website
 
 if [ ! -f "$DATA/config/secret.key" ]; then
     cat /dev/urandom | head -1 | md5sum | head -c 32 > "$DATA/config/secret.key"
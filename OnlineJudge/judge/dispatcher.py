@@ -1,34 +1,46 @@
 import hashlib
 import json
 import logging
+import threading
+import time
+import uuid
 from urllib.parse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
 from django.db import transaction, IntegrityError
 from django.db.models import F
 
 from account.models import User
 from conf.models import JudgeServer
 from contest.models import ContestRuleType, ACMContestRank, OIContestRank, ContestStatus
+from contest.scoreboard import Scoreboard, notify_rank_update
 from options.options import SysOptions
 from problem.models import Problem, ProblemRuleType
-from problem.utils import parse_problem_template
 from submission.models import JudgeStatus, Submission
 from utils.cache import cache
 from utils.constants import CacheKey
+from judge import statistic_buffer
+from judge.language_registry import language_registry
+from judge.scheduler import judge_queue
 
 logger = logging.getLogger(__name__)
 
 
-# 继续处理在队列中的问题
+# 继续处理在队列中的问题, 有多少空闲槽位就分发多少任务
 def process_pending_task():
-    if cache.llen(CacheKey.waiting_queue):
-        # 防止循环引入
-        from judge.tasks import judge_task
-        tmp_data = cache.rpop(CacheKey.waiting_queue)
-        if tmp_data:
-            data = json.loads(tmp_data.decode("utf-8"))
-            judge_task.send(**data)
+    if not len(judge_queue):
+        return
+    servers = [s for s in JudgeServer.objects.filter(is_disabled=False) if s.status == "normal"]
+    loads = get_judge_server_loads(s.id for s in servers)
+    free_slots = sum(max(_judge_server_capacity(s) - loads[s.id], 0) for s in servers)
+    if not free_slots:
+        return
+    # 防止循环引入
+    from judge.tasks import judge_task
+    for data in judge_queue.pop(free_slots):
+        judge_task.send(**data)
 
 
 class ChooseJudgeServer:
@@ -52,25 +64,197 @@ class ChooseJudgeServer:
             JudgeServer.objects.filter(id=self.server.id).update(task_number=F("task_number") - 1)
 
 
+# 每个判题槽位是 redis zset 中的一个成员, score 为租约过期时间, worker 崩溃后租约到期自动归还
+# 租约必须比一次请求最长的时间(连接 + 读取超时)更长, 否则还在判题的槽位会被当作空闲
+JUDGE_SERVER_LEASE_TTL = int(settings.JUDGE_SERVER_CONNECT_TIMEOUT + settings.JUDGE_SERVER_READ_TIMEOUT) + 300
+
+# KEYS: 每个候选 server 的租约 zset
+# ARGV: now, 租约过期时间, 租约 token, key ttl, 之后依次为每个 server 的容量
+# key ttl 只会延长不会缩短, 微服务用较短的 ttl 租用时不会让这里的租约提前消失
+# 返回选中的 server 在 KEYS 中的下标(从 1 开始), 没有空闲槽位时返回 0
+ACQUIRE_JUDGE_SERVER_LUA = """
+local best, best_load = 0, -1
+for i, key in ipairs(KEYS) do
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", ARGV[1])
+    local load = redis.call("ZCARD", key)
+    if load < tonumber(ARGV[i + 4]) and (best_load == -1 or load < best_load) then
+        best, best_load = i, load
+    end
+end
+if best > 0 then
+    redis.call("ZADD", KEYS[best], ARGV[2], ARGV[3])
+    if redis.call("TTL", KEYS[best]) < tonumber(ARGV[4]) then
+        redis.call("EXPIRE", KEYS[best], ARGV[4])
+    end
+end
+return best
+"""
+
+_acquire_judge_server_script = None
+
+
+def _judge_server_lease_key(server_id):
+    return f"{CacheKey.judge_server_lease}:{server_id}"
+
+
+def _judge_server_capacity(server):
+    # 和 ChooseJudgeServer 中 task_number <= cpu_core * 2 的判断保持一致
+    return server.cpu_core * 2 + 1
+
+
+def get_judge_server_loads(server_ids):
+    """
+    返回 {server_id: 未过期的租约数量}, 用于展示 redis 选择器下各 server 的实时任务数
+    """
+    server_ids = list(server_ids)
+    now = time.time()
+    pipe = cache.pipeline()
+    for server_id in server_ids:
+        pipe.zcount(_judge_server_lease_key(server_id), now, "+inf")
+    return dict(zip(server_ids, pipe.execute()))
+
+
+class RedisChooseJudgeServer:
+    """
+    ChooseJudgeServer 的替代实现, 槽位计数保存在 redis 中, 选择和占用在一个 lua 脚本里原子完成,
+    不再对 judge_server 表加锁. 会选择当前租约数最少且未满的 server
+    """
+    def __init__(self, exclude=()):
+        self.server = None
+        self.exclude = list(exclude)
+        self.token = uuid.uuid4().hex
+
+    @staticmethod
+    def _get_script():
+        global _acquire_judge_server_script
+        if _acquire_judge_server_script is None:
+            _acquire_judge_server_script = cache.register_script(ACQUIRE_JUDGE_SERVER_LUA)
+        return _acquire_judge_server_script
+
+    def __enter__(self) -> [JudgeServer, None]:
+        servers = JudgeServer.objects.filter(is_disabled=False).exclude(id__in=self.exclude).order_by("id")
+        servers = [s for s in servers if s.status == "normal"]
+        if not servers:
+            return None
+        now = time.time()
+        index = self._get_script()(keys=[_judge_server_lease_key(s.id) for s in servers],
+                                   args=[now, now + JUDGE_SERVER_LEASE_TTL, self.token, JUDGE_SERVER_LEASE_TTL] +
+                                        [_judge_server_capacity(s) for s in servers])
+        if index:
+            self.server = servers[index - 1]
+        return self.server
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.server:
+            cache.zrem(_judge_server_lease_key(self.server.id), self.token)
+
+
+class JudgeServerConnectionError(Exception):
+    pass
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _get_session(service_url):
+    """
+    每个 judge server 一个 keep-alive 连接池, 进程内的线程共享
+    """
+    with _sessions_lock:
+        session = _sessions.get(service_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.JUDGE_SERVER_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[service_url] = session
+        return session
+
+
+def _record_request_stats(server, new_connections, latency, failed):
+    key = f"{CacheKey.judge_server_stats}:{server.id}"
+    pipe = cache.pipeline()
+    pipe.hincrby(key, "requests", 1)
+    pipe.hincrby(key, "new_connections", new_connections)
+    pipe.hincrbyfloat(key, "latency", latency)
+    if failed:
+        pipe.hincrby(key, "failures", 1)
+    pipe.execute()
+
+
+def get_judge_server_stats(server_ids):
+    """
+    返回 {server_id: {requests, reused_connections, failures, avg_latency_ms}}
+    """
+    server_ids = list(server_ids)
+    pipe = cache.pipeline()
+    for server_id in server_ids:
+        pipe.hgetall(f"{CacheKey.judge_server_stats}:{server_id}")
+    ret = {}
+    for server_id, stats in zip(server_ids, pipe.execute()):
+        stats = {k.decode("utf-8"): float(v) for k, v in stats.items()}
+        total = int(stats.get("requests", 0))
+        ret[server_id] = {"requests": total,
+                          "reused_connections": max(total - int(stats.get("new_connections", 0)), 0),
+                          "failures": int(stats.get("failures", 0)),
+                          "avg_latency_ms": stats.get("latency", 0) * 1000 / total if total else 0}
+    return ret
+
+
 class DispatcherBase(object):
     def __init__(self):
         self.token = hashlib.sha256(SysOptions.judge_server_token.encode("utf-8")).hexdigest()
 
-    def _request(self, url, data=None):
-        kwargs = {"headers": {"X-Judge-Server-Token": self.token}}
+    def _request(self, server, path, data=None):
+        """
+        连接失败时抛出 JudgeServerConnectionError, 其他错误返回 None
+        """
+        url = urljoin(server.service_url, path)
+        kwargs = {"headers": {"X-Judge-Server-Token": self.token},
+                  "timeout": (settings.JUDGE_SERVER_CONNECT_TIMEOUT, settings.JUDGE_SERVER_READ_TIMEOUT)}
         if data:
             kwargs["json"] = data
+        session = _get_session(server.service_url)
+        pool = session.get_adapter(url).poolmanager.connection_from_url(url)
+        connections = pool.num_connections
+        start = time.perf_counter()
+        failed = True
         try:
-            return requests.post(url, **kwargs).json()
+            resp = session.post(url, **kwargs).json()
+            failed = False
+            return resp
+        except requests.exceptions.ConnectionError as e:
+            raise JudgeServerConnectionError(str(e))
         except Exception as e:
             logger.exception(e)
+        finally:
+            _record_request_stats(server, pool.num_connections - connections, time.perf_counter() - start, failed)
+
+    def _dispatch(self, path, data=None, on_server_chosen=None):
+        """
+        选择一个 judge server 并发送请求, 连接失败时换其他 server 重试
+        :return: (server, resp), 没有可用的 judge server 或者所有尝试都连接失败时 server 为 None
+        """
+        tried = []
+        for _ in range(settings.JUDGE_SERVER_MAX_RETRIES + 1):
+            with RedisChooseJudgeServer(exclude=[s.id for s in tried]) as server:
+                if not server:
+                    break
+                if on_server_chosen:
+                    on_server_chosen(server)
+                try:
+                    return server, self._request(server, path, data=data)
+                except JudgeServerConnectionError as e:
+                    logger.warning(f"Failed to connect to judge server {server.hostname}: {e}")
+                    tried.append(server)
+        return None, None
 
 
 class SPJCompiler(DispatcherBase):
     def __init__(self, spj_code, spj_version, spj_language):
         super().__init__()
-        spj_compile_config = list(filter(lambda config: spj_language == config["name"], SysOptions.spj_languages))[0]["spj"][
-            "compile"]
+        spj_compile_config = language_registry.get_spj_config(spj_language)["compile"]
         self.data = {
             "src": spj_code,
             "spj_version": spj_version,
@@ -78,14 +262,13 @@ class SPJCompiler(DispatcherBase):
         }
 
     def compile_spj(self):
-        with ChooseJudgeServer() as server:
-            if not server:
-                return "No available judge_server"
-            result = self._request(urljoin(server.service_url, "compile_spj"), data=self.data)
-            if not result:
-                return "Failed to call judge server"
-            if result["err"]:
-                return result["data"]
+        server, result = self._dispatch("compile_spj", data=self.data)
+        if not server:
+            return "No available judge_server"
+        if not result:
+            return "Failed to call judge server"
+        if result["err"]:
+            return result["data"]
 
 
 class JudgeDispatcher(DispatcherBase):
@@ -124,22 +307,22 @@ class JudgeDispatcher(DispatcherBase):
 
     def judge(self):
         language = self.submission.language
-        sub_config = list(filter(lambda item: language == item["name"], SysOptions.languages))[0]
+        language_config = language_registry.get_config(language)
         spj_config = {}
         if self.problem.spj_code:
-            for lang in SysOptions.spj_languages:
-                if lang["name"] == self.problem.spj_language:
-                    spj_config = lang["spj"]
-                    break
+            try:
+                spj_config = language_registry.get_spj_config(self.problem.spj_language)
+            except KeyError:
+                pass
 
-        if language in self.problem.template:
-            template = parse_problem_template(self.problem.template[language])
+        template = language_registry.get_template(self.problem, language)
+        if template:
             code = f"{template['prepend']}\n{self.submission.code}\n{template['append']}"
         else:
             code = self.submission.code
 
         data = {
-            "language_config": sub_config["config"],
+            "language_config": language_config,
             "src": code,
             "max_cpu_time": self.problem.time_limit,
             "max_memory": 1024 * 1024 * self.problem.memory_limit,
@@ -152,16 +335,25 @@ class JudgeDispatcher(DispatcherBase):
             "io_mode": self.problem.io_mode
         }
 
-        with ChooseJudgeServer() as server:
-            if not server:
-                data = {"submission_id": self.submission.id, "problem_id": self.problem.id}
-                cache.lpush(CacheKey.waiting_queue, json.dumps(data))
-                return
+        judging = []
+
+        def set_judging(server):
             Submission.objects.filter(id=self.submission.id).update(result=JudgeStatus.JUDGING)
-            resp = self._request(urljoin(server.service_url, "/judge"), data=data)
+            self.publish_status(JudgeStatus.JUDGING)
+            judging.append(server)
+
+        server, resp = self._dispatch("/judge", data=data, on_server_chosen=set_judging)
+        if not server:
+            if judging:
+                # 所有 judge server 都连接失败, 和没有空闲 server 一样放回队列, 不判为 SYSTEM_ERROR
+                Submission.objects.filter(id=self.submission.id).update(result=JudgeStatus.PENDING)
+                self.publish_status(JudgeStatus.PENDING)
+            judge_queue.push(self.submission.id, self.problem.id, self.submission.user_id, self.contest_id)
+            return
 
         if not resp:
             Submission.objects.filter(id=self.submission.id).update(result=JudgeStatus.SYSTEM_ERROR)
+            self.publish_status(JudgeStatus.SYSTEM_ERROR)
             return
 
         if resp["err"]:
@@ -182,6 +374,7 @@ class JudgeDispatcher(DispatcherBase):
             else:
                 self.submission.result = JudgeStatus.PARTIALLY_ACCEPTED
         self.submission.save()
+        self.publish_status(self.submission.result, self.submission.statistic_info)
 
         if self.contest_id:
             if User.objects.get(id=self.submission.user_id).is_contest_admin(self.contest):
@@ -203,93 +396,38 @@ class JudgeDispatcher(DispatcherBase):
         # 至此判题结束，尝试处理任务队列中剩余的任务
         process_pending_task()
 
-    def update_problem_status_rejudge(self):
-        result = str(self.submission.result)
-        problem_id = str(self.problem.id)
-        with transaction.atomic():
-            # update problem status
-            problem = Problem.objects.select_for_update().get(contest_id=self.contest_id, id=self.problem.id)
-            if self.last_result != JudgeStatus.ACCEPTED and self.submission.result == JudgeStatus.ACCEPTED:
-                problem.accepted_number += 1
-            problem_info = problem.statistic_info
-            problem_info[self.last_result] = problem_info.get(self.last_result, 1) - 1
-            problem_info[result] = problem_info.get(result, 0) + 1
-            problem.save(update_fields=["accepted_number", "statistic_info"])
-
-            profile = User.objects.select_for_update().get(id=self.submission.user_id).userprofile
-            if problem.rule_type == ProblemRuleType.ACM:
-                acm_problems_status = profile.acm_problems_status.get("problems", {})
-                if acm_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
-                    acm_problems_status[problem_id]["status"] = self.submission.result
-                    if self.submission.result == JudgeStatus.ACCEPTED:
-                        profile.accepted_number += 1
-                profile.acm_problems_status["problems"] = acm_problems_status
-                profile.save(update_fields=["accepted_number", "acm_problems_status"])
-
-            else:
-                oi_problems_status = profile.oi_problems_status.get("problems", {})
-                score = self.submission.statistic_info["score"]
-                if oi_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
-                    # minus last time score, add this tim score
-                    profile.add_score(this_time_score=score,
-                                      last_time_score=oi_problems_status[problem_id]["score"])
-                    oi_problems_status[problem_id]["score"] = score
-                    oi_problems_status[problem_id]["status"] = self.submission.result
-                    if self.submission.result == JudgeStatus.ACCEPTED:
-                        profile.accepted_number += 1
-                profile.oi_problems_status["problems"] = oi_problems_status
-                profile.save(update_fields=["accepted_number", "oi_problems_status"])
+    def publish_status(self, result, statistic_info=None):
+        """
+        微服务通过这个 channel 把判题状态推送给等待结果的客户端
+        """
+        try:
+            cache.publish(CacheKey.submission_status, json.dumps({"submission_id": self.submission.id,
+                                                                  "result": result,
+                                                                  "statistic_info": statistic_info or {}}))
+        except Exception as e:
+            logger.exception(e)
 
-    def update_problem_status(self):
-        result = str(self.submission.result)
-        problem_id = str(self.problem.id)
-        with transaction.atomic():
-            # update problem status
-            problem = Problem.objects.select_for_update().get(contest_id=self.contest_id, id=self.problem.id)
-            problem.submission_number += 1
-            if self.submission.result == JudgeStatus.ACCEPTED:
-                problem.accepted_number += 1
-            problem_info = problem.statistic_info
-            problem_info[result] = problem_info.get(result, 0) + 1
-            problem.save(update_fields=["accepted_number", "submission_number", "statistic_info"])
+    def _update_problem_statistic(self, rejudge):
+        event = {"problem_id": self.problem.id,
+                 "problem_display_id": self.problem._id,
+                 "rule_type": self.problem.rule_type,
+                 "user_id": self.submission.user_id,
+                 "result": self.submission.result,
+                 "score": self.submission.statistic_info.get("score"),
+                 "rejudge": rejudge,
+                 "last_result": self.last_result}
+        if settings.STATISTIC_WRITE_BEHIND:
+            statistic_buffer.push(event)
+        else:
+            # 失败的部分放进 buffer, 由 flush_statistic_task 重试
+            for failed in statistic_buffer.apply_events([event]):
+                statistic_buffer.push(failed)
 
-            # update_userprofile
-            user = User.objects.select_for_update().get(id=self.submission.user_id)
-            user_profile = user.userprofile
-            user_profile.submission_number += 1
-            if problem.rule_type == ProblemRuleType.ACM:
-                acm_problems_status = user_profile.acm_problems_status.get("problems", {})
-                if problem_id not in acm_problems_status:
-                    acm_problems_status[problem_id] = {"status": self.submission.result, "_id": self.problem._id}
-                    if self.submission.result == JudgeStatus.ACCEPTED:
-                        user_profile.accepted_number += 1
-                elif acm_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
-                    acm_problems_status[problem_id]["status"] = self.submission.result
-                    if self.submission.result == JudgeStatus.ACCEPTED:
-                        user_profile.accepted_number += 1
-                user_profile.acm_problems_status["problems"] = acm_problems_status
-                user_profile.save(update_fields=["submission_number", "accepted_number", "acm_problems_status"])
+    def update_problem_status_rejudge(self):
+        self._update_problem_statistic(rejudge=True)
 
-            else:
-                oi_problems_status = user_profile.oi_problems_status.get("problems", {})
-                score = self.submission.statistic_info["score"]
-                if problem_id not in oi_problems_status:
-                    user_profile.add_score(score)
-                    oi_problems_status[problem_id] = {"status": self.submission.result,
-                                                      "_id": self.problem._id,
-                                                      "score": score}
-                    if self.submission.result == JudgeStatus.ACCEPTED:
-                        user_profile.accepted_number += 1
-                elif oi_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
-                    # minus last time score, add this time score
-                    user_profile.add_score(this_time_score=score,
-                                           last_time_score=oi_problems_status[problem_id]["score"])
-                    oi_problems_status[problem_id]["score"] = score
-                    oi_problems_status[problem_id]["status"] = self.submission.result
-                    if self.submission.result == JudgeStatus.ACCEPTED:
-                        user_profile.accepted_number += 1
-                user_profile.oi_problems_status["problems"] = oi_problems_status
-                user_profile.save(update_fields=["submission_number", "accepted_number", "oi_problems_status"])
+    def update_problem_status(self):
+        self._update_problem_statistic(rejudge=False)
 
     def update_contest_problem_status(self):
         with transaction.atomic():
@@ -331,8 +469,11 @@ class JudgeDispatcher(DispatcherBase):
             problem.save(update_fields=["submission_number", "accepted_number", "statistic_info"])
 
     def update_contest_rank(self):
+        user_id = self.submission.user_id
         if self.contest.rule_type == ContestRuleType.OI or self.contest.real_time_rank:
-            cache.delete(f"{CacheKey.contest_rank_cache}:{self.contest.id}")
+            scoreboard = Scoreboard(self.contest)
+            transaction.on_commit(lambda: scoreboard.update(user_id))
+        transaction.on_commit(lambda: notify_rank_update(self.contest.id, user_id))
 
         def get_rank(model):
             return model.objects.select_for_update().get(user_id=self.submission.user_id, contest=self.contest)
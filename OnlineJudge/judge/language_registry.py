@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+from options.models import SysOptions as SysOptionsModel
+from options.options import OptionKeys, SysOptions
+from problem.utils import parse_problem_template
+from utils.cache import cache
+from utils.constants import CacheKey
+
+# 最多每隔多少秒检查一次 redis 中的版本号
+VERSION_CHECK_INTERVAL = 1
+TEMPLATE_CACHE_SIZE = 1000
+
+
+class LanguageRegistry(object):
+    """
+    进程内共享的语言配置, 判题时不再每次遍历 SysOptions.languages
+    修改 SysOptions.languages 时会增加 redis 中的版本号, 各进程发现版本变化后重新加载
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0
+        self._languages = {}
+        self._spj_languages = {}
+        self._templates = OrderedDict()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        version = cache.get_client(write=False).get(CacheKey.language_version) or b"0"
+        self._checked_at = now
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            # 直接读数据库, 避免读到 SysOptions 各级缓存中还没过期的旧值
+            try:
+                languages = SysOptionsModel.objects.get(key=OptionKeys.languages).value
+            except SysOptionsModel.DoesNotExist:
+                languages = SysOptions.languages
+            self._languages = {item["name"]: item["config"] for item in languages}
+            self._spj_languages = {item["name"]: item["spj"] for item in languages if "spj" in item}
+            self._version = version
+
+    def get_config(self, language):
+        """
+        :return: 判题请求中的 language_config, 语言不存在时抛出 KeyError
+        """
+        self._ensure_fresh()
+        return self._languages[language]
+
+    def get_spj_config(self, language):
+        """
+        :return: {"config": ..., "compile": ...}, 语言不存在或不支持 spj 时抛出 KeyError
+        """
+        self._ensure_fresh()
+        return self._spj_languages[language]
+
+    def get_template(self, problem, language):
+        """
+        解析后的题目模板, 按 (problem id, last_update_time, language) 缓存, 没有模板时返回 None
+        """
+        template_str = problem.template.get(language)
+        if template_str is None:
+            return None
+        key = (problem.id, problem.last_update_time, language)
+        with self._lock:
+            cached = self._templates.get(key)
+            # last_update_time 可能没有被更新, 所以同时比较模板内容
+            if cached is not None and cached[0] == template_str:
+                self._templates.move_to_end(key)
+                return cached[1]
+        template = parse_problem_template(template_str)
+        with self._lock:
+            self._templates[key] = (template_str, template)
+            self._templates.move_to_end(key)
+            while len(self._templates) > TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        return template
+
+
+language_registry = LanguageRegistry()
@@ -0,0 +1,141 @@
+import json
+import time
+
+from utils.cache import cache
+from utils.constants import CacheKey
+
+
+class JudgeQueueTier:
+    # 比赛提交优先于练习提交
+    CONTEST = "contest"
+    PRACTICE = "practice"
+
+
+# 每个 tier 有一个 ring(list), 保存当前有排队任务的 bucket 名字, 每个 bucket(list) 保存一个用户的排队任务
+# 出队时按 tier 优先级取 ring 头部的 bucket, 取出一个任务后如果 bucket 还有任务就放回 ring 尾部, 实现 round-robin
+# pending(zset) 记录 submission_id -> 入队时间, 用于统计队列长度和等待时间
+
+# KEYS: bucket, ring, pending, stats
+# ARGV: item, bucket name, submission_id, now, tier
+PUSH_LUA = """
+if redis.call("ZSCORE", KEYS[3], ARGV[3]) then
+    return 0
+end
+redis.call("RPUSH", KEYS[1], ARGV[1])
+if redis.call("LLEN", KEYS[1]) == 1 then
+    redis.call("RPUSH", KEYS[2], ARGV[2])
+end
+redis.call("ZADD", KEYS[3], ARGV[4], ARGV[3])
+redis.call("HINCRBY", KEYS[4], "depth:" .. ARGV[5], 1)
+return 1
+"""
+
+# KEYS: pending, stats
+# ARGV: key prefix, now, count, tiers...
+POP_LUA = """
+local items = {}
+local count = tonumber(ARGV[3])
+while #items < count do
+    local item = nil
+    for i = 4, #ARGV do
+        local ring = ARGV[1] .. ":ring:" .. ARGV[i]
+        local bucket = redis.call("LPOP", ring)
+        while bucket do
+            local key = ARGV[1] .. ":bucket:" .. bucket
+            item = redis.call("LPOP", key)
+            if redis.call("LLEN", key) > 0 then
+                redis.call("RPUSH", ring, bucket)
+            end
+            if item then
+                break
+            end
+            bucket = redis.call("LPOP", ring)
+        end
+        if item then
+            local submission_id = cjson.decode(item)["submission_id"]
+            local enqueue_time = redis.call("ZSCORE", KEYS[1], submission_id)
+            if enqueue_time then
+                redis.call("ZREM", KEYS[1], submission_id)
+                redis.call("HINCRBYFLOAT", KEYS[2], "total_wait", tonumber(ARGV[2]) - tonumber(enqueue_time))
+            end
+            redis.call("HINCRBY", KEYS[2], "depth:" .. ARGV[i], -1)
+            redis.call("HINCRBY", KEYS[2], "dispatched", 1)
+            break
+        end
+    end
+    if not item then
+        break
+    end
+    table.insert(items, item)
+end
+return items
+"""
+
+
+class JudgeQueue:
+    """
+    没有空闲 judge server 时提交在这里排队
+    - 比赛提交整体优先于练习提交
+    - 同一 tier 内按 bucket(比赛+用户 / 用户) 轮流出队, 单个用户的大量提交不会饿死其他用户
+    """
+    tiers = (JudgeQueueTier.CONTEST, JudgeQueueTier.PRACTICE)
+
+    def __init__(self, prefix=CacheKey.judge_queue):
+        self.prefix = prefix
+        self.pending_key = f"{prefix}:pending"
+        self.stats_key = f"{prefix}:stats"
+        self._push_script = None
+        self._pop_script = None
+
+    def _scripts(self):
+        if self._push_script is None:
+            self._push_script = cache.register_script(PUSH_LUA)
+            self._pop_script = cache.register_script(POP_LUA)
+        return self._push_script, self._pop_script
+
+    def push(self, submission_id, problem_id, user_id, contest_id=None):
+        if contest_id:
+            tier, bucket = JudgeQueueTier.CONTEST, f"contest:{contest_id}:user:{user_id}"
+        else:
+            tier, bucket = JudgeQueueTier.PRACTICE, f"user:{user_id}"
+        item = json.dumps({"submission_id": submission_id, "problem_id": problem_id})
+        push, _ = self._scripts()
+        return bool(push(keys=[f"{self.prefix}:bucket:{bucket}", f"{self.prefix}:ring:{tier}",
+                               self.pending_key, self.stats_key],
+                         args=[item, bucket, submission_id, time.time(), tier]))
+
+    def pop(self, count=1):
+        """
+        按优先级和 round-robin 顺序取出最多 count 个任务
+        """
+        if count <= 0:
+            return []
+        _, pop = self._scripts()
+        items = pop(keys=[self.pending_key, self.stats_key],
+                    args=[self.prefix, time.time(), count, *self.tiers])
+        return [json.loads(item) for item in items]
+
+    def __len__(self):
+        return cache.zcard(self.pending_key)
+
+    def stats(self):
+        """
+        队列长度和等待时间(秒), 微服务的监控接口会直接读取这些 key
+        """
+        pipe = cache.pipeline()
+        pipe.zcard(self.pending_key)
+        pipe.zrange(self.pending_key, 0, 0, withscores=True)
+        pipe.hgetall(self.stats_key)
+        depth, oldest, stats = pipe.execute()
+        stats = {k.decode("utf-8"): float(v) for k, v in stats.items()}
+        dispatched = int(stats.get("dispatched", 0))
+        return {
+            "depth": depth,
+            "depth_by_tier": {tier: max(int(stats.get(f"depth:{tier}", 0)), 0) for tier in self.tiers},
+            "max_wait_time": max(time.time() - oldest[0][1], 0) if oldest else 0,
+            "avg_wait_time": stats.get("total_wait", 0) / dispatched if dispatched else 0,
+            "dispatched": dispatched
+        }
+
+
+judge_queue = JudgeQueue()
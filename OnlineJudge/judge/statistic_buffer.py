@@ -0,0 +1,247 @@
+import json
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from redis.exceptions import LockError
+
+from account.models import User
+from problem.models import Problem, ProblemRuleType
+from submission.models import JudgeStatus
+from utils.cache import cache
+from utils.constants import CacheKey
+
+logger = logging.getLogger(__name__)
+
+# 判题结束后的题目/用户统计先追加到 redis list, 由 flush_statistic_task 定时批量写入数据库
+# 同一批次内每个题目和每个用户只加一次锁, 热门题目不会在每次判题时都被 select_for_update
+# event: {problem_id, problem_display_id, rule_type, user_id, result, score, rejudge, last_result}
+
+# 失败的 event 放回 buffer 重试, 超过这个次数后丢弃 (例如题目或用户已被删除)
+STATISTIC_EVENT_MAX_ATTEMPTS = 5
+# 正在写入数据库的 event 先移到 processing list, 写入后才删除. worker 中途退出时下一次 flush 把它们放回 buffer
+STATISTIC_PROCESSING_KEY = f"{CacheKey.statistic_buffer}:processing"
+# 同一时间只有一个 flush 使用 processing list, 每处理一批延长一次
+STATISTIC_FLUSH_LOCK_TIMEOUT = 300
+
+# KEYS: buffer, processing list
+# ARGV: 批次大小
+# 把 buffer 头部的一批 event 原子地移到 processing list 尾部并返回, 和逐个 RPOPLPUSH 一样不会丢失, 但保持先后顺序
+MOVE_STATISTIC_BATCH_LUA = """
+local events = redis.call("LRANGE", KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #events > 0 then
+    redis.call("LTRIM", KEYS[1], #events, -1)
+    redis.call("RPUSH", KEYS[2], unpack(events))
+end
+return events
+"""
+
+# KEYS: processing list, buffer
+# 把 processing list 中的 event 按原来的顺序放回 buffer 头部, 返回放回的个数
+REQUEUE_STATISTIC_EVENTS_LUA = """
+local events = redis.call("LRANGE", KEYS[1], 0, -1)
+for i = #events, 1, -1 do
+    redis.call("LPUSH", KEYS[2], events[i])
+end
+redis.call("DEL", KEYS[1])
+return #events
+"""
+
+_scripts = {}
+
+
+class StatisticFlushError(Exception):
+    pass
+
+
+def _get_script(lua):
+    if lua not in _scripts:
+        _scripts[lua] = cache.register_script(lua)
+    return _scripts[lua]
+
+
+def push(event):
+    cache.rpush(CacheKey.statistic_buffer, json.dumps(event))
+    # 只有拿到 flag 的进程负责调度下一次 flush
+    if cache.set(f"{CacheKey.statistic_buffer}:scheduled", 1, timeout=settings.STATISTIC_FLUSH_INTERVAL * 10, nx=True):
+        from judge.tasks import flush_statistic_task
+        flush_statistic_task.send_with_options(delay=settings.STATISTIC_FLUSH_INTERVAL * 1000)
+
+
+def flush(batch_size=1000):
+    # 先清除 flag, flush 期间新加入的 event 会调度下一次 flush
+    cache.delete(f"{CacheKey.statistic_buffer}:scheduled")
+    lock = cache.lock(f"{CacheKey.statistic_buffer}:flush", timeout=STATISTIC_FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        # 另一个 flush 正在进行, 它会一直处理到 buffer 为空
+        return
+    try:
+        _flush(lock, batch_size)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+
+def _flush(lock, batch_size):
+    requeue = _get_script(REQUEUE_STATISTIC_EVENTS_LUA)
+    # 上一次 flush 中途退出时留下的 event
+    left = requeue(keys=[STATISTIC_PROCESSING_KEY, CacheKey.statistic_buffer])
+    if left:
+        logger.warning(f"Requeued {left} statistic events left by an interrupted flush")
+    move = _get_script(MOVE_STATISTIC_BATCH_LUA)
+    retry_count = 0
+    while True:
+        events = move(keys=[CacheKey.statistic_buffer, STATISTIC_PROCESSING_KEY], args=[batch_size])
+        if not events:
+            break
+        retry = []
+        for event in apply_events([json.loads(event) for event in events]):
+            event["attempts"] = event.get("attempts", 0) + 1
+            if event["attempts"] < STATISTIC_EVENT_MAX_ATTEMPTS:
+                retry.append(event)
+            else:
+                logger.error(f"Drop statistic event after {event['attempts']} attempts: {event}")
+        # 从 processing list 删除这一批, 只留下需要重试的 event, 全部处理完后再放回 buffer
+        pipe = cache.pipeline()
+        pipe.ltrim(STATISTIC_PROCESSING_KEY, 0, -len(events) - 1)
+        if retry:
+            pipe.rpush(STATISTIC_PROCESSING_KEY, *[json.dumps(event) for event in retry])
+        pipe.execute()
+        retry_count += len(retry)
+        lock.reacquire()
+    if retry_count:
+        # 放回 list 头部, 保持和之后加入的 event 的先后顺序, 抛出异常让 flush_statistic_task 重试
+        requeue(keys=[STATISTIC_PROCESSING_KEY, CacheKey.statistic_buffer])
+        raise StatisticFlushError(f"{retry_count} statistic events failed and were pushed back")
+
+
+def apply_events(events):
+    """
+    按题目和用户分组应用 event, 组内保持 event 的先后顺序
+    返回失败的 event, parts 中只保留失败的部分 (problem/user), 重试时不会重复应用已经成功的部分
+    """
+    problem_events = defaultdict(list)
+    user_events = defaultdict(list)
+    for event in events:
+        parts = event.get("parts", ("problem", "user"))
+        if "problem" in parts:
+            problem_events[event["problem_id"]].append(event)
+        if "user" in parts:
+            user_events[event["user_id"]].append(event)
+
+    failed_parts = defaultdict(list)
+    for problem_id, items in problem_events.items():
+        try:
+            _apply_problem_events(problem_id, items)
+        except Exception as e:
+            logger.exception(f"Failed to update statistic of problem {problem_id}: {e}")
+            for event in items:
+                failed_parts[id(event)].append("problem")
+    for user_id, items in user_events.items():
+        try:
+            _apply_profile_events(user_id, items)
+        except Exception as e:
+            logger.exception(f"Failed to update statistic of user {user_id}: {e}")
+            for event in items:
+                failed_parts[id(event)].append("user")
+    return [{**event, "parts": failed_parts[id(event)]} for event in events if id(event) in failed_parts]
+
+
+def _apply_problem_events(problem_id, events):
+    submission_number = 0
+    accepted_number = 0
+    for event in events:
+        if not event["rejudge"]:
+            submission_number += 1
+        # rejudge 时只有之前未通过, 这次通过才增加通过数
+        if event["result"] == JudgeStatus.ACCEPTED and (not event["rejudge"] or event["last_result"] != JudgeStatus.ACCEPTED):
+            accepted_number += 1
+
+    with transaction.atomic():
+        if submission_number or accepted_number:
+            Problem.objects.filter(id=problem_id).update(submission_number=F("submission_number") + submission_number,
+                                                         accepted_number=F("accepted_number") + accepted_number)
+        problem = Problem.objects.select_for_update().only("id", "statistic_info").get(id=problem_id)
+        problem_info = problem.statistic_info
+        for event in events:
+            if event["rejudge"]:
+                last_result = str(event["last_result"])
+                problem_info[last_result] = problem_info.get(last_result, 1) - 1
+            result = str(event["result"])
+            problem_info[result] = problem_info.get(result, 0) + 1
+        problem.save(update_fields=["statistic_info"])
+
+
+def _apply_profile_events(user_id, events):
+    with transaction.atomic():
+        profile = User.objects.select_for_update().get(id=user_id).userprofile
+        for event in events:
+            if event["rejudge"]:
+                _apply_profile_rejudge(profile, event)
+            else:
+                _apply_profile_submission(profile, event)
+        profile.save(update_fields=["submission_number", "accepted_number", "acm_problems_status", "oi_problems_status"])
+
+
+def _apply_profile_submission(profile, event):
+    problem_id = str(event["problem_id"])
+    result = event["result"]
+    profile.submission_number += 1
+    if event["rule_type"] == ProblemRuleType.ACM:
+        acm_problems_status = profile.acm_problems_status.get("problems", {})
+        if problem_id not in acm_problems_status:
+            acm_problems_status[problem_id] = {"status": result, "_id": event["problem_display_id"]}
+            if result == JudgeStatus.ACCEPTED:
+                profile.accepted_number += 1
+        elif acm_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
+            acm_problems_status[problem_id]["status"] = result
+            if result == JudgeStatus.ACCEPTED:
+                profile.accepted_number += 1
+        profile.acm_problems_status["problems"] = acm_problems_status
+    else:
+        oi_problems_status = profile.oi_problems_status.get("problems", {})
+        score = event["score"]
+        if problem_id not in oi_problems_status:
+            profile.add_score(score)
+            oi_problems_status[problem_id] = {"status": result,
+                                              "_id": event["problem_display_id"],
+                                              "score": score}
+            if result == JudgeStatus.ACCEPTED:
+                profile.accepted_number += 1
+        elif oi_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
+            # minus last time score, add this time score
+            profile.add_score(this_time_score=score,
+                              last_time_score=oi_problems_status[problem_id]["score"])
+            oi_problems_status[problem_id]["score"] = score
+            oi_problems_status[problem_id]["status"] = result
+            if result == JudgeStatus.ACCEPTED:
+                profile.accepted_number += 1
+        profile.oi_problems_status["problems"] = oi_problems_status
+
+
+def _apply_profile_rejudge(profile, event):
+    problem_id = str(event["problem_id"])
+    result = event["result"]
+    if event["rule_type"] == ProblemRuleType.ACM:
+        acm_problems_status = profile.acm_problems_status.get("problems", {})
+        if acm_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
+            acm_problems_status[problem_id]["status"] = result
+            if result == JudgeStatus.ACCEPTED:
+                profile.accepted_number += 1
+        profile.acm_problems_status["problems"] = acm_problems_status
+    else:
+        oi_problems_status = profile.oi_problems_status.get("problems", {})
+        score = event["score"]
+        if oi_problems_status[problem_id]["status"] != JudgeStatus.ACCEPTED:
+            # minus last time score, add this time score
+            profile.add_score(this_time_score=score,
+                              last_time_score=oi_problems_status[problem_id]["score"])
+            oi_problems_status[problem_id]["score"] = score
+            oi_problems_status[problem_id]["status"] = result
+            if result == JudgeStatus.ACCEPTED:
+                profile.accepted_number += 1
+        profile.oi_problems_status["problems"] = oi_problems_status
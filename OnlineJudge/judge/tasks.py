@@ -2,6 +2,7 @@ import dramatiq
 
 from account.models import User
 from submission.models import Submission
+from judge import statistic_buffer
 from judge.dispatcher import JudgeDispatcher
 from utils.shortcuts import DRAMATIQ_WORKER_ARGS
 
@@ -12,3 +13,8 @@ def judge_task(submission_id, problem_id):
     if User.objects.get(id=uid).is_disabled:
         return
     JudgeDispatcher(submission_id, problem_id).judge()
+
+
+@dramatiq.actor(**DRAMATIQ_WORKER_ARGS(max_retries=3))
+def flush_statistic_task():
+    statistic_buffer.flush()
@@ -0,0 +1,188 @@
+import json
+from contextlib import ExitStack
+from copy import deepcopy
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+
+from conf.models import JudgeServer
+from problem.models import Problem
+from submission.models import JudgeStatus
+from submission.tests import DEFAULT_PROBLEM_DATA
+from utils.api.tests import APITestCase
+from utils.cache import cache
+from utils.constants import CacheKey
+from options.options import SysOptions
+from .dispatcher import (DispatcherBase, JudgeServerConnectionError, RedisChooseJudgeServer, get_judge_server_loads,
+                         _judge_server_lease_key)
+from .language_registry import LanguageRegistry
+from .scheduler import JudgeQueue
+from .statistic_buffer import STATISTIC_PROCESSING_KEY, StatisticFlushError, apply_events, flush
+
+
+class RedisChooseJudgeServerTest(TestCase):
+    def setUp(self):
+        self.servers = [JudgeServer.objects.create(hostname=f"testhostname{i}", judger_version="1.0.4", cpu_core=1,
+                                                   memory_usage=0, cpu_usage=0, last_heartbeat=timezone.now(),
+                                                   service_url="http://127.0.0.1") for i in range(2)]
+
+    def tearDown(self):
+        cache.get_client(write=True).delete(*[_judge_server_lease_key(server.id) for server in self.servers])
+
+    def test_choose_least_loaded_server(self):
+        with RedisChooseJudgeServer() as first, RedisChooseJudgeServer() as second:
+            self.assertNotEqual(first.id, second.id)
+            self.assertEqual(get_judge_server_loads([s.id for s in self.servers]),
+                             {s.id: 1 for s in self.servers})
+        self.assertEqual(get_judge_server_loads([s.id for s in self.servers]),
+                         {s.id: 0 for s in self.servers})
+
+    def test_dispatch_requeues_when_all_servers_unreachable(self):
+        with mock.patch.object(DispatcherBase, "_request", side_effect=JudgeServerConnectionError("refused")) as request:
+            self.assertEqual(DispatcherBase()._dispatch("/judge"), (None, None))
+        self.assertEqual(request.call_count, len(self.servers))
+        self.assertEqual(get_judge_server_loads([s.id for s in self.servers]),
+                         {s.id: 0 for s in self.servers})
+
+    def test_no_free_slot(self):
+        # cpu_core = 1, each server accepts 3 tasks
+        with ExitStack() as stack:
+            for _ in range(6):
+                self.assertIsNotNone(stack.enter_context(RedisChooseJudgeServer()))
+            self.assertIsNone(stack.enter_context(RedisChooseJudgeServer()))
+        with RedisChooseJudgeServer() as server:
+            self.assertIsNotNone(server)
+
+    def test_skip_disabled_server(self):
+        JudgeServer.objects.filter(id=self.servers[0].id).update(is_disabled=True)
+        with RedisChooseJudgeServer() as server:
+            self.assertEqual(server.id, self.servers[1].id)
+
+
+class JudgeQueueTest(TestCase):
+    def setUp(self):
+        self.queue = JudgeQueue(prefix="test_judge_queue")
+
+    def tearDown(self):
+        client = cache.get_client(write=True)
+        keys = client.keys("test_judge_queue:*")
+        if keys:
+            client.delete(*keys)
+
+    def test_round_robin_between_users(self):
+        for i in range(3):
+            self.queue.push(f"a{i}", 1, user_id=1)
+        self.queue.push("b0", 1, user_id=2)
+        self.assertEqual(len(self.queue), 4)
+        self.assertEqual([item["submission_id"] for item in self.queue.pop(3)], ["a0", "b0", "a1"])
+        self.assertEqual(len(self.queue), 1)
+
+    def test_contest_submission_first(self):
+        self.queue.push("practice", 1, user_id=1)
+        self.queue.push("contest", 2, user_id=2, contest_id=1)
+        self.assertEqual(self.queue.pop(1), [{"submission_id": "contest", "problem_id": 2}])
+        self.assertEqual(self.queue.stats()["depth_by_tier"], {"contest": 0, "practice": 1})
+
+    def test_duplicate_submission(self):
+        self.assertTrue(self.queue.push("a0", 1, user_id=1))
+        self.assertFalse(self.queue.push("a0", 1, user_id=1))
+        self.assertEqual(len(self.queue.pop(10)), 1)
+        self.assertEqual(self.queue.stats()["dispatched"], 1)
+
+
+class StatisticBufferTest(APITestCase):
+    def setUp(self):
+        self.user = self.create_admin("test", "test123", login=False)
+        problem_data = deepcopy(DEFAULT_PROBLEM_DATA)
+        problem_data.pop("tags")
+        self.problem = Problem.objects.create(created_by=self.user, **problem_data)
+
+    def _event(self, result, rejudge=False, last_result=None):
+        return {"problem_id": self.problem.id, "problem_display_id": self.problem._id, "rule_type": self.problem.rule_type,
+                "user_id": self.user.id, "result": result, "score": 0, "rejudge": rejudge, "last_result": last_result}
+
+    def test_apply_events_in_batch(self):
+        apply_events([self._event(JudgeStatus.WRONG_ANSWER),
+                      self._event(JudgeStatus.ACCEPTED),
+                      self._event(JudgeStatus.ACCEPTED)])
+        problem = Problem.objects.get(id=self.problem.id)
+        self.assertEqual((problem.submission_number, problem.accepted_number), (3, 2))
+        self.assertEqual(problem.statistic_info, {str(JudgeStatus.WRONG_ANSWER): 1, str(JudgeStatus.ACCEPTED): 2})
+        profile = self.user.userprofile
+        profile.refresh_from_db()
+        self.assertEqual((profile.submission_number, profile.accepted_number), (3, 1))
+        self.assertEqual(profile.acm_problems_status["problems"][str(self.problem.id)]["status"], JudgeStatus.ACCEPTED)
+
+    def test_failed_part_is_returned(self):
+        with mock.patch("judge.statistic_buffer._apply_problem_events", side_effect=DatabaseError):
+            failed = apply_events([self._event(JudgeStatus.ACCEPTED)])
+        self.assertEqual([event["parts"] for event in failed], [["problem"]])
+        # 重试时只应用失败的题目统计
+        self.assertEqual(apply_events(failed), [])
+        problem = Problem.objects.get(id=self.problem.id)
+        self.assertEqual((problem.submission_number, problem.accepted_number), (1, 1))
+        profile = self.user.userprofile
+        profile.refresh_from_db()
+        self.assertEqual((profile.submission_number, profile.accepted_number), (1, 1))
+
+    def _clear_buffer(self):
+        cache.get_client(write=True).delete(CacheKey.statistic_buffer, STATISTIC_PROCESSING_KEY)
+
+    def test_flush_pushes_back_failed_events(self):
+        self._clear_buffer()
+        cache.rpush(CacheKey.statistic_buffer, json.dumps(self._event(JudgeStatus.ACCEPTED)))
+        with mock.patch("judge.statistic_buffer._apply_profile_events", side_effect=DatabaseError):
+            with self.assertRaises(StatisticFlushError):
+                flush()
+        events = [json.loads(event) for event in cache.lrange(CacheKey.statistic_buffer, 0, -1)]
+        self.assertEqual([(event["parts"], event["attempts"]) for event in events], [(["user"], 1)])
+        flush()
+        self.assertEqual(cache.llen(CacheKey.statistic_buffer), 0)
+        profile = self.user.userprofile
+        profile.refresh_from_db()
+        self.assertEqual(profile.submission_number, 1)
+
+    def test_flush_requeues_interrupted_batch(self):
+        self._clear_buffer()
+        # 上一次 flush 移到 processing list 后 worker 退出
+        cache.rpush(STATISTIC_PROCESSING_KEY, json.dumps(self._event(JudgeStatus.ACCEPTED)))
+        flush()
+        self.assertEqual(cache.llen(STATISTIC_PROCESSING_KEY), 0)
+        self.assertEqual(cache.llen(CacheKey.statistic_buffer), 0)
+        problem = Problem.objects.get(id=self.problem.id)
+        self.assertEqual((problem.submission_number, problem.accepted_number), (1, 1))
+
+    def test_rejudge(self):
+        apply_events([self._event(JudgeStatus.WRONG_ANSWER)])
+        apply_events([self._event(JudgeStatus.ACCEPTED, rejudge=True, last_result=JudgeStatus.WRONG_ANSWER)])
+        problem = Problem.objects.get(id=self.problem.id)
+        self.assertEqual((problem.submission_number, problem.accepted_number), (1, 1))
+        self.assertEqual(problem.statistic_info, {str(JudgeStatus.WRONG_ANSWER): 0, str(JudgeStatus.ACCEPTED): 1})
+        profile = self.user.userprofile
+        profile.refresh_from_db()
+        self.assertEqual((profile.submission_number, profile.accepted_number), (1, 1))
+
+
+class LanguageRegistryTest(APITestCase):
+    def setUp(self):
+        self.registry = LanguageRegistry()
+        user = self.create_admin("test", "test123", login=False)
+        problem_data = deepcopy(DEFAULT_PROBLEM_DATA)
+        problem_data.pop("tags")
+        problem_data["template"] = {"C": "//PREPEND BEGIN\nA\n//PREPEND END\n\n//APPEND BEGIN\nB\n//APPEND END"}
+        self.problem = Problem.objects.create(created_by=user, **problem_data)
+
+    def test_get_config(self):
+        config = next(item for item in SysOptions.languages if item["name"] == "C")
+        self.assertEqual(self.registry.get_config("C"), config["config"])
+        self.assertEqual(self.registry.get_spj_config("C"), config["spj"])
+        with self.assertRaises(KeyError):
+            self.registry.get_config("not exist")
+
+    def test_get_template(self):
+        self.assertEqual(self.registry.get_template(self.problem, "C")["prepend"], "A\n")
+        self.assertIsNone(self.registry.get_template(self.problem, "Java"))
+        self.problem.template["C"] = "//PREPEND BEGIN\nC\n//PREPEND END"
+        self.assertEqual(self.registry.get_template(self.problem, "C")["prepend"], "C\n")
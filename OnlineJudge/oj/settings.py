@@ -137,6 +137,8 @@ STATIC_URL = '/public/'
 AUTH_USER_MODEL = 'account.User'
 
 TEST_CASE_DIR = os.path.join(DATA_DIR, "test_case")
+# 测试用例下载和导出时复用的 zip
+TEST_CASE_ARCHIVE_DIR = os.path.join(DATA_DIR, "test_case_archive")
 LOG_PATH = os.path.join(DATA_DIR, "log")
 
 AVATAR_URI_PREFIX = "/public/avatar"
@@ -263,6 +265,19 @@ RAVEN_CONFIG = {
 
 IP_HEADER = "HTTP_X_REAL_IP"
 
+# judge server 请求的连接/读取超时(秒), 以及连接失败时换其他 server 重试的次数
+JUDGE_SERVER_CONNECT_TIMEOUT = float(get_env("JUDGE_SERVER_CONNECT_TIMEOUT", "3"))
+JUDGE_SERVER_READ_TIMEOUT = float(get_env("JUDGE_SERVER_READ_TIMEOUT", "600"))
+JUDGE_SERVER_MAX_RETRIES = int(get_env("JUDGE_SERVER_MAX_RETRIES", "2"))
+JUDGE_SERVER_POOL_SIZE = int(get_env("JUDGE_SERVER_POOL_SIZE", "10"))
+
+# 判题后的题目/用户统计先写入 redis, 每 STATISTIC_FLUSH_INTERVAL 秒批量写入数据库
+STATISTIC_WRITE_BEHIND = get_env("STATISTIC_WRITE_BEHIND", "1") == "1"
+STATISTIC_FLUSH_INTERVAL = int(get_env("STATISTIC_FLUSH_INTERVAL", "2"))
+
+# 上传测试用例时同时解压的文件数
+TEST_CASE_ZIP_WORKERS = int(get_env("TEST_CASE_ZIP_WORKERS", "4"))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 # CORS 설정
@@ -1,10 +1,13 @@
+import copy
 import functools
 import os
 import threading
 import time
 
-from django.db import transaction, IntegrityError
+from django.db import connection, transaction, IntegrityError
 
+from utils.cache import cache
+from utils.constants import CacheKey
 from utils.shortcuts import rand_str
 from judge.languages import languages
 from .models import SysOptions as SysOptionsModel
@@ -114,11 +117,81 @@ class OptionDefaultValue:
     submission_list_show_all = True
     smtp_config = {}
     judge_server_token = default_token
-    throttling = {"ip": {"capacity": 100, "fill_rate": 0.1, "default_capacity": 50},
+    # ip 限制默认关闭, enabled 为 True 时同一 ip 提交过多需要输入验证码
+    throttling = {"ip": {"capacity": 100, "fill_rate": 0.1, "default_capacity": 50, "enabled": False},
                   "user": {"capacity": 20, "fill_rate": 0.03, "default_capacity": 10}}
     languages = languages
 
 
+class _OptionsSnapshot(object):
+    """
+    进程内共享的全部配置项, 一次查询全部加载
+    修改配置时增加 redis 中的版本号, 各进程最多每 VERSION_CHECK_INTERVAL 秒检查一次版本号, 变化后重新加载
+    命中/未命中次数定期累加到 redis 的 CacheKey.sys_options_stats 中
+    """
+    VERSION_CHECK_INTERVAL = 1
+    STATS_FLUSH_INTERVAL = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+        self._version = None
+        self._checked_at = 0
+        self._hits = 0
+        self._misses = 0
+        self._flushed_at = time.monotonic()
+
+    def _check_version(self, now):
+        pipe = cache.pipeline()
+        pipe.get(CacheKey.sys_options_version)
+        with self._lock:
+            hits, misses = self._hits, self._misses
+            self._hits = self._misses = 0
+        if now - self._flushed_at >= self.STATS_FLUSH_INTERVAL:
+            self._flushed_at = now
+            if hits:
+                pipe.hincrby(CacheKey.sys_options_stats, "hits", hits)
+            if misses:
+                pipe.hincrby(CacheKey.sys_options_stats, "misses", misses)
+        else:
+            with self._lock:
+                self._hits += hits
+                self._misses += misses
+        version = pipe.execute()[0]
+        self._checked_at = now
+        if version != self._version:
+            self._values = None
+            self._version = version
+
+    def get(self, key, loader):
+        """
+        :param loader: 一次加载全部配置的函数, 返回 {key: value}
+        """
+        now = time.monotonic()
+        if now - self._checked_at >= self.VERSION_CHECK_INTERVAL:
+            self._check_version(now)
+        values = self._values
+        if values is None or key not in values:
+            with self._lock:
+                self._misses += 1
+            values = loader()
+            # 事务中读到的可能是未提交或之后会回滚的数据, 不放入快照
+            if not connection.in_atomic_block:
+                self._values = values
+        else:
+            with self._lock:
+                self._hits += 1
+        return copy.deepcopy(values[key])
+
+    def invalidate(self):
+        self._values = None
+        # 事务提交后再通知其他进程, 否则其他进程可能重新加载到旧的数据
+        transaction.on_commit(lambda: cache.redis_incr(CacheKey.sys_options_version))
+
+
+_options_snapshot = _OptionsSnapshot()
+
+
 class _SysOptionsMeta(type):
     @classmethod
     def _get_keys(cls):
@@ -137,14 +210,16 @@ class _SysOptionsMeta(type):
                     pass
 
     @classmethod
-    def _get_option(mcs, option_key):
-        try:
-            option = SysOptionsModel.objects.get(key=option_key)
-            value = option.value
-            return value
-        except SysOptionsModel.DoesNotExist:
+    def _load_options(mcs):
+        values = dict(SysOptionsModel.objects.values_list("key", "value"))
+        if any(key not in values for key in mcs._get_keys()):
             mcs._init_option()
-            return mcs._get_option(option_key)
+            values = dict(SysOptionsModel.objects.values_list("key", "value"))
+        return values
+
+    @classmethod
+    def _get_option(mcs, option_key):
+        return _options_snapshot.get(option_key, mcs._load_options)
 
     @classmethod
     def _set_option(mcs, option_key: str, option_value):
@@ -153,6 +228,7 @@ class _SysOptionsMeta(type):
                 option = SysOptionsModel.objects.select_for_update().get(key=option_key)
                 option.value = option_value
                 option.save()
+            _options_snapshot.invalidate()
         except SysOptionsModel.DoesNotExist:
             mcs._init_option()
             mcs._set_option(option_key, option_value)
@@ -165,6 +241,7 @@ class _SysOptionsMeta(type):
                 value = option.value + 1
                 option.value = value
                 option.save()
+            _options_snapshot.invalidate()
         except SysOptionsModel.DoesNotExist:
             mcs._init_option()
             return mcs._increment(option_key)
@@ -181,6 +258,11 @@ class _SysOptionsMeta(type):
             result[key] = mcs._get_option(key)
         return result
 
+    @classmethod
+    def get_cache_stats(mcs):
+        stats = cache.hgetall(CacheKey.sys_options_stats)
+        return {k.decode("utf-8"): int(v) for k, v in stats.items()}
+
     @my_property(ttl=DEFAULT_SHORT_TTL)
     def website_base_url(cls):
         return cls._get_option(OptionKeys.website_base_url)
@@ -260,6 +342,8 @@ class _SysOptionsMeta(type):
     @languages.setter
     def languages(cls, value):
         cls._set_option(OptionKeys.languages, value)
+        # 通知各进程的 judge.language_registry 重新加载
+        transaction.on_commit(lambda: cache.redis_incr(CacheKey.language_version))
 
     @my_property(ttl=DEFAULT_SHORT_TTL)
     def spj_languages(cls):
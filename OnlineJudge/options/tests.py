@@ -1 +1,35 @@
-# Create your tests here.
+from unittest import mock
+
+from django.test import TestCase
+
+from utils.cache import cache
+from utils.constants import CacheKey
+from .options import _OptionsSnapshot
+
+
+class OptionsSnapshotTest(TestCase):
+    def setUp(self):
+        self.snapshot = _OptionsSnapshot()
+        self.loader = mock.Mock(return_value={"throttling": {"user": {"capacity": 20}}})
+
+    @mock.patch("options.options.connection", in_atomic_block=False)
+    def test_load_once(self, _):
+        self.assertEqual(self.snapshot.get("throttling", self.loader), {"user": {"capacity": 20}})
+        # 返回的是副本
+        self.snapshot.get("throttling", self.loader)["user"]["capacity"] = 0
+        self.assertEqual(self.snapshot.get("throttling", self.loader), {"user": {"capacity": 20}})
+        self.assertEqual(self.loader.call_count, 1)
+
+    @mock.patch("options.options.connection", in_atomic_block=False)
+    def test_reload_after_version_changed(self, _):
+        self.snapshot.get("throttling", self.loader)
+        cache.redis_incr(CacheKey.sys_options_version)
+        self.snapshot._checked_at = 0
+        self.snapshot.get("throttling", self.loader)
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_skip_snapshot_in_transaction(self):
+        # TestCase 中的查询都在事务里
+        self.snapshot.get("throttling", self.loader)
+        self.snapshot.get("throttling", self.loader)
+        self.assertEqual(self.loader.call_count, 2)
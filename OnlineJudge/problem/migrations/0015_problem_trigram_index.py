@@ -0,0 +1,24 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problem', '0014_problem_share_submission'),
+    ]
+
+    # icontains 生成 UPPER(field) LIKE UPPER(%s), 所以索引建立在 UPPER(field) 上
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            sql=[
+                "CREATE INDEX IF NOT EXISTS problem_title_trgm_idx ON problem USING gin (UPPER(title) gin_trgm_ops)",
+                "CREATE INDEX IF NOT EXISTS problem__id_trgm_idx ON problem USING gin (UPPER(_id) gin_trgm_ops)",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS problem_title_trgm_idx",
+                "DROP INDEX IF EXISTS problem__id_trgm_idx",
+            ],
+        ),
+    ]
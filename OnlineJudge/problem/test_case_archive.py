@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import zipfile
+
+from django.conf import settings
+
+from utils.shortcuts import rand_str
+
+
+def test_case_names(info):
+    """
+    info 中列出的测试用例文件名, spj 题目只有输入文件
+    """
+    names = []
+    for item in info["test_cases"].values():
+        names.append(item["input_name"])
+        if not info["spj"]:
+            names.append(item["output_name"])
+    return names
+
+
+def _archive_prefix(test_case_id):
+    return os.path.join(settings.TEST_CASE_ARCHIVE_DIR, f"{test_case_id}-")
+
+
+def get_test_case_archive(test_case_id):
+    """
+    测试用例文件和 info 打包后的 zip, 按 info 文件的摘要缓存, 测试用例没有变化时直接复用
+    测试用例目录不存在时抛出 FileNotFoundError
+
+    :return: (zip 路径, info)
+    """
+    test_case_dir = os.path.join(settings.TEST_CASE_DIR, test_case_id)
+    with open(os.path.join(test_case_dir, "info"), "rb") as f:
+        info_content = f.read()
+    info = json.loads(info_content)
+    path = f"{_archive_prefix(test_case_id)}{hashlib.sha256(info_content).hexdigest()[:16]}.zip"
+    if os.path.exists(path):
+        return path, info
+
+    os.makedirs(settings.TEST_CASE_ARCHIVE_DIR, exist_ok=True)
+    # 先写入临时文件, 并发请求不会读到写了一半的 zip
+    tmp_path = f"{path}.{rand_str(8)}"
+    try:
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for name in test_case_names(info):
+                zip_file.write(os.path.join(test_case_dir, name), name)
+            zip_file.writestr("info", info_content)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    delete_test_case_archives(test_case_id, keep=path)
+    return path, info
+
+
+def delete_test_case_archives(test_case_id, keep=None):
+    prefix = _archive_prefix(test_case_id)
+    if not os.path.isdir(settings.TEST_CASE_ARCHIVE_DIR):
+        return
+    for entry in os.scandir(settings.TEST_CASE_ARCHIVE_DIR):
+        if entry.path.startswith(prefix) and entry.name.endswith(".zip") and entry.path != keep:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,84 @@
+import hashlib
+import os
+
+from django.conf import settings
+
+from utils.shortcuts import rand_str
+
+# 按内容 sha256 保存的测试用例文件, 目录名不是 32 位 id, 不会被 TestCasePruneAPI 当作测试用例删除
+BLOB_DIR_NAME = ".blobs"
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_dir():
+    return os.path.join(settings.TEST_CASE_DIR, BLOB_DIR_NAME)
+
+
+def blob_path(digest):
+    return os.path.join(blob_dir(), digest[:2], digest)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _link_one(path, digest):
+    blob = blob_path(digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    while True:
+        try:
+            # 第一次出现的内容, 文件本身成为 blob
+            os.link(path, blob)
+            return
+        except FileExistsError:
+            pass
+        tmp = f"{path}.{rand_str(8)}"
+        try:
+            os.link(blob, tmp)
+        except FileNotFoundError:
+            # blob 刚好被 prune 删除, 重试
+            continue
+        os.replace(tmp, path)
+        return
+
+
+def link_test_case(test_case_dir, names, digests=None):
+    """
+    把 test_case_dir 中的文件替换为指向 blob 的硬链接, 相同内容在磁盘上只保存一份
+    测试用例目录 (info 文件 + 各个输入输出文件) 的结构不变, 判题服务不需要任何修改
+    blob 的硬链接数减一就是引用它的测试用例数, 共享 inode 的文件不能原地修改
+
+    :param names: 需要去重的文件名
+    :param digests: 已经计算过的 {name: sha256}
+    """
+    digests = digests or {}
+    for name in names:
+        path = os.path.join(test_case_dir, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            _link_one(path, digests.get(name) or file_digest(path))
+        except OSError:
+            # 文件系统不支持硬链接时保留原文件
+            return
+
+
+def prune_blobs():
+    """
+    删除已经没有测试用例引用的 blob, 返回删除的数量
+    """
+    count = 0
+    if not os.path.isdir(blob_dir()):
+        return count
+    for sub_dir in os.scandir(blob_dir()):
+        if not sub_dir.is_dir():
+            continue
+        for blob in os.scandir(sub_dir.path):
+            if blob.stat().st_nlink == 1:
+                os.unlink(blob.path)
+                count += 1
+    return count
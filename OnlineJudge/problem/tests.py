@@ -1,21 +1,28 @@
 import copy
 import hashlib
+import io
 import os
 import shutil
 from datetime import timedelta
 from zipfile import ZipFile
 
 from django.conf import settings
+from django.db import connection
 
 from utils.api.tests import APITestCase
+from utils.cache import cache
+from utils.constants import CacheKey
+from utils.search import keyword_search
 
 from .models import ProblemTag, ProblemIOMode
 from .models import Problem, ProblemRuleType
 from contest.models import Contest
 from contest.tests import DEFAULT_CONTEST_DATA
 
+from .test_case_archive import get_test_case_archive, test_case_names
+from .test_case_store import blob_path, file_digest, prune_blobs
 from .views.admin import TestCaseAPI
-from .utils import parse_problem_template
+from .utils import parse_problem_template, copy_test_case, get_problem_tag_counts
 
 DEFAULT_PROBLEM_DATA = {"_id": "A-110", "title": "test", "description": "<p>test</p>", "input_description": "test",
                         "output_description": "test", "time_limit": 1000, "memory_limit": 256, "difficulty": "Low",
@@ -67,12 +74,34 @@ class ProblemCreateTestBase(APITestCase):
 
 
 class ProblemTagListAPITest(APITestCase):
+    def setUp(self):
+        # 测试中事务不会提交, 直接增加版本号, 不读取其他测试留下的缓存
+        cache.redis_incr(CacheKey.problem_index_version)
+
     def test_get_tag_list(self):
         ProblemTag.objects.create(name="name1")
         ProblemTag.objects.create(name="name2")
         resp = self.client.get(self.reverse("problem_tag_list_api"))
         self.assertSuccess(resp)
 
+    def test_tag_counts_cached(self):
+        admin = self.create_admin()
+        ProblemTag.objects.create(name="unused")
+        ProblemCreateTestBase.add_problem(DEFAULT_PROBLEM_DATA, admin)
+        counts = get_problem_tag_counts()
+        self.assertEqual([(tag["name"], tag["count"], tag["public_count"]) for tag in counts], [("test", 1, 0)])
+
+        resp = self.client.get(self.reverse("problem_tag_list_api") + "?keyword=TE")
+        self.assertSuccess(resp)
+        self.assertEqual([tag["name"] for tag in resp.data["data"]], ["test"])
+
+        # 版本号不变时读取缓存, 不查询数据库
+        with self.assertNumQueries(0):
+            self.assertEqual(get_problem_tag_counts(), counts)
+        cache.redis_incr(CacheKey.problem_index_version)
+        with self.assertNumQueries(1):
+            get_problem_tag_counts()
+
 
 class TestCaseUploadAPITest(APITestCase):
     def setUp(self):
@@ -192,6 +221,24 @@ class ProblemAPITest(ProblemCreateTestBase):
         resp = self.client.get(self.url + "?id=" + self.problem._id)
         self.assertSuccess(resp)
 
+    def test_search_problem_ranked_by_similarity(self):
+        data = copy.deepcopy(DEFAULT_PROBLEM_DATA)
+        data.update({"_id": "B-110", "title": "binary search tree"})
+        self.add_problem(data, self.problem.created_by)
+        data.update({"_id": "C-110", "title": "search"})
+        self.add_problem(data, self.problem.created_by)
+        resp = self.client.get(self.url, data={"limit": "10", "keyword": "search"})
+        self.assertSuccess(resp)
+        self.assertEqual([item["_id"] for item in resp.data["data"]["results"]], ["C-110", "B-110"])
+
+    def test_search_uses_trigram_index(self):
+        with connection.cursor() as cursor:
+            # 测试库中数据很少, 不禁用顺序扫描时不会选择索引
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = keyword_search(Problem.objects.all(), "search", ("title", "_id")).explain()
+        self.assertIn("problem_title_trgm_idx", plan)
+        self.assertIn("problem__id_trgm_idx", plan)
+
 
 class ContestProblemAdminTest(APITestCase):
     def setUp(self):
@@ -282,6 +329,52 @@ class AddProblemFromPublicProblemAPITest(ProblemCreateTestBase):
         self.assertTrue(Problem.objects.all().exists())
         self.assertTrue(Problem.objects.filter(contest_id=self.contest["id"]).exists())
 
+    def test_upload_duplicated_test_case_zip(self):
+        ids = []
+        for _ in range(2):
+            with open(self.make_test_case_zip(), "rb") as f:
+                resp = self.client.post(self.url, data={"spj": "false", "file": f}, format="multipart")
+                self.assertSuccess(resp)
+                ids.append(resp.data["data"]["id"])
+        paths = [os.path.join(settings.TEST_CASE_DIR, test_case_id, "1.out") for test_case_id in ids]
+        self.assertEqual(os.stat(paths[0]).st_ino, os.stat(paths[1]).st_ino)
+        blob = blob_path(file_digest(paths[0]))
+        self.assertEqual(os.stat(blob).st_nlink, 3)
+
+        shutil.rmtree(os.path.join(settings.TEST_CASE_DIR, ids[0]))
+        prune_blobs()
+        self.assertTrue(os.path.exists(blob))
+        shutil.rmtree(os.path.join(settings.TEST_CASE_DIR, ids[1]))
+        prune_blobs()
+        self.assertFalse(os.path.exists(blob))
+
+    def test_test_case_archive(self):
+        with open(self.make_test_case_zip(), "rb") as f:
+            resp = self.client.post(self.url, data={"spj": "false", "file": f}, format="multipart")
+            self.assertSuccess(resp)
+        test_case_id = resp.data["data"]["id"]
+        path, info = get_test_case_archive(test_case_id)
+        self.assertEqual(test_case_names(info), ["1.in", "1.out"])
+        with ZipFile(path) as f:
+            self.assertEqual(f.namelist(), ["1.in", "1.out", "info"])
+        # info 没有变化时复用同一个 zip
+        mtime = os.path.getmtime(path)
+        self.assertEqual(get_test_case_archive(test_case_id)[0], path)
+        self.assertEqual(os.path.getmtime(path), mtime)
+
+
+class CopyTestCaseTest(APITestCase):
+    def test_copy(self):
+        content = b"1 2\r\n3\r\r\n \r\n\t\r\nend \r\n\n"
+        expected = content.replace(b"\r\n", b"\n")
+        # 各种分块大小下 \r\n 和结尾空白字符都可能跨块
+        for chunk_size in range(1, len(content) + 2):
+            dst = io.BytesIO()
+            size, md5 = copy_test_case(io.BytesIO(content), dst, chunk_size=chunk_size)
+            self.assertEqual(dst.getvalue(), expected)
+            self.assertEqual(size, len(expected))
+            self.assertEqual(md5, hashlib.md5(expected.rstrip()).hexdigest())
+
 
 class ParseProblemTemplateTest(APITestCase):
     def test_parse(self):
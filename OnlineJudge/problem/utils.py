@@ -1,6 +1,21 @@
+import hashlib
+import json
 import re
 from functools import lru_cache
 
+from django.db import transaction
+from django.db.models import Count, Q
+
+from utils.cache import cache
+from utils.constants import CacheKey
+
+from .models import ProblemTag
+
+# 解压测试用例时每次读取的大小
+TEST_CASE_CHUNK_SIZE = 1024 * 1024
+# 标签题目数的缓存时间, key 中带有 problem_index_version, 题目变化后旧的缓存不会再被读取
+PROBLEM_TAG_COUNTS_TTL = 24 * 60 * 60
+
 
 TEMPLATE_BASE = """//PREPEND BEGIN
 {}
@@ -28,3 +43,71 @@ def parse_problem_template(template_str):
 @lru_cache(maxsize=100)
 def build_problem_template(prepend, template, append):
     return TEMPLATE_BASE.format(prepend, template, append)
+
+
+def bump_problem_index_version():
+    """
+    题目或者题目的标签发生变化, 微服务中按标签筛选题目的内存索引会在发现版本变化后重建, 标签题目数的缓存也随之失效
+    """
+    transaction.on_commit(lambda: cache.redis_incr(CacheKey.problem_index_version))
+
+
+def get_problem_tag_counts():
+    """
+    有题目的标签和对应的题目数, 按 id 排序, 和微服务的 /api/problem/tags/counts 共用同一份缓存
+    count 是全部题目数, public_count 是公开题库 (非比赛且 is_public) 中的题目数
+
+    :return: [{"id", "name", "count", "public_count"}]
+    """
+    client = cache.get_client(write=True)
+    version = int(client.get(CacheKey.problem_index_version) or 0)
+    key = f"{CacheKey.problem_tag_counts}:{version}"
+    data = client.get(key)
+    if data is not None:
+        return json.loads(data)
+
+    public = Q(problem__contest__isnull=True, problem__is_public=True)
+    rows = ProblemTag.objects.annotate(count=Count("problem"), public_count=Count("problem", filter=public)) \
+        .filter(count__gt=0).order_by("id").values("id", "name", "count", "public_count")
+    rows = list(rows)
+    client.set(key, json.dumps(rows), ex=PROBLEM_TAG_COUNTS_TTL)
+    return rows
+
+
+def copy_test_case(src, dst, chunk_size=TEST_CASE_CHUNK_SIZE, digest=None):
+    """
+    分块把测试用例从 src 复制到 dst, 同时把 \r\n 替换为 \n, 内存占用只和 chunk_size 有关
+    结果和一次性读取后 replace(b"\r\n", b"\n") 相同
+
+    :param digest: hashlib 对象, 写入 dst 的内容同时更新到其中
+
+    :return: (替换后的大小, 去掉结尾空白字符后的 md5)
+    """
+    size = 0
+    md5 = hashlib.md5()
+    # 结尾的空白字符要等到后面出现非空白字符时才能计入 md5
+    pending = b""
+    carry = b""
+    while True:
+        chunk = src.read(chunk_size)
+        data = carry + chunk
+        # \r\n 可能被分在两块中, 末尾的 \r 留到下一块处理
+        if chunk and data.endswith(b"\r"):
+            data, carry = data[:-1], b"\r"
+        else:
+            carry = b""
+        data = data.replace(b"\r\n", b"\n")
+        if data:
+            dst.write(data)
+            if digest is not None:
+                digest.update(data)
+            size += len(data)
+            stripped = data.rstrip()
+            if stripped:
+                md5.update(pending)
+                md5.update(stripped)
+                pending = data[len(stripped):]
+            else:
+                pending += data
+        if not chunk:
+            return size, md5.hexdigest()
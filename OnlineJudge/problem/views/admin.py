@@ -4,12 +4,13 @@ import os
 # import shutil
 import tempfile
 import zipfile
-from wsgiref.util import FileWrapper
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
 from django.db import transaction
 from django.db.models import Q
-from django.http import StreamingHttpResponse, FileResponse
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.timezone import now
 
 from account.decorators import problem_permission_required, ensure_created_by
 from contest.models import Contest, ContestStatus
@@ -20,7 +21,7 @@ from submission.models import Submission, JudgeStatus
 from utils.api import APIView, CSRFExemptAPIView, validate_serializer, APIError
 from utils.constants import Difficulty
 from utils.shortcuts import rand_str, natural_sort_key
-from utils.tasks import delete_files
+from utils.zipstream import ZipStream
 from ..models import Problem, ProblemRuleType, ProblemTag
 from ..serializers import (CreateContestProblemSerializer, CompileSPJSerializer,
                            CreateProblemSerializer, EditProblemSerializer, EditContestProblemSerializer,
@@ -28,7 +29,9 @@ from ..serializers import (CreateContestProblemSerializer, CompileSPJSerializer,
                            AddContestProblemSerializer, ExportProblemSerializer,
                            ExportProblemRequestSerialzier, UploadProblemForm, ImportProblemSerializer,
                            FPSProblemSerializer)
-from ..utils import TEMPLATE_BASE, build_problem_template
+from ..test_case_archive import get_test_case_archive, test_case_names
+from ..test_case_store import link_test_case
+from ..utils import TEMPLATE_BASE, build_problem_template, bump_problem_index_version, copy_test_case
 
 
 class TestCaseZipProcessor(object):
@@ -49,14 +52,26 @@ class TestCaseZipProcessor(object):
 
         size_cache = {}
         md5_cache = {}
-
-        for item in test_case_list:
-            with open(os.path.join(test_case_dir, item), "wb") as f:
-                content = zip_file.read(f"{dir}{item}").replace(b"\r\n", b"\n")
-                size_cache[item] = len(content)
-                if item.endswith(".out"):
-                    md5_cache[item] = hashlib.md5(content.rstrip()).hexdigest()
-                f.write(content)
+        digests = {}
+
+        def extract(item):
+            digest = hashlib.sha256()
+            with zip_file.open(f"{dir}{item}") as src, open(os.path.join(test_case_dir, item), "wb") as dst:
+                size, md5 = copy_test_case(src, dst, digest=digest)
+            digests[item] = digest.hexdigest()
+            return item, (size, md5)
+
+        # zipfile 的多个成员可以在不同线程中同时读取, 解压和 md5 计算时会释放 GIL
+        workers = min(settings.TEST_CASE_ZIP_WORKERS, len(test_case_list))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(extract, test_case_list))
+        else:
+            results = [extract(item) for item in test_case_list]
+        for item, (size, md5) in results:
+            size_cache[item] = size
+            if item.endswith(".out"):
+                md5_cache[item] = md5
         test_case_info = {"spj": spj, "test_cases": {}}
 
         info = []
@@ -83,10 +98,13 @@ class TestCaseZipProcessor(object):
 
         for item in os.listdir(test_case_dir):
             os.chmod(os.path.join(test_case_dir, item), 0o640)
+        # 重复上传的相同数据共用同一份文件
+        link_test_case(test_case_dir, test_case_list, digests)
 
         return info, test_case_id
 
     def filter_name_list(self, name_list, spj, dir=""):
+        name_list = set(name_list)
         ret = []
         prefix = 1
         if spj:
@@ -128,21 +146,13 @@ class TestCaseAPI(CSRFExemptAPIView, TestCaseZipProcessor):
         else:
             ensure_created_by(problem, request.user)
 
-        test_case_dir = os.path.join(settings.TEST_CASE_DIR, problem.test_case_id)
-        if not os.path.isdir(test_case_dir):
+        try:
+            archive_path, _ = get_test_case_archive(problem.test_case_id)
+        except FileNotFoundError:
             return self.error("Test case does not exists")
-        name_list = self.filter_name_list(os.listdir(test_case_dir), problem.spj)
-        name_list.append("info")
-        file_name = os.path.join(test_case_dir, problem.test_case_id + ".zip")
-        with zipfile.ZipFile(file_name, "w") as file:
-            for test_case in name_list:
-                file.write(f"{test_case_dir}/{test_case}", test_case)
-        response = StreamingHttpResponse(FileWrapper(open(file_name, "rb")),
-                                         content_type="application/octet-stream")
-
-        response["Content-Disposition"] = f"attachment; filename=problem_{problem.id}_test_cases.zip"
-        response["Content-Length"] = os.path.getsize(file_name)
-        return response
+        return FileResponse(open(archive_path, "rb"), as_attachment=True,
+                            filename=f"problem_{problem.id}_test_cases.zip",
+                            content_type="application/octet-stream")
 
     def post(self, request):
         form = TestCaseUploadForm(request.POST, request.FILES)
@@ -222,6 +232,7 @@ class ProblemAPI(ProblemBase):
             except ProblemTag.DoesNotExist:
                 tag = ProblemTag.objects.create(name=item)
             problem.tags.add(tag)
+        bump_problem_index_version()
         return self.success(ProblemAdminSerializer(problem).data)
 
     @problem_permission_required
@@ -275,6 +286,7 @@ class ProblemAPI(ProblemBase):
         # todo check filename and score info
         tags = data.pop("tags")
         data["languages"] = list(data["languages"])
+        data["last_update_time"] = now()
 
         for k, v in data.items():
             setattr(problem, k, v)
@@ -288,6 +300,7 @@ class ProblemAPI(ProblemBase):
                 tag = ProblemTag.objects.create(name=tag)
             problem.tags.add(tag)
 
+        bump_problem_index_version()
         return self.success()
 
     @problem_permission_required
@@ -304,6 +317,7 @@ class ProblemAPI(ProblemBase):
         # if os.path.isdir(d):
         #     shutil.rmtree(d, ignore_errors=True)
         problem.delete()
+        bump_problem_index_version()
         return self.success()
 
 
@@ -343,6 +357,7 @@ class ContestProblemAPI(ProblemBase):
             except ProblemTag.DoesNotExist:
                 tag = ProblemTag.objects.create(name=item)
             problem.tags.add(tag)
+        bump_problem_index_version()
         return self.success(ProblemAdminSerializer(problem).data)
 
     def get(self, request):
@@ -405,6 +420,7 @@ class ContestProblemAPI(ProblemBase):
         # todo check filename and score info
         tags = data.pop("tags")
         data["languages"] = list(data["languages"])
+        data["last_update_time"] = now()
 
         for k, v in data.items():
             setattr(problem, k, v)
@@ -417,6 +433,7 @@ class ContestProblemAPI(ProblemBase):
             except ProblemTag.DoesNotExist:
                 tag = ProblemTag.objects.create(name=tag)
             problem.tags.add(tag)
+        bump_problem_index_version()
         return self.success()
 
     def delete(self, request):
@@ -434,6 +451,7 @@ class ContestProblemAPI(ProblemBase):
         # if os.path.isdir(d):
         #    shutil.rmtree(d, ignore_errors=True)
         problem.delete()
+        bump_problem_index_version()
         return self.success()
 
 
@@ -465,6 +483,7 @@ class MakeContestProblemPublicAPIView(APIView):
         problem.statistic_info = {}
         problem.save()
         problem.tags.set(tags)
+        bump_problem_index_version()
         return self.success()
 
 
@@ -493,6 +512,7 @@ class AddContestProblemAPI(APIView):
         problem.statistic_info = {}
         problem.save()
         problem.tags.set(tags)
+        bump_problem_index_version()
         return self.success()
 
 
@@ -508,24 +528,14 @@ class ExportProblemAPI(APIView):
                 ret.append({"language": submission.language, "code": submission.code})
         return ret
 
-    def process_one_problem(self, zip_file, user, problem, index):
+    def process_one_problem(self, stream, user, problem, index):
         info = ExportProblemSerializer(problem).data
         info["answers"] = self.choose_answers(user, problem=problem)
-        compression = zipfile.ZIP_DEFLATED
-        zip_file.writestr(zinfo_or_arcname=f"{index}/problem.json",
-                          data=json.dumps(info, indent=4),
-                          compress_type=compression)
-        problem_test_case_dir = os.path.join(settings.TEST_CASE_DIR, problem.test_case_id)
-        with open(os.path.join(problem_test_case_dir, "info")) as f:
-            info = json.load(f)
-        for k, v in info["test_cases"].items():
-            zip_file.write(filename=os.path.join(problem_test_case_dir, v["input_name"]),
-                           arcname=f"{index}/testcase/{v['input_name']}",
-                           compress_type=compression)
-            if not info["spj"]:
-                zip_file.write(filename=os.path.join(problem_test_case_dir, v["output_name"]),
-                               arcname=f"{index}/testcase/{v['output_name']}",
-                               compress_type=compression)
+        yield from stream.write_bytes(f"{index}/problem.json", json.dumps(info, indent=4))
+        # 测试用例直接从缓存的 zip 中复制, 不重新压缩
+        archive_path, test_case_info = get_test_case_archive(problem.test_case_id)
+        yield from stream.copy_from(archive_path, prefix=f"{index}/testcase/",
+                                    names=test_case_names(test_case_info))
 
     @validate_serializer(ExportProblemRequestSerialzier)
     def get(self, request):
@@ -535,13 +545,14 @@ class ExportProblemAPI(APIView):
                 ensure_created_by(problem.contest, request.user)
             else:
                 ensure_created_by(problem, request.user)
-        path = f"/tmp/{rand_str()}.zip"
-        with zipfile.ZipFile(path, "w") as zip_file:
+
+        def generate():
+            stream = ZipStream()
             for index, problem in enumerate(problems):
-                self.process_one_problem(zip_file=zip_file, user=request.user, problem=problem, index=index + 1)
-        delete_files.send_with_options(args=(path,), delay=300_000)
-        resp = FileResponse(open(path, "rb"))
-        resp["Content-Type"] = "application/zip"
+                yield from self.process_one_problem(stream=stream, user=request.user, problem=problem, index=index + 1)
+            yield from stream.finish()
+
+        resp = StreamingHttpResponse(generate(), content_type="application/zip")
         resp["Content-Disposition"] = "attachment;filename=problem-export.zip"
         return resp
 
@@ -622,6 +633,7 @@ class ImportProblemAPI(CSRFExemptAPIView, TestCaseZipProcessor):
                         for tag_name in problem_info["tags"]:
                             tag_obj, _ = ProblemTag.objects.get_or_create(name=tag_name)
                             problem_obj.tags.add(tag_obj)
+        bump_problem_index_version()
         return self.success({"import_count": count})
 
 
@@ -691,9 +703,12 @@ class FPSProblemImport(CSRFExemptAPIView):
                 test_case_dir = os.path.join(settings.TEST_CASE_DIR, test_case_id)
                 os.mkdir(test_case_dir)
                 score = []
+                names = []
                 for item in helper.save_test_case(_problem, test_case_dir)["test_cases"].values():
                     score.append({"score": 0, "input_name": item["input_name"],
                                   "output_name": item.get("output_name")})
+                    names.extend(name for name in (item["input_name"], item.get("output_name")) if name)
+                link_test_case(test_case_dir, names)
                 problem_data = helper.save_image(_problem, settings.UPLOAD_DIR, settings.UPLOAD_PREFIX)
                 s = FPSProblemSerializer(data=problem_data)
                 if not s.is_valid():
@@ -702,4 +717,5 @@ class FPSProblemImport(CSRFExemptAPIView):
                 problem_data["test_case_id"] = test_case_id
                 problem_data["test_case_score"] = score
                 self._create_problem(problem_data, request.user)
+        bump_problem_index_version()
         return self.success({"import_count": len(problems)})
@@ -1,20 +1,21 @@
 import random
-from django.db.models import Q, Count
 from utils.api import APIView
+from utils.search import keyword_search
 from account.decorators import check_contest_permission
-from ..models import ProblemTag, Problem, ProblemRuleType
-from ..serializers import ProblemSerializer, TagSerializer, ProblemSafeSerializer
+from ..models import Problem, ProblemRuleType
+from ..serializers import ProblemSerializer, ProblemSafeSerializer
+from ..utils import get_problem_tag_counts
 from contest.models import ContestRuleType
 
 
 class ProblemTagAPI(APIView):
     def get(self, request):
-        qs = ProblemTag.objects
+        tags = get_problem_tag_counts()
         keyword = request.GET.get("keyword")
         if keyword:
-            qs = ProblemTag.objects.filter(name__icontains=keyword)
-        tags = qs.annotate(problem_count=Count("problem")).filter(problem_count__gt=0)
-        return self.success(TagSerializer(tags, many=True).data)
+            keyword = keyword.lower()
+            tags = [tag for tag in tags if keyword in tag["name"].lower()]
+        return self.success([{"id": tag["id"], "name": tag["name"]} for tag in tags])
 
 
 class PickOneAPI(APIView):
@@ -71,7 +72,7 @@ class ProblemAPI(APIView):
         # 搜索的情况
         keyword = request.GET.get("keyword", "").strip()
         if keyword:
-            problems = problems.filter(Q(title__icontains=keyword) | Q(_id__icontains=keyword))
+            problems = keyword_search(problems, keyword, ("title", "_id"), rank=True)
 
         # 难度筛选
         difficulty = request.GET.get("difficulty")
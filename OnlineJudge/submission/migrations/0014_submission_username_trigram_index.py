@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY 不能在事务中执行, 建索引时不锁 submission 表的写入
+    atomic = False
+
+    dependencies = [
+        ('submission', '0013_submission_time_id_idx'),
+        # pg_trgm 扩展
+        ('problem', '0015_problem_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE INDEX CONCURRENTLY IF NOT EXISTS submission_username_trgm_idx "
+                "ON submission USING gin (UPPER(username) gin_trgm_ops)",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS submission_username_trgm_idx",
+        ),
+    ]
@@ -54,6 +54,8 @@ class Submission(models.Model):
     class Meta:
         db_table = "submission"
         ordering = ("-create_time",)
+        # 提交列表的游标分页
+        indexes = [models.Index(fields=["create_time", "id"], name="submission_time_id_idx")]
 
     def __str__(self):
         return self.id
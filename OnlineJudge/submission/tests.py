@@ -1,8 +1,16 @@
 from copy import deepcopy
 from unittest import mock
 
+from django.db import connection
+from django.test import TestCase
+
 from problem.models import Problem, ProblemTag
+from utils.api import APIView
 from utils.api.tests import APITestCase
+from utils.cache import cache
+from utils.constants import CacheKey
+from utils.search import keyword_search
+from utils.throttling import TokenBucket
 from .models import Submission
 
 DEFAULT_PROBLEM_DATA = {"_id": "A-110", "title": "test", "description": "<p>test</p>", "input_description": "test",
@@ -56,6 +64,57 @@ class SubmissionListTest(SubmissionPrepare):
         resp = self.client.get(self.url, data={"limit": "10"})
         self.assertSuccess(resp)
 
+    def test_get_submission_list_with_cursor(self):
+        for _ in range(2):
+            Submission.objects.create(**self.submission_data)
+        ids = []
+        params = {"limit": "2"}
+        while True:
+            resp = self.client.get(self.url, data=params)
+            self.assertSuccess(resp)
+            data = resp.data["data"]
+            self.assertEqual(data["total"], 3)
+            ids.extend(item["id"] for item in data["results"])
+            if not data["next_cursor"]:
+                break
+            params["cursor"] = data["next_cursor"]
+        self.assertEqual(ids, list(Submission.objects.order_by("-create_time", "-id").values_list("id", flat=True)))
+
+    def test_search_username_uses_trigram_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = keyword_search(Submission.objects.all(), "test", ("username",)).explain()
+        self.assertIn("submission_username_trgm_idx", plan)
+
+    def test_get_submission_list_with_invalid_cursor(self):
+        resp = self.client.get(self.url, data={"limit": "10", "cursor": "invalid"})
+        self.assertFailed(resp)
+
+    def test_estimate_count(self):
+        count = APIView._estimate_count(Submission.objects.all())
+        self.assertIsInstance(count, int)
+
+    def test_get_submission_list_with_estimated_count(self):
+        with mock.patch("utils.api.api.ESTIMATED_COUNT_THRESHOLD", 0), \
+                mock.patch.object(APIView, "_estimate_count", return_value=12345) as estimate_count, \
+                mock.patch("utils.api.api.cache") as count_cache:
+            count_cache.get.return_value = None
+            resp = self.client.get(self.url, data={"limit": "10"})
+        self.assertSuccess(resp)
+        estimate_count.assert_called_once()
+        self.assertEqual(resp.data["data"]["total"], 12345)
+
+    def test_cursor_page_reuses_count(self):
+        for _ in range(2):
+            Submission.objects.create(**self.submission_data)
+        resp = self.client.get(self.url, data={"limit": "2"})
+        self.assertSuccess(resp)
+        with mock.patch.object(APIView, "_count") as count:
+            resp = self.client.get(self.url, data={"limit": "2", "cursor": resp.data["data"]["next_cursor"]})
+        self.assertSuccess(resp)
+        count.assert_not_called()
+        self.assertEqual(resp.data["data"]["total"], 3)
+
 
 @mock.patch("submission.views.oj.judge_task.send")
 class SubmissionAPITest(SubmissionPrepare):
@@ -76,3 +135,29 @@ class SubmissionAPITest(SubmissionPrepare):
         self.assertDictEqual(resp.data, {"error": "error",
                                          "data": "Python3 is now allowed in the problem"})
         judge_task.assert_not_called()
+
+
+class TokenBucketTest(TestCase):
+    def setUp(self):
+        self.key = f"{CacheKey.throttling}:test"
+        cache.get_client(write=True).delete(self.key)
+
+    def tearDown(self):
+        cache.get_client(write=True).delete(self.key)
+
+    def _bucket(self):
+        return TokenBucket(key=self.key, capacity=3, fill_rate=0.01, default_capacity=2, redis_conn=cache)
+
+    def test_consume(self):
+        bucket = self._bucket()
+        self.assertEqual(bucket.consume(), (True, 0))
+        self.assertEqual(bucket.consume(), (True, 0))
+        can_consume, wait = bucket.consume()
+        self.assertFalse(can_consume)
+        self.assertGreater(wait, 0)
+
+    def test_consume_after_script_flush(self):
+        self.assertTrue(self._bucket().consume()[0])
+        cache.get_client(write=True).script_flush()
+        self.assertTrue(self._bucket().consume()[0])
+        self.assertFalse(self._bucket().consume()[0])
@@ -9,6 +9,8 @@ from problem.models import Problem, ProblemRuleType
 from utils.api import APIView, validate_serializer
 from utils.cache import cache
 from utils.captcha import Captcha
+from utils.search import keyword_search
+from utils.constants import CacheKey
 from utils.throttling import TokenBucket
 from ..models import Submission
 from ..serializers import (CreateSubmissionSerializer, SubmissionModelSerializer,
@@ -17,22 +19,27 @@ from ..serializers import SubmissionSafeModelSerializer, SubmissionListSerialize
 
 
 class SubmissionAPI(APIView):
-    def throttling(self, request):
+    def throttling(self, request, captcha_passed=False):
         # 使用 open_api 的请求暂不做限制
         auth_method = getattr(request, "auth_method", "")
         if auth_method == "api_key":
             return
-        user_bucket = TokenBucket(key=str(request.user.id),
-                                  redis_conn=cache, **SysOptions.throttling["user"])
+        throttling = SysOptions.throttling
+        user_bucket = TokenBucket(key=f"{CacheKey.throttling}:user:{request.user.id}",
+                                  redis_conn=cache, **throttling["user"])
         can_consume, wait = user_bucket.consume()
         if not can_consume:
             return "Please wait %d seconds" % (int(wait))
 
-        # ip_bucket = TokenBucket(key=request.session["ip"],
-        #                         redis_conn=cache, **SysOptions.throttling["ip"])
-        # can_consume, wait = ip_bucket.consume()
-        # if not can_consume:
-        #     return "Captcha is required"
+        # 同一 ip 提交过多时需要输入验证码
+        ip_config = dict(throttling.get("ip", {}))
+        if not ip_config.pop("enabled", False) or captcha_passed:
+            return
+        ip_bucket = TokenBucket(key=f"{CacheKey.throttling}:ip:{request.session['ip']}",
+                                redis_conn=cache, **ip_config)
+        can_consume, wait = ip_bucket.consume()
+        if not can_consume:
+            return "Captcha is required"
 
     @check_contest_permission(check_type="problems")
     def check_contest_permission(self, request):
@@ -61,7 +68,7 @@ class SubmissionAPI(APIView):
         if data.get("captcha"):
             if not Captcha(request).check(data["captcha"]):
                 return self.error("Invalid captcha")
-        error = self.throttling(request)
+        error = self.throttling(request, captcha_passed=bool(data.get("captcha")))
         if error:
             return self.error(error)
 
@@ -126,6 +133,9 @@ class SubmissionAPI(APIView):
 
 
 class SubmissionListAPI(APIView):
+    cursor_fields = ("create_time", "id")
+    count_mode = "estimated"
+
     def get(self, request):
         if not request.GET.get("limit"):
             return self.error("Limit is needed")
@@ -146,7 +156,7 @@ class SubmissionListAPI(APIView):
         if (myself and myself == "1") or not SysOptions.submission_list_show_all:
             submissions = submissions.filter(user_id=request.user.id)
         elif username:
-            submissions = submissions.filter(username__icontains=username)
+            submissions = keyword_search(submissions, username, ("username",))
         if result:
             submissions = submissions.filter(result=result)
         data = self.paginate_data(request, submissions)
@@ -155,6 +165,9 @@ class SubmissionListAPI(APIView):
 
 
 class ContestSubmissionListAPI(APIView):
+    cursor_fields = ("create_time", "id")
+    count_mode = "estimated"
+
     @check_contest_permission(check_type="submissions")
     def get(self, request):
         if not request.GET.get("limit"):
@@ -176,7 +189,7 @@ class ContestSubmissionListAPI(APIView):
         if myself and myself == "1":
             submissions = submissions.filter(user_id=request.user.id)
         elif username:
-            submissions = submissions.filter(username__icontains=username)
+            submissions = keyword_search(submissions, username, ("username",))
         if result:
             submissions = submissions.filter(result=result)
 
@@ -1,14 +1,27 @@
+import base64
 import functools
+import hashlib
 import json
 import logging
 
+from django.core.exceptions import EmptyResultSet
+from django.db import DatabaseError, connections
+from django.db.models import Q, QuerySet
 from django.http import HttpResponse, QueryDict
+from django.utils.dateparse import parse_datetime
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 
+from utils.cache import cache
+from utils.constants import CacheKey
+
 logger = logging.getLogger("")
 
+# 估计的行数少于这个值时仍然精确计数
+ESTIMATED_COUNT_THRESHOLD = 10000
+ESTIMATED_COUNT_CACHE_TIMEOUT = 60
+
 
 class APIError(Exception):
     def __init__(self, msg, err=None):
@@ -58,9 +71,13 @@ class APIView(View):
         写到父类中是为了不同的人开发写法统一,不再使用自己的success/error格式
      - self.response 返回一个django HttpResponse, 具体在self.response_class中实现
      - parse请求的类需要定义在request_parser中, 目前只支持json和urlencoded的类型, 用来解析请求的数据
+     - paginate_data 默认使用 offset 分页; 设置 cursor_fields (时间字段, id 字段) 后按这两个字段倒序使用游标分页,
+        返回中增加 next_cursor; count_mode 为 "estimated" 时 total 使用执行计划中的估计行数
     """
     request_parsers = (JSONParser, URLEncodedParser)
     response_class = JSONResponse
+    cursor_fields = None
+    count_mode = "exact"
 
     def _get_request_data(self, request):
         if request.method not in ["GET", "DELETE"]:
@@ -129,16 +146,88 @@ class APIView(View):
             offset = 0
         if offset < 0:
             offset = 0
-        results = query_set[offset:offset + limit]
+        next_cursor = None
+        if self.cursor_fields:
+            results, next_cursor, count = self._cursor_page(query_set, request.GET.get("cursor"), offset, limit)
+        else:
+            count = self._count(query_set)
+            results = query_set[offset:offset + limit]
         if object_serializer:
-            count = query_set.count()
             results = object_serializer(results, many=True).data
-        else:
-            count = query_set.count()
         data = {"results": results,
                 "total": count}
+        if self.cursor_fields:
+            data["next_cursor"] = next_cursor
         return data
 
+    def _cursor_page(self, query_set, cursor, offset, limit):
+        """
+        按 cursor_fields 倒序的游标分页, 下一页从上一页最后一行之后开始, 不需要 OFFSET
+        没有 cursor 时仍然按 offset 分页, 兼容原来的客户端
+        总数只在第一页计算, 之后放在 cursor 里传递
+        """
+        time_field, id_field = self.cursor_fields
+        query_set = query_set.order_by(f"-{time_field}", f"-{id_field}")
+        count = None
+        if cursor:
+            try:
+                last_time, last_id, *rest = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+                last_time = parse_datetime(last_time)
+            except (ValueError, TypeError):
+                raise APIError("Invalid cursor")
+            if last_time is None:
+                raise APIError("Invalid cursor")
+            if rest and isinstance(rest[0], int):
+                count = rest[0]
+        if count is None:
+            count = self._count(query_set)
+        if cursor:
+            query_set = query_set.filter(Q(**{f"{time_field}__lt": last_time}) |
+                                         Q(**{time_field: last_time, f"{id_field}__lt": last_id}))
+            offset = 0
+        # 多取一行判断是否还有下一页
+        results = list(query_set[offset:offset + limit + 1])
+        if len(results) <= limit:
+            return results, None, count
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = json.dumps([getattr(last, time_field).isoformat(), getattr(last, id_field), count])
+        return results, base64.urlsafe_b64encode(next_cursor.encode("utf-8")).decode("ascii"), count
+
+    def _count(self, query_set):
+        if self.count_mode != "estimated" or not isinstance(query_set, QuerySet):
+            return query_set.count()
+        key = f"{CacheKey.pagination_count}:{hashlib.md5(str(query_set.query).encode('utf-8')).hexdigest()}"
+        count = cache.get(key)
+        if count is not None:
+            return count
+        count = self._estimate_count(query_set)
+        # 结果较少时估计值误差大, 而精确计数也不慢
+        if count is None or count < ESTIMATED_COUNT_THRESHOLD:
+            return query_set.count()
+        cache.set(key, count, timeout=ESTIMATED_COUNT_CACHE_TIMEOUT)
+        return count
+
+    @staticmethod
+    def _estimate_count(query_set):
+        """
+        执行计划中的行数由 pg_class.reltuples 等统计信息估算得到, 不需要扫描数据
+        """
+        try:
+            sql, params = query_set.query.get_compiler(using=query_set.db).as_sql()
+            with connections[query_set.db].cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+        except (EmptyResultSet, DatabaseError):
+            return None
+        # psycopg2 会把 json 类型的结果解析成 list
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        try:
+            return int(plan[0]["Plan"]["Plan Rows"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
     def dispatch(self, request, *args, **kwargs):
         if self.request_parsers:
             try:
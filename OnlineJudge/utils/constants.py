@@ -22,9 +22,21 @@ class ContestRuleType(Choices):
 
 
 class CacheKey:
-    waiting_queue = "waiting_queue"
-    contest_rank_cache = "contest_rank_cache"
+    judge_queue = "judge_queue"
+    contest_rank = "contest_rank"
+    contest_rank_updates = "contest_rank_updates"
+    submission_status = "submission_status"
+    language_version = "language_version"
+    problem_index_version = "problem_index_version"
+    problem_tag_counts = "problem_tag_counts"
+    sys_options_version = "sys_options_version"
+    sys_options_stats = "sys_options_stats"
     website_config = "website_config"
+    judge_server_lease = "judge_server_lease"
+    judge_server_stats = "judge_server_stats"
+    statistic_buffer = "statistic_buffer"
+    throttling = "throttling"
+    pagination_count = "pagination_count"
 
 
 class Difficulty(Choices):
@@ -0,0 +1,100 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from account.models import User
+from contest.models import Contest
+from contest.views.admin import DownloadContestSubmissions
+from problem.models import Problem
+from submission.models import JudgeStatus, Submission
+from utils.constants import ContestRuleType
+from utils.shortcuts import rand_str
+
+
+class Command(BaseCommand):
+    help = "Compare the per-user queries and the DISTINCT ON query used to export contest submissions " \
+           "on a synthetic contest, all data is rolled back afterwards"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--problems", type=int, default=10)
+        parser.add_argument("--submissions", type=int, default=40, help="submissions per user")
+        parser.add_argument("--code-size", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def _create_contest(self, options):
+        prefix = f"benchmark-{rand_str(8)}"
+        users = User.objects.bulk_create([User(username=f"{prefix}-{i}") for i in range(options["users"])])
+        now = timezone.now()
+        contest = Contest.objects.create(title=prefix, description=prefix, real_time_rank=True, password=None,
+                                         rule_type=ContestRuleType.ACM, start_time=now,
+                                         end_time=now + timedelta(hours=5),
+                                         created_by=users[0], visible=False)
+        problems = Problem.objects.bulk_create([
+            Problem(_id=str(i), contest=contest, title=prefix, description="", input_description="",
+                    output_description="", samples=[], test_case_id="", test_case_score=[], languages=[],
+                    template={}, created_by=users[0], time_limit=1000, memory_limit=256,
+                    rule_type=ContestRuleType.ACM, difficulty="Low")
+            for i in range(options["problems"])])
+        code = "x" * options["code_size"]
+        submissions = []
+        for user in users:
+            for i in range(options["submissions"]):
+                result = JudgeStatus.ACCEPTED if random.random() < 0.5 else JudgeStatus.WRONG_ANSWER
+                submissions.append(Submission(contest=contest, problem=random.choice(problems), user_id=user.id,
+                                              username=user.username, code=code, result=result, language="C"))
+        Submission.objects.bulk_create(submissions, batch_size=5000)
+        return contest
+
+    @staticmethod
+    def _per_user(contest):
+        # 原来的实现, 每个用户一次查询, 在 Python 中去重
+        submissions = Submission.objects.filter(contest=contest, result=JudgeStatus.ACCEPTED).order_by("-create_time")
+        users = User.objects.filter(id__in=submissions.values_list("user_id", flat=True))
+        ret = set()
+        for user in users:
+            accepted = set()
+            for submission in submissions.filter(user_id=user.id):
+                if submission.problem_id not in accepted:
+                    accepted.add(submission.problem_id)
+                    ret.add((user.id, submission.problem_id))
+        return ret
+
+    @staticmethod
+    def _distinct_on(contest):
+        return {(user_id, problem_id) for user_id, problem_id, _ in
+                DownloadContestSubmissions.last_accepted_submissions(contest)}
+
+    def _measure(self, func, contest, repeat):
+        elapsed = []
+        queries = 0
+        result = None
+        for _ in range(repeat):
+            before = len(connection.queries)
+            start = time.perf_counter()
+            result = func(contest)
+            elapsed.append(time.perf_counter() - start)
+            queries = len(connection.queries) - before
+        return result, min(elapsed), sum(elapsed) / len(elapsed), queries
+
+    def handle(self, *args, **options):
+        # 统计查询次数
+        connection.force_debug_cursor = True
+        try:
+            with transaction.atomic():
+                contest = self._create_contest(options)
+                self.stdout.write(f"synthetic contest: {options['users']} users, {options['problems']} problems, "
+                                  f"{options['users'] * options['submissions']} submissions")
+                results = {}
+                for name, func in (("per-user", self._per_user), ("distinct", self._distinct_on)):
+                    results[name], best, avg, queries = self._measure(func, contest, options["repeat"])
+                    self.stdout.write(f"{name:>8}: best {best * 1000:.1f}ms, avg {avg * 1000:.1f}ms, "
+                                      f"{queries} queries, {len(results[name])} files")
+                self.stdout.write("results match" if results["per-user"] == results["distinct"] else "RESULTS DIFFER")
+                transaction.set_rollback(True)
+        finally:
+            connection.force_debug_cursor = False
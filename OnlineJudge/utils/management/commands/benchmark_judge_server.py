@@ -0,0 +1,59 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from conf.models import JudgeServer
+from judge.dispatcher import ChooseJudgeServer, RedisChooseJudgeServer
+from utils.shortcuts import rand_str
+
+
+class Command(BaseCommand):
+    help = "Compare acquire/release throughput of the postgres and redis judge server selectors"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--servers", type=int, default=2)
+
+    def _run(self, selector_class, workers, iterations):
+        acquired = [0] * workers
+
+        def worker(index):
+            try:
+                for _ in range(iterations):
+                    with selector_class() as server:
+                        if server:
+                            acquired[index] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start, sum(acquired)
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        iterations = options["iterations"]
+        prefix = f"benchmark-{rand_str(8)}"
+        # 临时 server 的容量足够大, 保证测的是选择器本身的开销
+        for i in range(options["servers"]):
+            JudgeServer.objects.create(hostname=f"{prefix}-{i}", judger_version="benchmark", cpu_core=workers,
+                                       memory_usage=0, cpu_usage=0, last_heartbeat=timezone.now(),
+                                       service_url="http://127.0.0.1")
+        try:
+            total = workers * iterations
+            for name, selector_class in (("postgres", ChooseJudgeServer), ("redis", RedisChooseJudgeServer)):
+                # 心跳超过 6 秒 server 会被视为 abnormal
+                JudgeServer.objects.filter(hostname__startswith=prefix).update(last_heartbeat=timezone.now())
+                elapsed, acquired = self._run(selector_class, workers, iterations)
+                self.stdout.write(f"{name:>8}: {total} acquire/release in {elapsed:.3f}s, "
+                                  f"{total / elapsed:.1f} ops/s, {acquired} acquired")
+        finally:
+            JudgeServer.objects.filter(hostname__startswith=prefix).delete()
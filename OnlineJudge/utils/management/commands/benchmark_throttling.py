@@ -0,0 +1,106 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from utils.cache import cache
+from utils.constants import CacheKey
+from utils.shortcuts import rand_str
+from utils.throttling import TokenBucket
+
+
+class LegacyTokenBucket:
+    """
+    原来的实现, 每次 consume 分多次 hget/hset, 仅用于对比
+    """
+    def __init__(self, key, capacity, fill_rate, default_capacity, redis_conn):
+        self._key = key
+        self._capacity = capacity
+        self._fill_rate = fill_rate
+        self._default_capacity = default_capacity
+        self._redis_conn = redis_conn
+
+    def _get_capacity(self):
+        last_capacity = self._redis_conn.hget(self._key, "last_capacity")
+        if last_capacity is None:
+            self._redis_conn.hset(self._key, "last_capacity", self._default_capacity)
+            self._redis_conn.hset(self._key, "last_timestamp", time.time())
+            return self._default_capacity
+        return float(last_capacity)
+
+    def consume(self, num=1):
+        if self._get_capacity() >= num:
+            self._redis_conn.hset(self._key, "last_capacity", self._get_capacity() - num)
+            return True, 0
+        now = time.time()
+        delta = self._fill_rate * (now - float(self._redis_conn.hget(self._key, "last_timestamp")))
+        cur_num = min(self._get_capacity() + delta, self._capacity)
+        if cur_num >= num:
+            self._redis_conn.hset(self._key, "last_capacity", cur_num - num)
+            self._redis_conn.hset(self._key, "last_timestamp", now)
+            return True, 0
+        return False, (num - cur_num) / self._fill_rate
+
+
+class CountingConnection:
+    """
+    统计经过的 redis 命令数
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __getattr__(self, item):
+        attr = getattr(self._conn, item)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                self.calls += 1
+            return attr(*args, **kwargs)
+        return wrapper
+
+
+class Command(BaseCommand):
+    help = "Compare redis round-trips and correctness of the legacy and lua token bucket under concurrent consumers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--iterations", type=int, default=100)
+        parser.add_argument("--tokens", type=int, default=200, help="initial tokens of the bucket")
+
+    def _run(self, bucket_class, key, workers, iterations, tokens):
+        conn = CountingConnection(cache.get_client(write=True))
+        granted = [0] * workers
+
+        def worker(index):
+            # fill_rate 足够小, 测试期间可以忽略补充的 token
+            bucket = bucket_class(key=key, capacity=tokens, fill_rate=1e-9, default_capacity=tokens, redis_conn=conn)
+            for _ in range(iterations):
+                if bucket.consume()[0]:
+                    granted[index] += 1
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start, conn.calls, sum(granted)
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        iterations = options["iterations"]
+        tokens = options["tokens"]
+        total = workers * iterations
+        prefix = f"{CacheKey.throttling}:benchmark-{rand_str(8)}"
+        client = cache.get_client(write=True)
+        try:
+            for name, bucket_class in (("legacy", LegacyTokenBucket), ("lua", TokenBucket)):
+                elapsed, calls, granted = self._run(bucket_class, f"{prefix}:{name}", workers, iterations, tokens)
+                self.stdout.write(f"{name:>8}: {total} consume in {elapsed:.3f}s, {calls / total:.2f} round-trips/consume, "
+                                  f"{granted} granted (expected {min(tokens, total)})")
+        finally:
+            client.delete(f"{prefix}:legacy", f"{prefix}:lua")
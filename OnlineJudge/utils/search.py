@@ -0,0 +1,21 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+
+def keyword_search(query_set, keyword, fields, rank=False):
+    """
+    在 fields 中搜索 keyword, icontains 生成的是 UPPER(field) LIKE UPPER('%keyword%'),
+    迁移中为这些字段建立了 UPPER(field) gin_trgm_ops 的 GIN 索引, 不再需要顺序扫描
+
+    :param rank: 是否按照和 keyword 的 trigram 相似度从高到低排序
+    """
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f"{field}__icontains": keyword})
+    query_set = query_set.filter(condition)
+    if rank:
+        similarities = [TrigramSimilarity(field, keyword) for field in fields]
+        similarity = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+        query_set = query_set.annotate(search_similarity=similarity).order_by("-search_similarity", "id")
+    return query_set
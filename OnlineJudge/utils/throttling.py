@@ -1,9 +1,47 @@
+import hashlib
 import time
 
+from redis.exceptions import NoScriptError
+
+# KEYS[1]: bucket
+# ARGV: capacity, fill_rate, default_capacity, now, num
+# 返回 {是否成功, 需要等待的秒数}, lua 中的小数返回给 redis 时会被截断, 所以等待时间以字符串返回
+CONSUME_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local fill_rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[4])
+local num = tonumber(ARGV[5])
+
+local state = redis.call("HMGET", KEYS[1], "last_capacity", "last_timestamp")
+local tokens = tonumber(state[1])
+local timestamp = tonumber(state[2])
+if tokens == nil or timestamp == nil then
+    tokens = tonumber(ARGV[3])
+    timestamp = now
+end
+if now > timestamp then
+    tokens = math.min(tokens + (now - timestamp) * fill_rate, capacity)
+    timestamp = now
+end
+
+local wait = 0
+if tokens >= num then
+    tokens = tokens - num
+else
+    wait = (num - tokens) / fill_rate
+end
+redis.call("HMSET", KEYS[1], "last_capacity", tostring(tokens), "last_timestamp", tostring(timestamp))
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+return {1, "0"}
+"""
+CONSUME_SCRIPT_SHA = hashlib.sha1(CONSUME_SCRIPT.encode("utf-8")).hexdigest()
+
 
 class TokenBucket:
     """
-    注意：对于单个key的操作不是线程安全的
+    读取、填充和消耗 token 在同一个 lua 脚本中完成, 每次 consume 只有一次 redis 请求, 对同一个 key 的并发调用是原子的
     """
     def __init__(self, key, capacity, fill_rate, default_capacity, redis_conn):
         """
@@ -18,55 +56,16 @@ class TokenBucket:
         self._default_capacity = default_capacity
         self._redis_conn = redis_conn
 
-        self._last_capacity_key = "last_capacity"
-        self._last_timestamp_key = "last_timestamp"
-
-    def _init_key(self):
-        self._last_capacity = self._default_capacity
-        now = time.time()
-        self._last_timestamp = now
-        return self._default_capacity, now
-
-    @property
-    def _last_capacity(self):
-        last_capacity = self._redis_conn.hget(self._key, self._last_capacity_key)
-        if last_capacity is None:
-            return self._init_key()[0]
-        else:
-            return float(last_capacity)
-
-    @_last_capacity.setter
-    def _last_capacity(self, value):
-        self._redis_conn.hset(self._key, self._last_capacity_key, value)
-
-    @property
-    def _last_timestamp(self):
-        return float(self._redis_conn.hget(self._key, self._last_timestamp_key))
-
-    @_last_timestamp.setter
-    def _last_timestamp(self, value):
-        self._redis_conn.hset(self._key, self._last_timestamp_key, value)
-
-    def _try_to_fill(self, now):
-        delta = self._fill_rate * (now - self._last_timestamp)
-        return min(self._last_capacity + delta, self._capacity)
-
     def consume(self, num=1):
         """
         消耗 num 个 token，返回是否成功
         :param num:
         :return: result: bool, wait_time: float
         """
-        # print("capacity ", self.fill(time.time()))
-        if self._last_capacity >= num:
-            self._last_capacity -= num
-            return True, 0
-        else:
-            now = time.time()
-            cur_num = self._try_to_fill(now)
-            if cur_num >= num:
-                self._last_capacity = cur_num - num
-                self._last_timestamp = now
-                return True, 0
-            else:
-                return False, (num - cur_num) / self._fill_rate
+        args = (self._capacity, self._fill_rate, self._default_capacity, time.time(), num)
+        try:
+            result, wait = self._redis_conn.evalsha(CONSUME_SCRIPT_SHA, 1, self._key, *args)
+        except NoScriptError:
+            # redis 重启或执行过 SCRIPT FLUSH, EVAL 会重新缓存脚本
+            result, wait = self._redis_conn.eval(CONSUME_SCRIPT, 1, self._key, *args)
+        return bool(result), float(wait)
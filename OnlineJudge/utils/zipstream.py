@@ -0,0 +1,149 @@
+import os
+import struct
+import time
+import zipfile
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_DATA_DESCRIPTOR = struct.Struct("<4s3L")
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_ZIP64_END = struct.Struct("<4sQ2H2L4Q")
+_ZIP64_LOCATOR = struct.Struct("<4sLQL")
+_END = struct.Struct("<4s4H2LH")
+
+# 使用 data descriptor, 文件名为 utf-8
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_MAX_32 = 0xFFFFFFFF
+_MAX_16 = 0xFFFF
+
+
+def _dos_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return hour << 11 | minute << 5 | second // 2, (max(year, 1980) - 1980) << 9 | month << 5 | day
+
+
+class ZipStream(object):
+    """
+    边生成边输出的 zip, 只向后写, 不需要 seek, 可以直接作为 StreamingHttpResponse 的内容
+    各个 write_* 方法都是生成器, 依次 yield from 之后再 yield from finish() 写入目录
+
+        stream = ZipStream()
+        yield from stream.write_bytes("problem.json", data)
+        yield from stream.write_file("1/testcase/1.in", path)
+        yield from stream.finish()
+
+    单个文件不能超过 4G, 整个 zip 超过 4G 或者文件数超过 65535 时使用 zip64 目录
+    """
+    def __init__(self, compress_type=zipfile.ZIP_DEFLATED):
+        self.compress_type = compress_type
+        self._entries = []
+        self._offset = 0
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def _local_header(self, name, flags, compress_type, dos_time, crc=0, compress_size=0, file_size=0):
+        return _LOCAL_HEADER.pack(b"PK\x03\x04", 20, flags, compress_type, dos_time[0], dos_time[1],
+                                  crc, compress_size, file_size, len(name), 0) + name
+
+    def _write_chunks(self, arcname, chunks, timestamp=None):
+        name = arcname.encode("utf-8")
+        flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+        dos_time = _dos_time(time.localtime(timestamp)[:6])
+        offset = self._offset
+        yield self._emit(self._local_header(name, flags, self.compress_type, dos_time))
+
+        crc = compress_size = file_size = 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) \
+            if self.compress_type == zipfile.ZIP_DEFLATED else None
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                compress_size += len(chunk)
+                yield self._emit(chunk)
+        if compressor:
+            chunk = compressor.flush()
+            compress_size += len(chunk)
+            yield self._emit(chunk)
+        if file_size > _MAX_32 or compress_size > _MAX_32:
+            raise ValueError(f"{arcname} is too large")
+
+        yield self._emit(_DATA_DESCRIPTOR.pack(b"PK\x07\x08", crc, compress_size, file_size))
+        self._entries.append((name, flags, self.compress_type, dos_time, crc, compress_size, file_size, offset))
+
+    def write_bytes(self, arcname, data, timestamp=None):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return self._write_chunks(arcname, [data], timestamp)
+
+    def write_file(self, arcname, path):
+        def chunks():
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    yield chunk
+        return self._write_chunks(arcname, chunks(), os.path.getmtime(path))
+
+    def copy_from(self, zip_path, prefix="", names=None):
+        """
+        把另一个 zip 中已经压缩好的文件原样复制过来, 不重新压缩
+
+        :param prefix: 复制后的文件名前缀
+        :param names: 需要复制的文件名, 默认全部
+        """
+        with open(zip_path, "rb") as f:
+            infos = zipfile.ZipFile(f).infolist()
+            if names is not None:
+                names = set(names)
+                infos = [info for info in infos if info.filename in names]
+            for info in infos:
+                f.seek(info.header_offset)
+                header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+                f.seek(header[-2] + header[-1], os.SEEK_CUR)
+
+                name = (prefix + info.filename).encode("utf-8")
+                flags = _FLAG_UTF8
+                dos_time = _dos_time(info.date_time)
+                offset = self._offset
+                header = self._local_header(name, flags, info.compress_type, dos_time,
+                                            info.CRC, info.compress_size, info.file_size)
+                yield self._emit(header)
+                remaining = info.compress_size
+                while remaining:
+                    chunk = f.read(min(remaining, CHUNK_SIZE))
+                    if not chunk:
+                        raise zipfile.BadZipFile(f"Truncated file {info.filename}")
+                    remaining -= len(chunk)
+                    yield self._emit(chunk)
+                self._entries.append((name, flags, info.compress_type, dos_time,
+                                      info.CRC, info.compress_size, info.file_size, offset))
+
+    def finish(self):
+        cd_offset = self._offset
+        for name, flags, compress_type, dos_time, crc, compress_size, file_size, offset in self._entries:
+            extra = b""
+            version = 20
+            if offset > _MAX_32:
+                extra = struct.pack("<2HQ", 1, 8, offset)
+                offset = _MAX_32
+                version = 45
+            yield self._emit(_CENTRAL_HEADER.pack(b"PK\x01\x02", version, version, flags, compress_type,
+                                                  dos_time[0], dos_time[1], crc, compress_size, file_size,
+                                                  len(name), len(extra), 0, 0, 0, 0o644 << 16, offset) + name + extra)
+        cd_size = self._offset - cd_offset
+        count = len(self._entries)
+        if count > _MAX_16 or cd_offset > _MAX_32 or cd_size > _MAX_32:
+            zip64_offset = self._offset
+            yield self._emit(_ZIP64_END.pack(b"PK\x06\x06", _ZIP64_END.size - 12, 45, 45, 0, 0,
+                                             count, count, cd_size, cd_offset))
+            yield self._emit(_ZIP64_LOCATOR.pack(b"PK\x06\x07", 0, zip64_offset, 1))
+            count = min(count, _MAX_16)
+            cd_size = min(cd_size, _MAX_32)
+            cd_offset = min(cd_offset, _MAX_32)
+        yield self._emit(_END.pack(b"PK\x05\x06", 0, 0, count, count, cd_size, cd_offset, 0))
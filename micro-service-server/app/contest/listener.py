@@ -0,0 +1,31 @@
+import asyncio
+import json
+from collections import defaultdict
+
+import app.contest.repository as contest_repo
+import app.contest.service as contest_serv
+from app.config.database import get_session
+from app.utils.logging import logger
+
+
+async def contest_rank_listener():
+    logger.info(f"contest rank listener waiting on {contest_repo.RANK_UPDATE_QUEUE_KEY}")
+    while True:
+        try:
+            updates = await contest_repo.pop_rank_updates()
+            if not updates:
+                continue
+            # 같은 대회의 갱신은 모아서 snapshot을 한 번만 다시 만든다
+            user_ids = defaultdict(set)
+            for update in updates:
+                data = json.loads(update)
+                user_ids[int(data["contest_id"])].add(int(data["user_id"]))
+            for contest_id, users in user_ids.items():
+                async for db in get_session():
+                    await contest_serv.apply_rank_updates(contest_id, users, db)
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"contest rank snapshot update failed: {e}")
+            await asyncio.sleep(1)
@@ -1,10 +1,24 @@
+from contextlib import asynccontextmanager
+
 from sqlalchemy import *
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import Dict, Iterable, List, Optional
+from app.config.redis import get_redis
 from app.contest.models import Contest, ACMContestRank, OIContestRank
 from app.contest_user.models import ContestUser
 from app.user.models import User, UserData
 
+# 미리 직렬화한 랭킹 페이지 snapshot
+# - rows: user_id -> {"sort": 정렬 key, "rank": 관리자용 ContestRankDTO}
+# - admin / public: "all", "1", "2", ... -> 페이지 JSON, "pages" -> 페이지 수
+RANK_SNAPSHOT_PREFIX = "contest_rank_snapshot"
+RANK_SNAPSHOT_TTL = 24 * 60 * 60
+# OnlineJudge(judge.dispatcher)가 채점 후 {"contest_id", "user_id"}를 push하는 list
+RANK_UPDATE_QUEUE_KEY = "contest_rank_updates"
+RANK_UPDATE_BATCH_SIZE = 500
+# 페이지를 다시 만드는 동안 잡는 대회별 lock, 모든 워커가 listener를 돌리므로 read-modify-write를 직렬화한다
+RANK_SNAPSHOT_LOCK_TIMEOUT = 60
+
 
 async def get_participated_contest_by_user_id(user_id: int, db: AsyncSession) -> List[Contest]:
     result = await db.execute(select(Contest)
@@ -13,13 +27,81 @@ async def get_participated_contest_by_user_id(user_id: int, db: AsyncSession) ->
     return result.scalars().all()
 
 
-async def get_acm_contest_rank(contest_id: int, db: AsyncSession):
+async def get_acm_contest_rank(contest_id: int, db: AsyncSession, user_ids: Optional[Iterable[int]] = None):
     query = select(ACMContestRank, User, UserData).join(User, ACMContestRank.user_id == User.id).outerjoin(UserData, User.id == UserData.user_id).where(ACMContestRank.contest_id == contest_id).order_by(desc(ACMContestRank.accepted_number), ACMContestRank.total_time)
+    if user_ids is not None:
+        query = query.where(ACMContestRank.user_id.in_(list(user_ids)))
     result = await db.execute(query)
     return result.all()
 
 
-async def get_oi_contest_rank(contest_id: int, db: AsyncSession):
+async def get_oi_contest_rank(contest_id: int, db: AsyncSession, user_ids: Optional[Iterable[int]] = None):
     query = select(OIContestRank, User, UserData).join(User, OIContestRank.user_id == User.id).outerjoin(UserData, User.id == UserData.user_id).where(OIContestRank.contest_id == contest_id).order_by(desc(OIContestRank.total_score))
+    if user_ids is not None:
+        query = query.where(OIContestRank.user_id.in_(list(user_ids)))
     result = await db.execute(query)
     return result.all()
+
+
+def _rank_snapshot_key(contest_id: int, variant: str) -> str:
+    return f"{RANK_SNAPSHOT_PREFIX}:{contest_id}:{variant}"
+
+
+async def get_rank_snapshot_page(contest_id: int, variant: str, field: str):
+    """
+    (페이지 JSON, 페이지 수, public freeze 해제 시각) 반환, snapshot이 없으면 페이지 수는 None
+    """
+    redis = await get_redis()
+    return await redis.hmget(_rank_snapshot_key(contest_id, variant), field, "pages", "unfreeze_at")
+
+
+async def rank_snapshot_exists(contest_id: int) -> bool:
+    # rows hash는 참가자가 없으면 만들어지지 않으므로 페이지 hash의 "pages"로 판단한다
+    redis = await get_redis()
+    return bool(await redis.hexists(_rank_snapshot_key(contest_id, "admin"), "pages"))
+
+
+@asynccontextmanager
+async def rank_snapshot_lock(contest_id: int):
+    redis = await get_redis()
+    async with redis.lock(_rank_snapshot_key(contest_id, "lock"), timeout=RANK_SNAPSHOT_LOCK_TIMEOUT,
+                          blocking_timeout=RANK_SNAPSHOT_LOCK_TIMEOUT):
+        yield
+
+
+async def get_rank_snapshot_rows(contest_id: int) -> Dict[str, str]:
+    redis = await get_redis()
+    return await redis.hgetall(_rank_snapshot_key(contest_id, "rows"))
+
+
+async def save_rank_snapshot(contest_id: int, rows: Dict[str, str], removed: Iterable[str],
+                             pages: Dict[str, Dict[str, str]], unfreeze_at: Optional[float] = None):
+    redis = await get_redis()
+    rows_key = _rank_snapshot_key(contest_id, "rows")
+    pipe = redis.pipeline(transaction=True)
+    removed = list(removed)
+    if removed:
+        pipe.hdel(rows_key, *removed)
+    if rows:
+        pipe.hset(rows_key, mapping=rows)
+    pipe.expire(rows_key, RANK_SNAPSHOT_TTL)
+    for variant, fields in pages.items():
+        key = _rank_snapshot_key(contest_id, variant)
+        pipe.delete(key)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, RANK_SNAPSHOT_TTL)
+    if unfreeze_at is not None:
+        pipe.hset(_rank_snapshot_key(contest_id, "public"), "unfreeze_at", unfreeze_at)
+    await pipe.execute()
+
+
+async def pop_rank_updates(timeout: int = 5) -> List[str]:
+    redis = await get_redis()
+    item = await redis.blpop(RANK_UPDATE_QUEUE_KEY, timeout=timeout)
+    if item is None:
+        return []
+    pipe = redis.pipeline(transaction=True)
+    pipe.lrange(RANK_UPDATE_QUEUE_KEY, 0, RANK_UPDATE_BATCH_SIZE - 1)
+    pipe.ltrim(RANK_UPDATE_QUEUE_KEY, RANK_UPDATE_BATCH_SIZE, -1)
+    rest, _ = await pipe.execute()
+    return [item[1], *rest]
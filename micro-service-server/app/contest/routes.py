@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.contest.service as serv
@@ -23,14 +23,16 @@ async def get_participated_contest_by_user(
 @router.get("/rank", response_model=List[ContestRankDTO])
 async def get_contest_rank(
         contest_id: int,
+        page: Optional[int] = Query(None, ge=1),
         db: AsyncSession = Depends(get_session)):
-    return await serv.get_contest_rank_public(contest_id, db)
+    return await serv.get_contest_rank_public(contest_id, db, page)
 
 
 @authorize_roles("Admin")
 @router.get("/rank/all", response_model=List[ContestRankDTO])
 async def get_contest_rank_all_data(
         contest_id: int,
+        page: Optional[int] = Query(None, ge=1),
         userdata: UserData = Depends(get_userdata),
         db: AsyncSession = Depends(get_session)):
-    return await serv.get_contest_rank_admin(contest_id, db)
+    return await serv.get_contest_rank_admin(contest_id, db, page)
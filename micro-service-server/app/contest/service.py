@@ -1,3 +1,12 @@
+import json
+import math
+import os
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import app.contest.repository as contest_repo
@@ -7,6 +16,11 @@ from app.user.schemas import UserData
 from app.contest.models import Contest
 from app.utils.logging import logger
 
+load_dotenv()
+# 종료 N분 전부터 public 랭킹을 고정, 0이면 고정하지 않음
+CONTEST_RANK_FREEZE_MINUTES = int(os.getenv("CONTEST_RANK_FREEZE_MINUTES", "0"))
+CONTEST_RANK_PAGE_SIZE = int(os.getenv("CONTEST_RANK_PAGE_SIZE", "50"))
+
 
 async def get_participated_contest_by_user(user_date: UserData, db: AsyncSession):
     contests = await contest_repo.get_participated_contest_by_user_id(user_date.user_id, db)
@@ -21,69 +35,145 @@ async def get_participated_contest_by_user(user_date: UserData, db: AsyncSession
     ]
 
 
-async def _get_contest_and_raw_ranks(contest_id: int, db: AsyncSession):
-    contest = await db.get(Contest, contest_id)
-    if not contest:
-        logger.warning(f"Contest not found: {contest_id}")
-        return None, None
-
-    if contest.rule_type == "ACM":
-        raw_ranks = await contest_repo.get_acm_contest_rank(contest_id, db)
-    else:
-        raw_ranks = await contest_repo.get_oi_contest_rank(contest_id, db)
-
-    return contest, raw_ranks
-
-
-async def get_contest_rank_public(contest_id: int, db: AsyncSession):
+async def get_contest_rank_public(contest_id: int, db: AsyncSession, page: Optional[int] = None):
     logger.info(f"Fetching public rank for contest {contest_id}")
-    return await _get_contest_ranks(contest_id, True, db)
+    return await _get_contest_rank_snapshot(contest_id, "public", page, db)
 
 
-async def get_contest_rank_admin(contest_id: int, db: AsyncSession):
+async def get_contest_rank_admin(contest_id: int, db: AsyncSession, page: Optional[int] = None):
     logger.info(f"Fetching admin rank for contest {contest_id}")
-    return await _get_contest_ranks(contest_id, False, db)
-
-
-async def _get_contest_ranks(contest_id: int, anonymize_username: bool, db: AsyncSession):
-    contest, raw_ranks = await _get_contest_and_raw_ranks(contest_id, db)
+    return await _get_contest_rank_snapshot(contest_id, "admin", page, db)
+
+
+async def _get_contest_rank_snapshot(contest_id: int, variant: str, page: Optional[int], db: AsyncSession):
+    """
+    미리 직렬화한 페이지를 그대로 반환, 보통 redis 조회 한 번으로 끝난다
+    """
+    field = "all" if page is None else str(page)
+    data, pages, unfreeze_at = await contest_repo.get_rank_snapshot_page(contest_id, variant, field)
+    if pages is None:
+        contest = await db.get(Contest, contest_id)
+        if not contest:
+            logger.warning(f"Contest not found: {contest_id}")
+            return None
+        async with contest_repo.rank_snapshot_lock(contest_id):
+            # lock을 기다리는 동안 다른 요청이 이미 만들었을 수 있다
+            if not await contest_repo.rank_snapshot_exists(contest_id):
+                await rebuild_rank_snapshot(contest, db)
+        data, pages, unfreeze_at = await contest_repo.get_rank_snapshot_page(contest_id, variant, field)
+    elif unfreeze_at is not None and time.time() >= float(unfreeze_at):
+        # 대회가 끝나면 고정됐던 public 랭킹을 최신 rows로 다시 만든다
+        async with contest_repo.rank_snapshot_lock(contest_id):
+            rows = await contest_repo.get_rank_snapshot_rows(contest_id)
+            await contest_repo.save_rank_snapshot(contest_id, {}, [], {"public": _render_pages(rows.values(), True)})
+        data, pages, unfreeze_at = await contest_repo.get_rank_snapshot_page(contest_id, variant, field)
+    return Response(content=data or "[]", media_type="application/json")
+
+
+async def rebuild_rank_snapshot(contest: Contest, db: AsyncSession):
+    rows = await _build_rank_rows(contest, None, db)
+    snapshot_rows = await contest_repo.get_rank_snapshot_rows(contest.id)
+    await _save_rank_snapshot(contest, rows, set(snapshot_rows) - set(rows), rows)
+
+
+async def apply_rank_updates(contest_id: int, user_ids: Iterable[int], db: AsyncSession):
+    """
+    채점이 끝난 사용자들의 row만 DB에서 다시 계산하고 페이지를 다시 직렬화
+    """
+    contest = await db.get(Contest, contest_id)
     if not contest:
-        return None
-
-    # Pre-fetch scores for all users in the contest
-    scores_list = await submission_repo.fetch_contest_user_scores(db, contest_id)
+        return
+    # 여러 워커의 listener가 같은 대회 페이지를 동시에 덮어쓰지 않도록 대회별로 직렬화한다
+    async with contest_repo.rank_snapshot_lock(contest_id):
+        if not await contest_repo.rank_snapshot_exists(contest_id):
+            # snapshot이 없으면 다음 조회 때 전체를 만든다
+            return
+        # 참가자가 아직 없는 snapshot이면 rows는 비어 있다
+        snapshot_rows = await contest_repo.get_rank_snapshot_rows(contest_id)
+        user_ids = [str(user_id) for user_id in user_ids]
+        rows = await _build_rank_rows(contest, user_ids, db)
+        removed = [user_id for user_id in user_ids if user_id not in rows]
+        for user_id in removed:
+            snapshot_rows.pop(user_id, None)
+        snapshot_rows.update(rows)
+        await _save_rank_snapshot(contest, rows, removed, snapshot_rows)
+
+
+async def _build_rank_rows(contest: Contest, user_ids: Optional[List[str]], db: AsyncSession) -> Dict[str, str]:
+    user_ids = None if user_ids is None else [int(user_id) for user_id in user_ids]
+    if contest.rule_type == "ACM":
+        raw_ranks = await contest_repo.get_acm_contest_rank(contest.id, db, user_ids)
+    else:
+        raw_ranks = await contest_repo.get_oi_contest_rank(contest.id, db, user_ids)
+    scores_list = await submission_repo.fetch_contest_user_scores_sql(db, contest.id, user_ids)
     score_map = {item["user_id"]: item["total_score"] for item in scores_list}
 
-    result: list[ContestRankDTO] = []
-
+    rows = {}
     for rank, user, userdata in raw_ranks:
-        user_dto = _build_user_dto(user, userdata, anonymize_username)
-        
-        # Get score from map, default to 0
-        total_score = score_map.get(user.id, 0)
-
         dto = ContestRankDTO(
-            user=user_dto,
+            user=_build_user_dto(user, userdata, False),
             submission_info=rank.submission_info,
-            total_score=total_score,
+            total_score=score_map.get(user.id, 0),
             accepted_number=getattr(rank, "accepted_number", 0),
             total_time=getattr(rank, "total_time", 0),
         )
-        result.append(dto)
+        # 정렬 순서는 기존 조회 쿼리와 같다
+        if contest.rule_type == "ACM":
+            sort_key = [-(rank.accepted_number or 0), rank.total_time or 0]
+        else:
+            sort_key = [-(rank.total_score or 0)]
+        rows[str(user.id)] = json.dumps({"sort": sort_key, "rank": dto.model_dump(mode="json")})
+    return rows
+
+
+async def _save_rank_snapshot(contest: Contest, rows: Dict[str, str], removed: Iterable[str], snapshot_rows: Dict[str, str]):
+    pages = {"admin": _render_pages(snapshot_rows.values(), False)}
+    unfreeze_at = None
+    if _is_rank_frozen(contest):
+        # freeze 구간에는 public 페이지를 갱신하지 않는다
+        # snapshot이 처음 만들어지는 경우에는 현재 데이터로 public 페이지를 만든다
+        snapshot = await contest_repo.get_rank_snapshot_page(contest.id, "public", "all")
+        if snapshot[1] is None:
+            pages["public"] = _render_pages(snapshot_rows.values(), True)
+        unfreeze_at = contest.end_time.timestamp()
+    else:
+        pages["public"] = _render_pages(snapshot_rows.values(), True)
+    await contest_repo.save_rank_snapshot(contest.id, rows, removed, pages, unfreeze_at)
 
-    return result
 
+def _is_rank_frozen(contest: Contest) -> bool:
+    if not CONTEST_RANK_FREEZE_MINUTES:
+        return False
+    now = time.time()
+    freeze_at = (contest.end_time - timedelta(minutes=CONTEST_RANK_FREEZE_MINUTES)).timestamp()
+    return freeze_at <= now < contest.end_time.timestamp()
 
-def _build_user_dto(user, userdata, anonymize_username: bool) -> UserSimpleDTO:
+
+def _render_pages(rows: Iterable[str], anonymize_username: bool) -> Dict[str, str]:
+    items = sorted((json.loads(row) for row in rows), key=lambda item: item["sort"])
+    ranks = [item["rank"] for item in items]
     if anonymize_username:
-        if user.username:
-            masked = user.username[0] + "*" * (len(user.username) - 1)
-        else:
-            masked = "Unknown"
+        ranks = [{**rank, "user": {**rank["user"],
+                                   "username": _mask_username(rank["user"]["username"]),
+                                   "real_name": None}}
+                 for rank in ranks]
+    pages = {"all": json.dumps(ranks), "pages": math.ceil(len(ranks) / CONTEST_RANK_PAGE_SIZE)}
+    for index in range(0, len(ranks), CONTEST_RANK_PAGE_SIZE):
+        pages[str(index // CONTEST_RANK_PAGE_SIZE + 1)] = json.dumps(ranks[index:index + CONTEST_RANK_PAGE_SIZE])
+    return pages
+
+
+def _mask_username(username: Optional[str]) -> str:
+    if username:
+        return username[0] + "*" * (len(username) - 1)
+    return "Unknown"
 
+
+def _build_user_dto(user, userdata, anonymize_username: bool) -> UserSimpleDTO:
+    if anonymize_username:
         return UserSimpleDTO(
             id=user.id,
-            username=masked,
+            username=_mask_username(user.username),
             real_name=None,
             student_id=userdata.student_id if userdata else None,
         )
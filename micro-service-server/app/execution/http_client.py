@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app.utils.logging import logger
+
+# 판정 서버 하나당 연결 수 제한. 판정 서버(gunicorn)는 HTTP/1.1만 지원하므로 keep-alive 연결을 재사용한다
+JUDGE_HTTP_MAX_CONNECTIONS = int(os.getenv("JUDGE_HTTP_MAX_CONNECTIONS", "32"))
+JUDGE_HTTP_MAX_KEEPALIVE = int(os.getenv("JUDGE_HTTP_MAX_KEEPALIVE", "16"))
+JUDGE_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("JUDGE_HTTP_KEEPALIVE_EXPIRY", "60"))
+JUDGE_HTTP_TIMEOUT = float(os.getenv("JUDGE_HTTP_TIMEOUT", "30"))
+# 판정 서버가 지원하는 실행 방식을 기억하는 시간. 판정 서버가 업데이트되면 이 시간 뒤에 다시 확인한다
+JUDGE_CAPABILITY_TTL_SECONDS = int(os.getenv("JUDGE_CAPABILITY_TTL_SECONDS", "600"))
+
+
+class JudgeHttpClientPool:
+    """
+    판정 서버 service_url마다 하나씩 유지하는 httpx.AsyncClient.
+    app.main.lifespan에서 닫고, 요청마다 클라이언트를 만들면서 생기는 TCP 연결 비용을 없앤다.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        # service_url -> (동작하는 실행 방식, 만료 시각)
+        self._capabilities: Dict[str, Tuple[str, float]] = {}
+
+    def get(self, service_url: str) -> httpx.AsyncClient:
+        base_url = service_url.rstrip("/")
+        client = self._clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                timeout=JUDGE_HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=JUDGE_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=JUDGE_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=JUDGE_HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+            self._clients[base_url] = client
+        return client
+
+    def get_capability(self, service_url: str) -> Optional[str]:
+        item = self._capabilities.get(service_url.rstrip("/"))
+        if item is None or item[1] < time.monotonic():
+            return None
+        return item[0]
+
+    def set_capability(self, service_url: str, variant: str):
+        base_url = service_url.rstrip("/")
+        if self.get_capability(base_url) != variant:
+            logger.info(f"judge server {base_url} run variant: {variant}")
+        self._capabilities[base_url] = (variant, time.monotonic() + JUDGE_CAPABILITY_TTL_SECONDS)
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+judge_http_clients = JudgeHttpClientPool()
@@ -1,9 +1,11 @@
 from __future__ import annotations
+from typing import List, Optional
 from pydantic import BaseModel, Field
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.config.database import get_session
-from app.execution.service import ExecutionService
+from app.execution.service import MAX_SAMPLE_CASES, ExecutionService
+from app.problem import service as problem_service
 from app.security.deps import get_userdata
 from app.user.schemas import UserData
 from app.utils.security import authorize_roles
@@ -34,3 +36,47 @@ async def run_code(
         max_memory_mb=MAX_MEMORY_MB,
     )
     return result
+
+
+class RunSamplesRequest(BaseModel):
+    language: str = Field(..., description="Language name : Python3, C, C++, JavaScript, Golang")
+    code: str = Field(..., description="Source code to execute")
+    problem_id: Optional[int] = Field(None, description="Run against the samples of this problem")
+    inputs: Optional[List[str]] = Field(None, description="Stdins to run when problem_id is not given")
+
+
+@router.post("/run-samples")
+async def run_samples(
+        req: RunSamplesRequest,
+        user_date: UserData = Depends(get_userdata),  # need to login
+        session: AsyncSession = Depends(get_session)):
+    max_cpu_time, max_memory_mb = MAX_CPU_TIME, MAX_MEMORY_MB
+    compare_output = True
+    if req.problem_id is not None:
+        problem = await problem_service.get_problem_for_samples(req.problem_id, user_date, session)
+        if problem is None:
+            raise HTTPException(status_code=404, detail="Problem does not exist")
+        samples = [{"input": item.get("input", ""), "output": item.get("output", "")} for item in problem.samples or []]
+        # 문제의 시간/메모리 제한으로 판정한다
+        max_cpu_time = min(problem.time_limit, MAX_CPU_TIME)
+        max_memory_mb = min(problem.memory_limit, MAX_MEMORY_MB)
+        # special judge 문제는 출력 비교로 판정할 수 없다
+        compare_output = not problem.spj
+    elif req.inputs is not None:
+        samples = [{"input": stdin, "output": None} for stdin in req.inputs]
+    else:
+        raise HTTPException(status_code=400, detail="problem_id or inputs is required")
+    if not samples:
+        raise HTTPException(status_code=400, detail="No samples to run")
+    if len(samples) > MAX_SAMPLE_CASES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SAMPLE_CASES} samples can be run at once")
+
+    svc = ExecutionService(session)
+    return await svc.run_samples(
+        language=req.language,
+        src=req.code,
+        samples=samples,
+        max_cpu_time=max_cpu_time,
+        max_memory_mb=max_memory_mb,
+        compare_output=compare_output,
+    )
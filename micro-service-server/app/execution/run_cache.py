@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config.redis import get_redis
+from app.utils.logging import logger
+
+EXECUTION_RESULT_PREFIX = "execution_result"
+# 같은 코드를 반복해서 실행할 때만 재사용하도록 짧게 둔다
+EXECUTION_RESULT_CACHE_TTL_SECONDS = int(os.getenv("EXECUTION_RESULT_CACHE_TTL_SECONDS", "60"))
+# 출력이 큰 결과는 캐시하지 않는다
+EXECUTION_RESULT_CACHE_MAX_BYTES = int(os.getenv("EXECUTION_RESULT_CACHE_MAX_BYTES", str(64 * 1024)))
+
+# 판정 서버 결과 코드 중 실행 환경(부하)에 따라 달라질 수 있는 것: CPU/REAL 시간 초과, SYSTEM_ERROR
+_NONDETERMINISTIC_RESULTS = {1, 2, 5}
+
+# key -> 진행 중인 판정 요청. 같은 요청은 하나의 판정 서버 호출 결과를 나눠 받는다
+_in_flight: Dict[str, asyncio.Task] = {}
+
+
+def run_key(**params: Any) -> str:
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _is_deterministic(result: Any) -> bool:
+    if not isinstance(result, dict):
+        return False
+    err = result.get("err")
+    if err == "CompileError":
+        return True
+    # 판정 서버 오류, 연결 실패 등은 다시 시도해야 한다
+    if err is not None:
+        return False
+    data = result.get("data")
+    items = data if isinstance(data, list) else [data]
+    return all(not isinstance(item, dict) or item.get("result") not in _NONDETERMINISTIC_RESULTS for item in items)
+
+
+async def get_cached_result(key: str) -> Optional[Dict[str, Any]]:
+    if EXECUTION_RESULT_CACHE_TTL_SECONDS <= 0:
+        return None
+    redis = await get_redis()
+    cached = await redis.get(f"{EXECUTION_RESULT_PREFIX}:{key}")
+    return json.loads(cached) if cached is not None else None
+
+
+async def cache_result(key: str, result: Any):
+    if EXECUTION_RESULT_CACHE_TTL_SECONDS <= 0 or not _is_deterministic(result):
+        return
+    payload = json.dumps(result)
+    if len(payload) > EXECUTION_RESULT_CACHE_MAX_BYTES:
+        return
+    redis = await get_redis()
+    await redis.set(f"{EXECUTION_RESULT_PREFIX}:{key}", payload, ex=EXECUTION_RESULT_CACHE_TTL_SECONDS)
+
+
+async def run_once(key: str, factory: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    redis에 캐시된 결과가 있으면 반환하고, 없으면 같은 key의 진행 중인 요청에 합류하거나 factory를 실행한다.
+    먼저 온 요청이 취소되어도 판정은 계속되고 기다리던 다른 요청이 결과를 받는다.
+    그래서 factory는 요청 세션처럼 먼저 온 요청이 끝나면 닫히는 객체를 쓰면 안 된다.
+    """
+    cached = await get_cached_result(key)
+    if cached is not None:
+        return cached
+
+    task = _in_flight.get(key)
+    if task is None:
+        async def run():
+            result = await factory()
+            try:
+                await cache_result(key, result)
+            except Exception as e:
+                logger.error(f"execution result cache failed: {e}")
+            return result
+
+        task = asyncio.ensure_future(run())
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await asyncio.shield(task)
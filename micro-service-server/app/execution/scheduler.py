@@ -1,14 +1,47 @@
 from __future__ import annotations
 
+import asyncio
+import os
+import time
+import uuid
 from contextlib import AbstractAsyncContextManager
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, List, Optional
 
-from sqlalchemy import select, update
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 
-from app.judge_server.models import JudgeServer
 from app.config.database import SessionLocal
+from app.config.redis import get_redis
+from app.judge_server.models import JudgeServer
+
+# OnlineJudge judge.dispatcher.RedisChooseJudgeServer와 같은 redis 키와 lua 스크립트를 사용해서
+# 두 서비스의 실행이 같은 판정 서버 슬롯을 나눠 쓴다. zset의 member는 임대 token, score는 만료 시각이다
+JUDGE_SERVER_LEASE_PREFIX = "judge_server_lease"
+# OnlineJudge는 판정 요청의 연결 + 읽기 timeout보다 길게(기본 903초) 잡는다. key의 ttl은 lua 스크립트에서 늘리기만 한다
+JUDGE_SERVER_LEASE_TTL = int(os.getenv("JUDGE_SERVER_LEASE_TTL", "900"))
+# 판정 서버 목록은 이 주기로만 DB에서 다시 읽는다. heartbeat 판정(6초)보다 충분히 짧게 둔다
+JUDGE_SERVER_REFRESH_SECONDS = float(os.getenv("JUDGE_SERVER_REFRESH_SECONDS", "2"))
+
+# KEYS: 후보 서버의 임대 zset
+# ARGV: now, 임대 만료 시각, 임대 token, key ttl, 이후 서버별 용량
+# 선택한 서버의 KEYS 인덱스(1부터)를 반환하고, 빈 슬롯이 없으면 0
+ACQUIRE_JUDGE_SERVER_LUA = """
+local best, best_load = 0, -1
+for i, key in ipairs(KEYS) do
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", ARGV[1])
+    local load = redis.call("ZCARD", key)
+    if load < tonumber(ARGV[i + 4]) and (best_load == -1 or load < best_load) then
+        best, best_load = i, load
+    end
+end
+if best > 0 then
+    redis.call("ZADD", KEYS[best], ARGV[2], ARGV[3])
+    if redis.call("TTL", KEYS[best]) < tonumber(ARGV[4]) then
+        redis.call("EXPIRE", KEYS[best], ARGV[4])
+    end
+end
+return best
+"""
 
 
 @dataclass
@@ -16,54 +49,115 @@ class SelectedServer:
     id: int
     service_url: str
     cpu_core: int
-    task_number: int
+
+
+def _lease_key(server_id: int) -> str:
+    return f"{JUDGE_SERVER_LEASE_PREFIX}:{server_id}"
+
+
+def _capacity(server: JudgeServer) -> int:
+    # 기존 task_number <= cpu_core * 2 조건과 같은 동시 실행 수
+    return (server.cpu_core or 0) * 2 + 1
+
+
+class JudgeServerRegistry:
+    """
+    프로세스 안에서 공유하는 판정 서버 목록과 서버별 asyncio.Semaphore.
+    목록은 JUDGE_SERVER_REFRESH_SECONDS마다 한 번만 DB에서 읽고, 슬롯은 redis 임대로 프로세스 간에 맞춘다.
+    Semaphore는 한 프로세스가 한 서버의 슬롯을 모두 차지하고 redis를 계속 두드리지 않게 막는다.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._servers: List[JudgeServer] = []
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+        self._capacities: Dict[int, int] = {}
+        self._refreshed_at = 0.0
+        self._script = None
+
+    async def _refresh(self):
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(JudgeServer).where(JudgeServer.is_disabled.is_(False)).order_by(JudgeServer.id)
+            )
+            servers = result.scalars().all()
+        for server in servers:
+            capacity = _capacity(server)
+            # cpu_core가 바뀐 서버만 Semaphore를 새로 만든다. 이미 임대 중인 슬롯은 이전 Semaphore에 반납된다
+            if self._capacities.get(server.id) != capacity:
+                self._semaphores[server.id] = asyncio.Semaphore(capacity)
+                self._capacities[server.id] = capacity
+        self._servers = servers
+
+    async def get_servers(self) -> List[JudgeServer]:
+        if time.monotonic() - self._refreshed_at >= JUDGE_SERVER_REFRESH_SECONDS:
+            async with self._lock:
+                if time.monotonic() - self._refreshed_at >= JUDGE_SERVER_REFRESH_SECONDS:
+                    await self._refresh()
+                    self._refreshed_at = time.monotonic()
+        # heartbeat 상태는 캐시된 last_heartbeat로 매번 다시 판단한다
+        return [s for s in self._servers if s.status == "normal"]
+
+    async def acquire(self, token: str):
+        """
+        (server, semaphore)를 반환하고, 빈 슬롯이 없으면 (None, None)
+        """
+        servers = [s for s in await self.get_servers() if not self._semaphores[s.id].locked()]
+        if not servers:
+            return None, None
+        if self._script is None:
+            self._script = (await get_redis()).register_script(ACQUIRE_JUDGE_SERVER_LUA)
+        now = time.time()
+        index = await self._script(
+            keys=[_lease_key(s.id) for s in servers],
+            args=[now, now + JUDGE_SERVER_LEASE_TTL, token, JUDGE_SERVER_LEASE_TTL] + [_capacity(s) for s in servers],
+        )
+        if not index:
+            return None, None
+        server = servers[int(index) - 1]
+        semaphore = self._semaphores[server.id]
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            await self.release(server.id, token)
+            raise
+        return server, semaphore
+
+    @staticmethod
+    async def release(server_id: int, token: str):
+        redis = await get_redis()
+        await redis.zrem(_lease_key(server_id), token)
+
+
+judge_server_registry = JudgeServerRegistry()
 
 
 class ChooseJudgeServerAsync(AbstractAsyncContextManager):
-    def __init__(self, session: Optional[AsyncSession] = None):
-        # A dedicated short-lived session is used for selection/increment/decrement
-        # to avoid nested transaction issues with a caller-held session.
-        self._external_session = session
+    """
+    판정 서버 하나의 슬롯을 임대한다. 실행 경로에서는 DB를 건드리지 않는다 (목록 갱신 제외).
+    """
+
+    def __init__(self, registry: Optional[JudgeServerRegistry] = None):
+        self._registry = registry or judge_server_registry
+        self._token = uuid.uuid4().hex
+        self._semaphore: Optional[asyncio.Semaphore] = None
         self.server: Optional[SelectedServer] = None
 
     async def __aenter__(self) -> Optional[SelectedServer]:
-        # Single transactional selection + increment
-        async with SessionLocal() as session:
-            async with session.begin():
-                stmt = (
-                    select(JudgeServer)
-                    .where(JudgeServer.is_disabled.is_(False))
-                    .order_by(JudgeServer.task_number)
-                    .with_for_update()
-                )
-                result = await session.execute(stmt)
-                servers = [s for s in result.scalars().all() if s.status == "normal"]
-
-                for s in servers:
-                    # Use same heuristic: allow up to cpu_core * 2 concurrent tasks
-                    if (s.task_number or 0) <= (s.cpu_core or 0) * 2:
-                        # Atomic increment using UPDATE judge_server SET task_number = task_number + 1 WHERE id = ...
-                        await session.execute(
-                            update(JudgeServer)
-                            .where(JudgeServer.id == s.id)
-                            .values(task_number=JudgeServer.task_number + 1)
-                        )
-                        self.server = SelectedServer(
-                            id=s.id,
-                            service_url=s.service_url,
-                            cpu_core=s.cpu_core,
-                            task_number=(s.task_number or 0) + 1,
-                        )
-                        return self.server
-        return None
+        server, self._semaphore = await self._registry.acquire(self._token)
+        if server is None:
+            return None
+        self.server = SelectedServer(
+            id=server.id,
+            service_url=server.service_url,
+            cpu_core=server.cpu_core,
+        )
+        return self.server
 
     async def __aexit__(self, exc_type, exc, tb):
         if self.server:
-            async with SessionLocal() as session:
-                async with session.begin():
-                    await session.execute(
-                        update(JudgeServer)
-                        .where(JudgeServer.id == self.server.id)
-                        .values(task_number=JudgeServer.task_number - 1)
-                    )
+            try:
+                await self._registry.release(self.server.id, self._token)
+            finally:
+                self._semaphore.release()
         return False
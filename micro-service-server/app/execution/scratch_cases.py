@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from app.utils.logging import logger
+
+# /judge로 실행할 때 쓰는 임시 테스트 케이스. 판정 서버가 같은 경로를 읽으므로 TEST_CASE_DATA_PATH 아래에 둔다
+# 이름이 32자리 id가 아니므로 OnlineJudge의 TestCasePruneAPI가 문제 테스트 케이스로 착각하지 않는다
+SCRATCH_PREFIX = "run-"
+SCRATCH_TTL_SECONDS = int(os.getenv("SCRATCH_TEST_CASE_TTL_SECONDS", "3600"))
+SCRATCH_MAX_ENTRIES = int(os.getenv("SCRATCH_TEST_CASE_MAX_ENTRIES", "2000"))
+SCRATCH_REAP_INTERVAL_SECONDS = int(os.getenv("SCRATCH_TEST_CASE_REAP_INTERVAL_SECONDS", "300"))
+
+
+def scratch_base() -> str:
+    return os.getenv("TEST_CASE_DATA_PATH", "/test_case")
+
+
+def scratch_case_id(cases: List[Tuple[str, str]]) -> str:
+    payload = json.dumps(cases, ensure_ascii=False)
+    return SCRATCH_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _write_case_files(case_dir: str, cases: List[Tuple[str, str]]):
+    test_cases = {}
+    for index, (stdin, expected) in enumerate(cases, 1):
+        output = expected.replace("\r\n", "\n").encode("utf-8")
+        with open(os.path.join(case_dir, f"{index}.in"), "w", encoding="utf-8") as f:
+            f.write(stdin)
+        with open(os.path.join(case_dir, f"{index}.out"), "wb") as f:
+            f.write(output)
+        # OnlineJudge의 테스트 케이스 업로드와 같은 방식의 md5
+        test_cases[str(index)] = {
+            "input_name": f"{index}.in",
+            "output_name": f"{index}.out",
+            "output_md5": hashlib.md5(output).hexdigest(),
+            "stripped_output_md5": hashlib.md5(output.rstrip()).hexdigest(),
+        }
+    with open(os.path.join(case_dir, "info"), "w", encoding="utf-8") as f:
+        json.dump({"spj": False, "test_cases": test_cases}, f)
+
+
+def prepare_scratch_case(cases: List[Tuple[str, str]]) -> str:
+    """
+    [(입력, 기대 출력)] 내용을 키로 하는 테스트 케이스 디렉터리를 만들고 test_case_id를 반환한다.
+    같은 내용이면 기존 디렉터리를 재사용하고 mtime만 갱신한다 (LRU 정리 기준).
+    """
+    case_id = scratch_case_id(cases)
+    case_dir = os.path.join(scratch_base(), case_id)
+    try:
+        os.utime(case_dir)
+        return case_id
+    except FileNotFoundError:
+        pass
+
+    # 임시 디렉터리에 모두 쓴 뒤 rename 해서 판정 서버가 쓰다 만 디렉터리를 읽지 않게 한다
+    tmp_dir = f"{case_dir}.{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_dir)
+    try:
+        _write_case_files(tmp_dir, cases)
+        try:
+            os.rename(tmp_dir, case_dir)
+        except OSError:
+            # 동시에 같은 내용으로 만든 디렉터리가 이미 있다
+            if not os.path.isdir(case_dir):
+                raise
+            os.utime(case_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return case_id
+
+
+def _scan() -> List[Tuple[float, str, int]]:
+    entries = []
+    try:
+        dirs = [d for d in os.scandir(scratch_base()) if d.name.startswith(SCRATCH_PREFIX) and d.is_dir()]
+    except FileNotFoundError:
+        return entries
+    for d in dirs:
+        try:
+            size = sum(f.stat().st_size for f in os.scandir(d.path))
+            entries.append((d.stat().st_mtime, d.path, size))
+        except FileNotFoundError:
+            continue
+    return entries
+
+
+def scratch_stats() -> Dict[str, int]:
+    entries = _scan()
+    return {"count": len(entries), "bytes": sum(size for _, _, size in entries)}
+
+
+def reap_scratch_cases() -> int:
+    """
+    TTL이 지났거나 SCRATCH_MAX_ENTRIES를 넘는 오래된 디렉터리를 지우고 지운 개수를 반환한다.
+    """
+    entries = sorted(_scan())
+    expire_before = time.time() - SCRATCH_TTL_SECONDS
+    over = max(len(entries) - SCRATCH_MAX_ENTRIES, 0)
+    removed = 0
+    for i, (mtime, path, _) in enumerate(entries):
+        if i >= over and mtime >= expire_before:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+async def scratch_case_reaper():
+    logger.info(f"scratch test case reaper started: ttl={SCRATCH_TTL_SECONDS}s, max={SCRATCH_MAX_ENTRIES}")
+    while True:
+        try:
+            removed = await asyncio.to_thread(reap_scratch_cases)
+            if removed:
+                logger.info(f"scratch test case reaper removed {removed} directories")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"scratch test case reaper failed: {e}")
+        await asyncio.sleep(SCRATCH_REAP_INTERVAL_SECONDS)
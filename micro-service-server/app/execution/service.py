@@ -1,18 +1,20 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
-from http.client import HTTPException
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 import copy
 import os
-import uuid
-import json
 
 import httpx
+from fastapi import HTTPException
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.execution.http_client import judge_http_clients
 from app.execution.models import SysOption
+from app.execution.run_cache import run_key, run_once
+from app.execution.scratch_cases import prepare_scratch_case
 from app.execution.scheduler import ChooseJudgeServerAsync
 from app.utils.logging import logger
 
@@ -47,6 +49,23 @@ async def find_language_config(session: AsyncSession, language_name: str) -> Opt
     return None
 
 
+# judge_http_clients에 기억하는 실행 방식, 앞에서부터 순서대로 시도한다
+RUN_VARIANTS = ("run", "run_minimal", "judge")
+
+# 한 번에 실행할 수 있는 예제 수
+MAX_SAMPLE_CASES = int(os.getenv("MAX_SAMPLE_CASES", "20"))
+# 판정 서버 result 값 -> 예제 판정
+SAMPLE_VERDICTS = {
+    0: "Accepted",
+    -1: "Wrong Answer",
+    1: "Time Limit Exceeded",
+    2: "Time Limit Exceeded",
+    3: "Memory Limit Exceeded",
+    4: "Runtime Error",
+    5: "System Error",
+}
+
+
 class ExecutionService:
     def __init__(self, session: AsyncSession):
         self.session = session
@@ -59,32 +78,27 @@ class ExecutionService:
             stdin: str = "",
             max_cpu_time: int,
             max_memory_mb: int) -> Dict[str, Any]:
+        # 같은 코드와 입력은 동시에 들어와도 판정 서버를 한 번만 호출하고, 결과는 잠시 redis에 캐시한다
+        # 언어 설정은 요청 세션으로 먼저 읽는다. 설정이 바뀌면 key도 바뀌고, 여러 요청이 기다리는 factory는 세션을 쓰지 않는다
+        norm_config, hashed_token = await self._prepare_language(language)
+        key = run_key(language=language, language_config=norm_config, src=src, stdin=stdin or "",
+                      max_cpu_time=max_cpu_time, max_memory_mb=max_memory_mb)
+        return await run_once(key, lambda: self._run_code(
+            language=language, norm_config=norm_config, hashed_token=hashed_token, src=src, stdin=stdin,
+            max_cpu_time=max_cpu_time, max_memory_mb=max_memory_mb))
 
-        logger.info(f"Run code request: lang={language}, cpu={max_cpu_time}, mem={max_memory_mb}")
-
-        # Resolve language config from SysOptions
-        language_config = await find_language_config(self.session, language)
-        if not language_config:
-            logger.error(f"Wrong Language option: {language}")
-            raise HTTPException(status_code=400, detail="Wrong Language option")
-
-        token = await get_judge_server_token(self.session)
-        if not token:
-            logger.critical("Missing JUDGE_SERVER_TOKEN")
-            raise HTTPException(status_code=500, detail="Internal Server Error")
-            # return {"err": True, "data": "Missing JUDGE_SERVER_TOKEN (env or SysOptions)"}
-
-        hashed_token = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    async def _run_code(
+            self,
+            *,
+            language: str,
+            norm_config: Dict[str, Any],
+            hashed_token: str,
+            src: str,
+            stdin: str,
+            max_cpu_time: int,
+            max_memory_mb: int) -> Dict[str, Any]:
 
-        # Normalize language config for /run endpoint (ensure seccomp_rule is a string)
-        norm_config = copy.deepcopy(language_config)
-        run_cfg = norm_config.get("run", {})
-        sec_rule = run_cfg.get("seccomp_rule")
-        if isinstance(sec_rule, dict):
-            # Default to standard rule for C/C++ when mapping provided
-            # Known common rule names in QDUOJ judger: c_cpp, c_cpp_file_io, general, golang, node
-            run_cfg["seccomp_rule"] = "c_cpp"
-            norm_config["run"] = run_cfg
+        logger.info(f"Run code request: lang={language}, cpu={max_cpu_time}, mem={max_memory_mb}")
 
         async with ChooseJudgeServerAsync() as server:
             if not server or not server.service_url:
@@ -105,46 +119,152 @@ class ExecutionService:
             }
 
             headers = {"X-Judge-Server-Token": hashed_token}
+            client = judge_http_clients.get(server.service_url)
+            # InvalidRequest를 반환하는 판정 서버를 위한 최소 payload
+            minimal = {k: v for k, v in data.items() if k != "input"}
 
-            # Prefer a `/run` endpoint if available (commonly supported by judge servers)
-            url = server.service_url.rstrip("/") + "/run"
-
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                try:
-                    resp = await client.post(url, headers=headers, json=data)
+            # 판정 서버마다 동작하는 방식을 기억해 두고 다음 요청부터는 바로 그 방식으로 보낸다
+            # /run (전체 payload) -> /run (최소 payload) -> /judge (테스트 케이스 하나로 흉내) 순서로 시도한다
+            known = judge_http_clients.get_capability(server.service_url)
+            variants = RUN_VARIANTS[RUN_VARIANTS.index(known):] if known else RUN_VARIANTS
+            try:
+                for variant in variants:
+                    if variant == "judge":
+                        result = await self._run_via_judge(
+                            client=client,
+                            headers=headers,
+                            server_url=server.service_url,
+                            language_config=norm_config,
+                            src=src,
+                            stdin=stdin or "",
+                            max_cpu_time=max_cpu_time,
+                            max_memory_bytes=max(1, int(max_memory_mb)) * 1024 * 1024,
+                        )
+                        if not (isinstance(result, dict) and result.get("err") is True):
+                            judge_http_clients.set_capability(server.service_url, variant)
+                        return result
+                    # Prefer a `/run` endpoint if available (commonly supported by judge servers)
+                    resp = await client.post("/run", headers=headers, json=data if variant == "run" else minimal)
                     resp.raise_for_status()
                     result = resp.json()
-                    # Fallback: if InvalidRequest, retry with minimal payload
                     if isinstance(result, dict) and result.get("err") == "InvalidRequest":
-                        minimal = {
-                            "language_config": norm_config,
-                            "src": src,
-                            "max_cpu_time": max_cpu_time,
-                            "max_real_time": max(1, int(max_cpu_time) * 3),
-                            "max_memory": max(1, int(max_memory_mb)) * 1024 * 1024,
-                            "stdin": stdin or "",
-                            "output": True,
-                        }
-                        resp2 = await client.post(url, headers=headers, json=minimal)
-                        resp2.raise_for_status()
-                        result2 = resp2.json()
-                        if isinstance(result2, dict) and result2.get("err") == "InvalidRequest":
-                            # Second fallback: emulate a single test case and call /judge
-                            return await self._run_via_judge(
-                                client=client,
-                                headers=headers,
-                                server_url=server.service_url,
-                                language_config=norm_config,
-                                src=src,
-                                stdin=stdin or "",
-                                max_cpu_time=max_cpu_time,
-                                max_memory_bytes=max(1, int(max_memory_mb)) * 1024 * 1024,
-                            )
-                        return result2
+                        continue
+                    judge_http_clients.set_capability(server.service_url, variant)
                     return result
-                except Exception as e:
-                    logger.error(f"Judge server error: {e}")
-                    return {"err": True, "data": f"Judge server error: {e}"}
+            except Exception as e:
+                logger.error(f"Judge server error: {e}")
+                return {"err": True, "data": f"Judge server error: {e}"}
+
+    async def run_samples(
+            self,
+            *,
+            language: str,
+            src: str,
+            samples: List[Dict[str, Optional[str]]],
+            max_cpu_time: int,
+            max_memory_mb: int,
+            compare_output: bool = True) -> Dict[str, Any]:
+        """
+        한 번의 /judge 호출로 컴파일 한 번에 모든 예제를 실행한다.
+        samples: [{"input", "output"}], output이 None이거나 compare_output이 False(special judge)면
+        출력만 돌려주고 판정하지 않는다
+        """
+        norm_config, hashed_token = await self._prepare_language(language)
+        key = run_key(kind="samples", language=language, language_config=norm_config, src=src, samples=samples,
+                      max_cpu_time=max_cpu_time, max_memory_mb=max_memory_mb, compare_output=compare_output)
+        return await run_once(key, lambda: self._run_samples(
+            language=language, norm_config=norm_config, hashed_token=hashed_token, src=src, samples=samples,
+            max_cpu_time=max_cpu_time, max_memory_mb=max_memory_mb, compare_output=compare_output))
+
+    async def _run_samples(
+            self,
+            *,
+            language: str,
+            norm_config: Dict[str, Any],
+            hashed_token: str,
+            src: str,
+            samples: List[Dict[str, Optional[str]]],
+            max_cpu_time: int,
+            max_memory_mb: int,
+            compare_output: bool) -> Dict[str, Any]:
+        logger.info(f"Run samples request: lang={language}, samples={len(samples)}")
+        cases = [(sample["input"] or "", sample.get("output") or "") for sample in samples]
+        case_id = await asyncio.to_thread(prepare_scratch_case, cases)
+
+        async with ChooseJudgeServerAsync() as server:
+            if not server or not server.service_url:
+                logger.error("No available judge server found")
+                return {"err": True, "data": "No available judge server"}
+            data = {
+                "language_config": norm_config,
+                "src": src,
+                "max_cpu_time": max_cpu_time,
+                "max_memory": max(1, int(max_memory_mb)) * 1024 * 1024,
+                "test_case_id": case_id,
+                "output": True,
+            }
+            client = judge_http_clients.get(server.service_url)
+            try:
+                resp = await client.post("/judge", headers={"X-Judge-Server-Token": hashed_token}, json=data)
+                resp.raise_for_status()
+                result = resp.json()
+            except Exception as e:
+                logger.error(f"Judge server error: {e}")
+                return {"err": True, "data": f"Judge server error: {e}"}
+
+        # 컴파일 에러 등은 판정 서버 응답을 그대로 돌려준다
+        if not isinstance(result, dict) or result.get("err") or not isinstance(result.get("data"), list):
+            return result
+        by_case = {str(item.get("test_case")): item for item in result["data"]}
+        ret = []
+        for index, sample in enumerate(samples, 1):
+            item = by_case.get(str(index), {})
+            code = item.get("result")
+            expected = sample.get("output")
+            # 기대 출력이 없거나 special judge 문제면 비교 결과(Accepted/Wrong Answer)는 의미가 없다
+            verdict = SAMPLE_VERDICTS.get(code)
+            if (expected is None or not compare_output) and code in (0, -1):
+                verdict = None
+            ret.append({
+                "input": sample["input"],
+                "expected_output": expected,
+                "output": item.get("output"),
+                "verdict": verdict,
+                "result": code,
+                "cpu_time": item.get("cpu_time"),
+                "real_time": item.get("real_time"),
+                "memory": item.get("memory"),
+            })
+        return {"err": None, "data": ret}
+
+    async def _prepare_language(self, language: str):
+        """
+        (판정 서버용으로 정리한 언어 설정, 해시한 판정 서버 token)
+        """
+        # Resolve language config from SysOptions
+        language_config = await find_language_config(self.session, language)
+        if not language_config:
+            logger.error(f"Wrong Language option: {language}")
+            raise HTTPException(status_code=400, detail="Wrong Language option")
+
+        token = await get_judge_server_token(self.session)
+        if not token:
+            logger.critical("Missing JUDGE_SERVER_TOKEN")
+            raise HTTPException(status_code=500, detail="Internal Server Error")
+            # return {"err": True, "data": "Missing JUDGE_SERVER_TOKEN (env or SysOptions)"}
+
+        hashed_token = hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+        # Normalize language config for /run endpoint (ensure seccomp_rule is a string)
+        norm_config = copy.deepcopy(language_config)
+        run_cfg = norm_config.get("run", {})
+        sec_rule = run_cfg.get("seccomp_rule")
+        if isinstance(sec_rule, dict):
+            # Default to standard rule for C/C++ when mapping provided
+            # Known common rule names in QDUOJ judger: c_cpp, c_cpp_file_io, general, golang, node
+            run_cfg["seccomp_rule"] = "c_cpp"
+            norm_config["run"] = run_cfg
+        return norm_config, hashed_token
 
     async def _run_via_judge(
             self,
@@ -158,42 +278,8 @@ class ExecutionService:
             max_cpu_time: int,
             max_memory_bytes: int,
     ) -> Dict[str, Any]:
-        base = os.getenv("TEST_CASE_DATA_PATH", "/test_case")
-        case_id = uuid.uuid4().hex
-        case_dir = os.path.join(base, case_id)
-        os.makedirs(case_dir, exist_ok=True)
-        # Prepare a minimal test case with only input
-        in_name = "1.in"
-        out_name = "1.out"
-        with open(os.path.join(case_dir, in_name), "w", encoding="utf-8") as f:
-            f.write(stdin)
-        # Create empty expected output file to satisfy schema (won't be used if output=True)
-        out_path = os.path.join(case_dir, out_name)
-        open(out_path, "w").close()
-        # Compute md5 fields expected by judge server
-        import hashlib
-        with open(out_path, "rb") as f:
-            out_bytes = f.read()
-        output_md5 = hashlib.md5(out_bytes).hexdigest()
-        # stripped: simulate by stripping trailing spaces per-line and final newlines
-        try:
-            stripped_text = b"\n".join([line.rstrip() for line in out_bytes.splitlines()])
-        except Exception:
-            stripped_text = out_bytes
-        stripped_output_md5 = hashlib.md5(stripped_text).hexdigest()
-        info = {
-            "spj": False,
-            "test_cases": {
-                "1": {
-                    "input_name": in_name,
-                    "output_name": out_name,
-                    "output_md5": output_md5,
-                    "stripped_output_md5": stripped_output_md5,
-                }
-            },
-        }
-        with open(os.path.join(case_dir, "info"), "w", encoding="utf-8") as f:
-            json.dump(info, f)
+        # 같은 stdin이면 이미 만들어 둔 테스트 케이스 디렉터리를 재사용한다 (출력은 비교하지 않으므로 빈 파일)
+        case_id = await asyncio.to_thread(prepare_scratch_case, [(stdin, "")])
 
         data = {
             "language_config": language_config,
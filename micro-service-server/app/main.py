@@ -8,8 +8,12 @@ from sqlalchemy.orm import configure_mappers
 from app.auth import routes as auth_routes
 from app.code_autosave import routes as auto_save_routes
 from app.code_autosave.listener import code_save_listener
+from app.contest.listener import contest_rank_listener
+from app.submission.events import submission_event_hub
 from app.config.settings import settings
 from app.execution import routes as execution_routes
+from app.execution.http_client import judge_http_clients
+from app.execution.scratch_cases import scratch_case_reaper
 from app.problem import routes as problem_routes
 from app.security.cors import setup_cors
 from app.utils.logging import logger, LoggingMiddleware
@@ -34,14 +38,27 @@ async def lifespan(app: FastAPI):
     # logger.info("Auto-DDL: Checked/Created tables.")
 
     listener_task = asyncio.create_task(code_save_listener())
+    rank_listener_task = asyncio.create_task(contest_rank_listener())
+    submission_event_task = asyncio.create_task(submission_event_hub.run())
+    scratch_reaper_task = asyncio.create_task(scratch_case_reaper())
     configure_mappers()
     logger.info("DB mappers configured.")
     try:
         yield
     finally:
         listener_task.cancel()
+        rank_listener_task.cancel()
+        submission_event_task.cancel()
+        scratch_reaper_task.cancel()
         with suppress(asyncio.CancelledError):
             await listener_task
+        with suppress(asyncio.CancelledError):
+            await rank_listener_task
+        with suppress(asyncio.CancelledError):
+            await submission_event_task
+        with suppress(asyncio.CancelledError):
+            await scratch_reaper_task
+        await judge_http_clients.aclose()
 
 
 app = FastAPI(lifespan=lifespan, **settings.fastapi_kwargs)
@@ -1,15 +1,23 @@
+import time
+
 from sqlalchemy import select, func
 from datetime import datetime, timedelta
 from typing import List
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.monitoring.schemas import SubmissionHistoryItem
+from app.config.redis import get_redis
+from app.monitoring.schemas import JudgeQueueMetrics, SubmissionHistoryItem
 from app.submission.models import Submission
 
 JUDGE_STATUS_PENDING = 6  # 대기중
 JUDGE_STATUS_JUDGING = 7  # 채점중
 
+# OnlineJudge(judge.scheduler.JudgeQueue)가 관리하는 채점 대기열 key
+JUDGE_QUEUE_PENDING_KEY = "judge_queue:pending"
+JUDGE_QUEUE_STATS_KEY = "judge_queue:stats"
+JUDGE_QUEUE_TIERS = ("contest", "practice")
+
 
 async def get_queue_size(db: AsyncSession) -> int:
     stmt = select(func.count(Submission.id)).where(Submission.result.in_([JUDGE_STATUS_PENDING, JUDGE_STATUS_JUDGING]))
@@ -60,3 +68,21 @@ async def get_history_query(db: AsyncSession) -> List[SubmissionHistoryItem]:
     ]
 
     return history
+
+
+async def get_judge_queue_metrics() -> JudgeQueueMetrics:
+    redis = await get_redis()
+    pipe = redis.pipeline()
+    pipe.zcard(JUDGE_QUEUE_PENDING_KEY)
+    pipe.zrange(JUDGE_QUEUE_PENDING_KEY, 0, 0, withscores=True)
+    pipe.hgetall(JUDGE_QUEUE_STATS_KEY)
+    depth, oldest, stats = await pipe.execute()
+    dispatched = int(float(stats.get("dispatched", 0)))
+    total_wait = float(stats.get("total_wait", 0))
+    return JudgeQueueMetrics(
+        depth=depth,
+        depth_by_tier={tier: max(int(float(stats.get(f"depth:{tier}", 0))), 0) for tier in JUDGE_QUEUE_TIERS},
+        max_wait_time=max(time.time() - oldest[0][1], 0) if oldest else 0,
+        avg_wait_time=total_wait / dispatched if dispatched else 0,
+        dispatched=dispatched,
+    )
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -18,6 +18,17 @@ class SubmissionHistoryItem(BaseModel):
     time: str
     count: int
 
+class JudgeQueueMetrics(BaseModel):
+    depth: int
+    depth_by_tier: Dict[str, int]
+    max_wait_time: float
+    avg_wait_time: float
+    dispatched: int
+
+class ScratchTestCaseMetrics(BaseModel):
+    count: int
+    bytes: int
+
 class SystemMetrics(BaseModel):
     max_wait_time: float
     queue_size: int
@@ -30,4 +41,6 @@ class MonitoringResponse(BaseModel):
     queue_size: int
     submission_rate: int
     history: List[SubmissionHistoryItem]
+    judge_queue: Optional[JudgeQueueMetrics] = None
+    scratch_test_cases: Optional[ScratchTestCaseMetrics] = None
     timestamp: datetime
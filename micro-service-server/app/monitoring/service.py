@@ -1,10 +1,12 @@
+import asyncio
 from datetime import datetime
 
 import app.monitoring.repository as repo
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.monitoring.schemas import MonitoringResponse
+from app.execution.scratch_cases import scratch_stats
+from app.monitoring.schemas import MonitoringResponse, ScratchTestCaseMetrics
 
 
 async def get_get_judge_server_data(db: AsyncSession) -> MonitoringResponse:
@@ -12,10 +14,14 @@ async def get_get_judge_server_data(db: AsyncSession) -> MonitoringResponse:
     queue_size = await repo.get_queue_size(db)
     submission_rate = await repo.get_submission_rate(db)
     history_list = await repo.get_history_query(db)
+    judge_queue = await repo.get_judge_queue_metrics()
+    scratch_test_cases = ScratchTestCaseMetrics(**await asyncio.to_thread(scratch_stats))
     return MonitoringResponse(
         max_wait_time=max_wait_time,
         queue_size=queue_size,
         submission_rate=submission_rate,
         history=history_list,
+        judge_queue=judge_queue,
+        scratch_test_cases=scratch_test_cases,
         timestamp=datetime.utcnow(),
     )
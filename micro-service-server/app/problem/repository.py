@@ -1,12 +1,21 @@
-from typing import List, Optional, Sequence, Tuple
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy import Select, func, select
+from sqlalchemy import Select, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import ColumnElement
 
+from app.config.redis import get_redis
+from app.contest.models import Contest
 from app.problem.models import Problem, ProblemTag, problem_tags_association_table
 
+# OnlineJudge의 problem.utils.bump_problem_index_version이 문제나 태그가 바뀔 때 증가시키는 키 (db 1, prefix 없음)
+PROBLEM_INDEX_VERSION_KEY = "problem_index_version"
+# OnlineJudge의 problem.utils.get_problem_tag_counts와 같은 키, 같은 형식의 캐시를 공유한다
+PROBLEM_TAG_COUNTS_PREFIX = "problem_tag_counts"
+PROBLEM_TAG_COUNTS_TTL = 24 * 60 * 60
+
 
 async def fetch_all_problems(session: AsyncSession) -> List[Problem]:
     stmt = (
@@ -18,20 +27,40 @@ async def fetch_all_problems(session: AsyncSession) -> List[Problem]:
     return result.scalars().all()
 
 
-async def fetch_tag_counts(session: AsyncSession) -> Sequence[Tuple[str, int]]:
+async def fetch_tag_counts(session: AsyncSession) -> List[Dict[str, object]]:
+    """
+    [{"id", "name", "count", "public_count"}], count는 전체 문제 수, public_count는 공개 문제(대회 외, is_public) 수.
+    problem_index_version이 바뀌기 전까지는 redis에 캐시된 결과를 그대로 사용한다.
+    """
+    redis = await get_redis()
+    version = int(await redis.get(PROBLEM_INDEX_VERSION_KEY) or 0)
+    key = f"{PROBLEM_TAG_COUNTS_PREFIX}:{version}"
+    cached = await redis.get(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    problem_count = func.count(problem_tags_association_table.c.problem_id)
+    public_count = func.count(problem_tags_association_table.c.problem_id).filter(
+        Problem.contest_id.is_(None) & Problem.is_public.is_(True)
+    )
     stmt = (
-        select(ProblemTag.name, func.count(problem_tags_association_table.c.problem_id))
+        select(ProblemTag.id, ProblemTag.name, problem_count, public_count)
         .join(problem_tags_association_table, ProblemTag.id == problem_tags_association_table.c.problemtag_id)
         .join(Problem, Problem.id == problem_tags_association_table.c.problem_id)
-        .where(
-            Problem.contest_id.is_(None),
-            Problem.is_public.is_(True),
-        )
-        .group_by(ProblemTag.name)
-        .order_by(func.count(problem_tags_association_table.c.problem_id).desc())
+        .group_by(ProblemTag.id, ProblemTag.name)
+        .order_by(ProblemTag.id)
     )
     result = await session.execute(stmt)
-    return result.all()
+    rows = [
+        {"id": tag_id, "name": name, "count": count, "public_count": public}
+        for tag_id, name, count, public in result.all()
+    ]
+    await redis.set(key, json.dumps(rows), ex=PROBLEM_TAG_COUNTS_TTL)
+    return rows
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
 async def fetch_filtered_problems(
@@ -41,8 +70,16 @@ async def fetch_filtered_problems(
         ordering: ColumnElement,
         page: int,
         page_size: int,
+        keyword: Optional[str] = None,
 ) -> Tuple[List[Problem], int]:
     visibility_filter = Problem.is_public.is_(True) & Problem.contest_id.is_(None)
+    if keyword:
+        # OnlineJudge의 마이그레이션에서 만든 UPPER(title), UPPER(_id) pg_trgm GIN 인덱스를 사용한다
+        pattern = func.upper("%" + _escape_like(keyword) + "%")
+        visibility_filter = visibility_filter & or_(
+            func.upper(Problem.title).like(pattern, escape="\\"),
+            func.upper(Problem._id).like(pattern, escape="\\"),
+        )
     base_stmt: Select = (
         select(Problem)
         .options(selectinload(Problem.tags))
@@ -65,7 +102,12 @@ async def fetch_filtered_problems(
         base_stmt = base_stmt.where(Problem.id.in_(tagged_problem_ids_stmt))
 
     offset = max(page - 1, 0) * page_size
-    paginated_stmt = base_stmt.order_by(ordering).offset(offset).limit(page_size)
+    if keyword:
+        # 검색어와 trigram 유사도가 높은 문제를 먼저 보여준다
+        similarity = func.greatest(func.similarity(Problem.title, keyword), func.similarity(Problem._id, keyword))
+        paginated_stmt = base_stmt.order_by(similarity.desc(), ordering).offset(offset).limit(page_size)
+    else:
+        paginated_stmt = base_stmt.order_by(ordering).offset(offset).limit(page_size)
 
     result = await session.execute(paginated_stmt)
     problems = result.scalars().all()
@@ -82,6 +124,66 @@ async def fetch_filtered_problems(
     return problems, total_count
 
 
+def _public_problem_filter() -> ColumnElement:
+    return Problem.is_public.is_(True) & Problem.contest_id.is_(None)
+
+
+async def fetch_public_problem_index_rows(session: AsyncSession) -> Sequence[Tuple]:
+    stmt = (
+        select(Problem.id, Problem.create_time, Problem.last_update_time, Problem.total_score)
+        .where(_public_problem_filter())
+        .order_by(Problem.id)
+    )
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def fetch_public_problem_tag_rows(session: AsyncSession) -> Sequence[Tuple[int, int, str]]:
+    stmt = (
+        select(problem_tags_association_table.c.problem_id, ProblemTag.id, ProblemTag.name)
+        .join(ProblemTag, ProblemTag.id == problem_tags_association_table.c.problemtag_id)
+        .join(Problem, Problem.id == problem_tags_association_table.c.problem_id)
+        .where(_public_problem_filter())
+        .order_by(ProblemTag.id)
+    )
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def fetch_public_problems_by_ids(
+        session: AsyncSession,
+        problem_ids: Optional[List[int]],
+        *,
+        ordering: Optional[ColumnElement] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+) -> List[Problem]:
+    """
+    태그는 인메모리 인덱스에서 채우므로 selectinload 하지 않는다.
+    problem_ids가 None이면 공개 문제 전체를 대상으로 한다.
+    """
+    stmt = select(Problem).where(_public_problem_filter())
+    if problem_ids is not None:
+        stmt = stmt.where(Problem.id.in_(problem_ids))
+    if ordering is not None:
+        stmt = stmt.order_by(ordering, Problem.id).offset(offset).limit(limit)
+    result = await session.execute(stmt)
+    return result.scalars().all()
+
+
+async def fetch_problem_with_contest(session: AsyncSession, problem_id: int) -> Optional[Tuple]:
+    """
+    (문제, 대회, 대회 시작 여부), 대회 밖의 문제면 대회와 시작 여부는 None
+    """
+    stmt = (
+        select(Problem, Contest, (Contest.start_time <= func.now()).label("started"))
+        .outerjoin(Contest, Contest.id == Problem.contest_id)
+        .where(Problem.id == problem_id)
+    )
+    result = await session.execute(stmt)
+    return result.first()
+
+
 async def count_contest_problems(session: AsyncSession, contest_id: int) -> int:
     stmt = (
         select(func.count())
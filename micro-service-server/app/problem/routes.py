@@ -54,6 +54,8 @@ async def get_filter_sorted_problems(
         # 페이지네이션 관련
         page: int = Query(1, ge=1),
         page_size: int = Query(20, ge=1, le=250),
+        # 제목, 문제 번호 검색어
+        keyword: Optional[str] = Query(None),
         db: AsyncSession = Depends(get_session)
 ):
-    return await serv.get_filter_sorted_problems(tags, sort_option, order, page, page_size, db)
+    return await serv.get_filter_sorted_problems(tags, sort_option, order, page, page_size, db, keyword)
@@ -5,6 +5,7 @@ import random
 import re
 import string
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from typing import Dict, List, Optional
 
@@ -12,10 +13,17 @@ from fastapi import HTTPException, UploadFile
 from sqlalchemy import Float, asc, case, cast, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.contest_user import repository as contest_user_repository
 from app.problem import repository as problem_repository
 from app.problem.models import Problem
 from app.problem.schemas import ImportProblemSerializer
 from app.problem.schemas import ProblemListResponse
+from app.problem.tag_index import bump_problem_index_version, problem_tag_index
+from app.user.schemas import UserData
+
+# 테스트 케이스 압축 해제 시 한 번에 읽는 크기와 동시에 처리하는 파일 수
+TEST_CASE_CHUNK_SIZE = 1024 * 1024
+TEST_CASE_ZIP_WORKERS = int(os.getenv("TEST_CASE_ZIP_WORKERS", "4"))
 
 
 def rand_str(length=32, type="lower_hex"):
@@ -52,7 +60,43 @@ def build_problem_template(prepend, template, append):
     return TEMPLATE_BASE.format(prepend, template, append)
 
 
+def copy_test_case(src, dst, chunk_size=TEST_CASE_CHUNK_SIZE):
+    """
+    테스트 케이스를 chunk 단위로 src에서 dst로 복사하면서 \r\n을 \n으로 바꾼다. 메모리 사용량은 chunk_size에만 비례한다.
+    결과는 한 번에 읽고 replace(b"\r\n", b"\n") 한 것과 같다.
+
+    :return: (변환 후 크기, 끝의 공백 문자를 제거한 내용의 md5)
+    """
+    size = 0
+    md5 = hashlib.md5()
+    # 끝의 공백 문자는 뒤에 공백이 아닌 문자가 나올 때까지 md5에 반영하지 않는다
+    pending = b""
+    carry = b""
+    while True:
+        chunk = src.read(chunk_size)
+        data = carry + chunk
+        # \r\n이 두 chunk에 걸칠 수 있으므로 끝의 \r은 다음 chunk와 함께 처리한다
+        if chunk and data.endswith(b"\r"):
+            data, carry = data[:-1], b"\r"
+        else:
+            carry = b""
+        data = data.replace(b"\r\n", b"\n")
+        if data:
+            dst.write(data)
+            size += len(data)
+            stripped = data.rstrip()
+            if stripped:
+                md5.update(pending)
+                md5.update(stripped)
+                pending = data[len(stripped):]
+            else:
+                pending += data
+        if not chunk:
+            return size, md5.hexdigest()
+
+
 def filter_name_list(name_list, spj, dir=""):
+    name_list = set(name_list)
     ret = []
     prefix = 1
     if spj:
@@ -97,13 +141,21 @@ def process_zip(uploaded_zip_file, spj, dir=""):
     size_cache = {}
     md5_cache = {}
 
-    for item in test_case_list:
-        with open(os.path.join(test_case_dir, item), "wb") as f:
-            content = zip_file.read(f"{dir}{item}").replace(b"\r\n", b"\n")
-            size_cache[item] = len(content)
-            if item.endswith(".out"):
-                md5_cache[item] = hashlib.md5(content.rstrip()).hexdigest()
-            f.write(content)
+    def extract(item):
+        with zip_file.open(f"{dir}{item}") as src, open(os.path.join(test_case_dir, item), "wb") as dst:
+            return item, copy_test_case(src, dst)
+
+    # zipfile의 여러 멤버는 여러 스레드에서 동시에 읽을 수 있고, 압축 해제와 md5 계산 중에는 GIL이 풀린다
+    workers = min(TEST_CASE_ZIP_WORKERS, len(test_case_list))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(extract, test_case_list))
+    else:
+        results = [extract(item) for item in test_case_list]
+    for item, (size, md5) in results:
+        size_cache[item] = size
+        if item.endswith(".out"):
+            md5_cache[item] = md5
     test_case_info = {"spj": spj, "test_cases": {}}
 
     info = []
@@ -207,7 +259,9 @@ async def import_problem(file: UploadFile, db: AsyncSession):
 
                     created_problems.append(problem)
 
-            return await problem_repository.create_problems(db, created_problems)
+            created = await problem_repository.create_problems(db, created_problems)
+            await bump_problem_index_version()
+            return created
 
     finally:
         if os.path.exists(tmp_file):
@@ -220,7 +274,8 @@ async def get_all_problems(db: AsyncSession) -> List[Problem]:
 
 async def get_tag_count(db: AsyncSession):
     rows = await problem_repository.fetch_tag_counts(db)
-    return [{"tag": name, "count": count} for name, count in rows]
+    rows = sorted((row for row in rows if row["public_count"]), key=lambda row: row["public_count"], reverse=True)
+    return [{"tag": row["name"], "count": row["public_count"]} for row in rows]
 
 
 async def get_filter_sorted_problems(
@@ -230,6 +285,7 @@ async def get_filter_sorted_problems(
         page: int,
         page_size: int,
         db: AsyncSession,
+        keyword: Optional[str] = None,
 ) -> ProblemListResponse:
     accuracy_expression = case(
         (Problem.submission_number == 0, 0.0),
@@ -256,15 +312,20 @@ async def get_filter_sorted_problems(
     direction = (order or "asc").lower()
     ordering = desc(column) if direction == "desc" else asc(column)
 
-    problems, total_count = await problem_repository.fetch_filtered_problems(
-        db,
-        tags=tags,
-        ordering=ordering,
-        page=page,
-        page_size=page_size,
-    )
-
-    serialized = [_serialize_problem(problem) for problem in problems]
+    keyword = keyword.strip() if keyword else None
+    if keyword:
+        problems, total_count = await problem_repository.fetch_filtered_problems(
+            db,
+            tags=tags,
+            ordering=ordering,
+            page=page,
+            page_size=page_size,
+            keyword=keyword,
+        )
+        serialized = [_serialize_problem(problem) for problem in problems]
+    else:
+        serialized, total_count = await _indexed_problem_page(
+            db, tags, sort_option, direction == "desc", ordering, page, page_size)
 
     return ProblemListResponse(
         total=total_count,
@@ -274,9 +335,44 @@ async def get_filter_sorted_problems(
     )
 
 
-def _serialize_problem(problem: Problem) -> Dict[str, object]:
+async def _indexed_problem_page(
+        db: AsyncSession,
+        tags: Optional[List[str]],
+        sort_option: str,
+        descending: bool,
+        ordering,
+        page: int,
+        page_size: int,
+):
+    """
+    태그 필터와 개수는 인메모리 태그 인덱스로 계산하고, DB에서는 해당 페이지의 문제만 기본 키로 가져온다.
+    메모리에 없는 컬럼(제목, 제출 수 등)으로 정렬할 때만 DB에서 정렬한다.
+    """
+    await problem_tag_index.ensure_fresh(db)
+    mask = problem_tag_index.match(tags)
+    total_count = problem_tag_index.count(mask)
+    offset = max(page - 1, 0) * page_size
+    if not total_count or offset >= total_count:
+        return [], total_count
+
+    page_ids = problem_tag_index.page_ids(mask, sort_option, descending, offset, page_size)
+    if page_ids is not None:
+        problems = await problem_repository.fetch_public_problems_by_ids(db, page_ids)
+        position = {problem_id: i for i, problem_id in enumerate(page_ids)}
+        problems = sorted(problems, key=lambda problem: position[problem.id])
+    else:
+        problem_ids = None if problem_tag_index.is_all(mask) else problem_tag_index.problem_ids(mask)
+        problems = await problem_repository.fetch_public_problems_by_ids(
+            db, problem_ids, ordering=ordering, offset=offset, limit=page_size)
+
+    serialized = [_serialize_problem(problem, problem_tag_index.tags_of(problem.id)) for problem in problems]
+    return serialized, total_count
+
+
+def _serialize_problem(problem: Problem, tags: Optional[List[Dict[str, object]]] = None) -> Dict[str, object]:
     difficulty_value = _normalize_difficulty(problem)
-    tags = [{"id": tag.id, "name": tag.name} for tag in (problem.tags or [])]
+    if tags is None:
+        tags = [{"id": tag.id, "name": tag.name} for tag in (problem.tags or [])]
 
     return {
         "id": problem.id,
@@ -326,3 +422,30 @@ async def get_contest_problem_count(contest_id: int, db: AsyncSession) -> int:
 
 async def get_problem_count(db):
     return await problem_repository.count_problem(db)
+
+
+async def get_problem_for_samples(problem_id: int, userdata: UserData, db: AsyncSession) -> Optional[Problem]:
+    """
+    예제를 실행할 수 있는 문제, OnlineJudge의 문제 조회와 check_contest_permission과 같은 조건으로 확인한다
+    - 대회 밖의 문제: 공개(is_public)되고 visible인 문제
+    - 대회 문제: 대회가 visible이고, 생성자나 Super Admin이 아니면 시작된 대회의 visible 문제
+      비밀번호나 승인이 필요한 대회는 승인된 참가자만 (비밀번호 확인은 참가 신청에서 한다)
+    """
+    row = await problem_repository.fetch_problem_with_contest(db, problem_id)
+    if row is None:
+        return None
+    problem, contest, started = row
+    is_super_admin = userdata.admin_type == "Super Admin"
+    if contest is None:
+        return problem if is_super_admin or (problem.visible and problem.is_public) else None
+    if not contest.visible:
+        return None
+    if is_super_admin or contest.created_by_id == userdata.user_id:
+        return problem
+    if not problem.visible or not started:
+        return None
+    if contest.password or await contest_user_repository.get_policy(contest.id, db):
+        membership = await contest_user_repository.find_by_contest_and_user(contest.id, userdata.user_id, db)
+        if membership is None or membership.status != "approved":
+            return None
+    return problem
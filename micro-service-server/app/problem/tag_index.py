@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config.redis import get_redis
+from app.problem import repository as problem_repository
+from app.problem.repository import PROBLEM_INDEX_VERSION_KEY
+from app.utils.logging import logger
+
+# 버전 키는 최대 1초에 한 번만 확인한다
+VERSION_CHECK_INTERVAL_SECONDS = 1
+# 버전 증가를 놓치더라도 (통계 값 변경 등) 이 시간이 지나면 인덱스를 다시 만든다
+PROBLEM_TAG_INDEX_TTL_SECONDS = int(os.getenv("PROBLEM_TAG_INDEX_TTL_SECONDS", "300"))
+
+# 메모리에 있는 값만으로 정렬할 수 있는 컬럼. 나머지는 DB에서 정렬한다
+INDEX_SORT_COLUMNS = ("create_time", "last_update_time", "total_score")
+
+
+def _sort_key(value):
+    # PostgreSQL 오름차순과 같이 NULL을 마지막에 둔다
+    if value is None:
+        return True, 0
+    return False, value
+
+
+class ProblemTagIndex:
+    """
+    공개 문제의 태그 → 문제 bitset 인덱스.
+    bitset은 파이썬 int이고 i번째 비트가 self._problem_ids[i] 문제를 뜻한다.
+    태그 AND 필터는 비트 AND, 결과 개수는 bit_count()로 DB 없이 구한다.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._problem_ids: List[int] = []
+        self._all_mask = 0
+        self._tag_masks: Dict[str, int] = {}
+        self._problem_tags: Dict[int, List[Dict[str, object]]] = {}
+        # 정렬 컬럼 → 오름차순으로 정렬된 비트 위치
+        self._sorted_positions: Dict[str, List[int]] = {}
+        self._version: Optional[str] = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+
+    def _is_fresh(self, version: Optional[str]) -> bool:
+        return self._version is not None and version == self._version \
+            and time.monotonic() - self._built_at < PROBLEM_TAG_INDEX_TTL_SECONDS
+
+    async def ensure_fresh(self, session: AsyncSession):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < VERSION_CHECK_INTERVAL_SECONDS \
+                and now - self._built_at < PROBLEM_TAG_INDEX_TTL_SECONDS:
+            return
+        self._checked_at = now
+        redis = await get_redis()
+        version = await redis.get(PROBLEM_INDEX_VERSION_KEY) or "0"
+        if self._is_fresh(version):
+            return
+        async with self._lock:
+            if self._is_fresh(version):
+                return
+            # 재구성 중에 버전이 바뀌면 다음 확인 때 다시 만든다
+            await self._rebuild(session)
+            self._version = version
+
+    def invalidate(self):
+        self._version = None
+
+    async def _rebuild(self, session: AsyncSession):
+        started = time.perf_counter()
+        rows = await problem_repository.fetch_public_problem_index_rows(session)
+        tag_rows = await problem_repository.fetch_public_problem_tag_rows(session)
+
+        problem_ids = [row.id for row in rows]
+        positions = {problem_id: position for position, problem_id in enumerate(problem_ids)}
+        tag_masks: Dict[str, int] = {}
+        problem_tags: Dict[int, List[Dict[str, object]]] = {problem_id: [] for problem_id in problem_ids}
+        for problem_id, tag_id, tag_name in tag_rows:
+            position = positions.get(problem_id)
+            # 두 쿼리 사이에 공개된 문제는 다음 재구성 때 반영된다
+            if position is None:
+                continue
+            tag_masks[tag_name] = tag_masks.get(tag_name, 0) | (1 << position)
+            problem_tags[problem_id].append({"id": tag_id, "name": tag_name})
+
+        sorted_positions = {
+            column: sorted(range(len(rows)), key=lambda i, c=column: (_sort_key(getattr(rows[i], c)), rows[i].id))
+            for column in INDEX_SORT_COLUMNS
+        }
+
+        self._problem_ids = problem_ids
+        self._all_mask = (1 << len(problem_ids)) - 1
+        self._tag_masks = tag_masks
+        self._problem_tags = problem_tags
+        self._sorted_positions = sorted_positions
+        self._built_at = time.monotonic()
+        logger.info(f"problem tag index rebuilt: {len(problem_ids)} problems, {len(tag_masks)} tags "
+                    f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def match(self, tags: Optional[List[str]]) -> int:
+        mask = self._all_mask
+        for tag in set(tags or []):
+            mask &= self._tag_masks.get(tag, 0)
+            if not mask:
+                break
+        return mask
+
+    def is_all(self, mask: int) -> bool:
+        return mask == self._all_mask
+
+    @staticmethod
+    def count(mask: int) -> int:
+        return mask.bit_count()
+
+    def problem_ids(self, mask: int) -> List[int]:
+        # bin 문자열을 뒤집으면 i번째 문자가 i번째 비트가 된다
+        bits = bin(mask)[:1:-1]
+        return [self._problem_ids[i] for i, bit in enumerate(bits) if bit == "1"]
+
+    def page_ids(self, mask: int, sort_option: str, descending: bool, offset: int, limit: int) -> Optional[List[int]]:
+        """
+        메모리에서 정렬할 수 없는 컬럼이면 None을 반환한다.
+        """
+        positions = self._sorted_positions.get(sort_option)
+        if positions is None:
+            return None
+        if descending:
+            positions = reversed(positions)
+        bits = bin(mask)[:1:-1]
+        ret = []
+        skipped = 0
+        for position in positions:
+            if position >= len(bits) or bits[position] != "1":
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            ret.append(self._problem_ids[position])
+            if len(ret) >= limit:
+                break
+        return ret
+
+    def tags_of(self, problem_id: int) -> List[Dict[str, object]]:
+        return self._problem_tags.get(problem_id, [])
+
+
+problem_tag_index = ProblemTagIndex()
+
+
+async def bump_problem_index_version():
+    """
+    이 서버에서 문제를 추가했을 때 호출한다. 다른 워커의 인덱스와 태그별 문제 수 캐시도 버전으로 무효화된다.
+    """
+    problem_tag_index.invalidate()
+    redis = await get_redis()
+    await redis.incr(PROBLEM_INDEX_VERSION_KEY)
@@ -0,0 +1,70 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Set
+
+from app.config.redis import get_redis
+from app.utils.logging import logger
+
+# OnlineJudge(judge.dispatcher)가 채점 상태가 바뀔 때마다 {"submission_id", "result", "statistic_info"}를 publish
+SUBMISSION_STATUS_CHANNEL = "submission_status"
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+class SubmissionEventHub:
+    """
+    프로세스당 pub/sub 연결 하나를 열고, submission_id별로 연결된 SSE 클라이언트의 queue에 나눠준다.
+    대기 중인 클라이언트는 redis 연결 없이 queue 하나만 차지한다.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, submission_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[submission_id].add(queue)
+        return queue
+
+    def unsubscribe(self, submission_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(submission_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[submission_id]
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, submission_id: str, event: dict):
+        for queue in self._subscribers.get(submission_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 클라이언트가 읽지 못하고 있으면 중간 상태는 버린다
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                redis = await get_redis()
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(SUBMISSION_STATUS_CHANNEL)
+                logger.info(f"submission event hub subscribed to {SUBMISSION_STATUS_CHANNEL}")
+                async for msg in pubsub.listen():
+                    if msg["type"] != "message":
+                        continue
+                    try:
+                        event = json.loads(msg["data"])
+                        self.publish(str(event["submission_id"]), event)
+                    except (ValueError, KeyError):
+                        logger.warning(f"invalid submission event: {msg['data']}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"submission event hub disconnected: {e}")
+                await asyncio.sleep(1)
+
+
+submission_event_hub = SubmissionEventHub()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, Text
+from sqlalchemy import Boolean, Column, Integer, DateTime, Text
 from sqlalchemy.dialects.postgresql import JSONB
 from app.config.database import Base
 
@@ -14,3 +14,4 @@ class Submission(Base):
     problem_id = Column(Integer, nullable=False)
     user_id = Column(Integer, nullable=False)
     info = Column(JSONB, nullable=True)
+    shared = Column(Boolean, nullable=False, default=False)
@@ -2,11 +2,13 @@ from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import Iterable, List
 
-from sqlalchemy import case, func, select
+from sqlalchemy import bindparam, case, func, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.contest.models import Contest
 from app.problem.models import Problem
 from app.submission.models import Submission
+from app.user.models import User
 
 JUDGE_STATUS_ACCEPTED = 0
 
@@ -68,6 +70,7 @@ async def fetch_contest_problem_stats(
 async def fetch_contest_user_scores(
         db: AsyncSession,
         contest_id: int,
+        user_ids: Iterable[int] | None = None,
 ) -> List[dict]:
     """
     Compute per-user contest scores based on submission info and problem test_case_score.
@@ -102,6 +105,8 @@ async def fetch_contest_user_scores(
         Submission.problem_id,
         Submission.info,
     ).where(Submission.contest_id == contest_id)
+    if user_ids is not None:
+        stmt_submissions = stmt_submissions.where(Submission.user_id.in_(list(user_ids)))
     submission_rows = await db.execute(stmt_submissions)
 
     best_scores: dict[int, dict[int, int]] = defaultdict(dict)
@@ -151,6 +156,86 @@ async def fetch_contest_user_scores(
     return results
 
 
+# fetch_contest_user_scores와 같은 규칙으로 Postgres 안에서 집계
+# - test_case_score의 n번째 항목이 test_case "n"의 배점 (음수/숫자가 아닌 값은 0)
+# - 제출별 부분 점수 = 맞은 test case 배점의 합, (user, problem)별 최고 점수를 합산
+# - info.data가 배열인 제출이 하나라도 있는 사용자만 결과에 포함
+CONTEST_USER_SCORES_SQL = """
+WITH contest_problems AS (
+    SELECT id, test_case_score FROM public.problem WHERE contest_id = :contest_id
+),
+case_scores AS (
+    SELECT p.id AS problem_id,
+           cs.ordinality AS test_case,
+           GREATEST(CASE WHEN cs.value ->> 'score' ~ '^-?[0-9]+(\\.[0-9]+)?$'
+                         THEN trunc((cs.value ->> 'score')::numeric)::int ELSE 0 END, 0) AS score
+    FROM contest_problems p
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(p.test_case_score) = 'array' THEN p.test_case_score ELSE '[]'::jsonb END
+    ) WITH ORDINALITY AS cs(value, ordinality)
+),
+full_scores AS (
+    SELECT p.id AS problem_id, COALESCE(SUM(cs.score), 0) AS full_score
+    FROM contest_problems p
+    LEFT JOIN case_scores cs ON cs.problem_id = p.id
+    GROUP BY p.id
+),
+submission_scores AS (
+    SELECT s.user_id, s.problem_id, COALESCE(SUM(cs.score), 0) AS partial_score
+    FROM public.submission s
+    JOIN full_scores f ON f.problem_id = s.problem_id
+    LEFT JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(s.info -> 'data') = 'array' THEN s.info -> 'data' ELSE '[]'::jsonb END
+    ) AS d(value) ON TRUE
+    LEFT JOIN case_scores cs
+        ON cs.problem_id = s.problem_id
+        AND d.value ->> 'result' = '0'
+        AND cs.test_case = CASE WHEN d.value ->> 'test_case' ~ '^[0-9]+$' THEN (d.value ->> 'test_case')::int END
+    WHERE s.contest_id = :contest_id
+      AND jsonb_typeof(s.info -> 'data') = 'array'
+      {user_filter}
+    GROUP BY s.id, s.user_id, s.problem_id
+),
+best_scores AS (
+    SELECT user_id, problem_id, MAX(partial_score) AS best_score
+    FROM submission_scores
+    GROUP BY user_id, problem_id
+)
+SELECT b.user_id,
+       SUM(b.best_score)::int AS total_score,
+       COUNT(*) FILTER (WHERE f.full_score > 0 AND b.best_score >= f.full_score)::int AS solved_problems
+FROM best_scores b
+JOIN full_scores f ON f.problem_id = b.problem_id
+GROUP BY b.user_id
+"""
+
+
+async def fetch_contest_user_scores_sql(
+        db: AsyncSession,
+        contest_id: int,
+        user_ids: Iterable[int] | None = None,
+) -> List[dict]:
+    """
+    fetch_contest_user_scores와 같은 결과를 반환하지만 submission.info를 Python으로 가져오지 않는다
+    """
+    params = {"contest_id": contest_id}
+    if user_ids is None:
+        stmt = text(CONTEST_USER_SCORES_SQL.format(user_filter=""))
+    else:
+        stmt = text(CONTEST_USER_SCORES_SQL.format(user_filter="AND s.user_id IN :user_ids"))
+        stmt = stmt.bindparams(bindparam("user_ids", expanding=True))
+        params["user_ids"] = list(user_ids)
+    rows = await db.execute(stmt, params)
+    return [
+        {
+            "user_id": int(row.user_id),
+            "total_score": int(row.total_score),
+            "solved_problems": int(row.solved_problems),
+        }
+        for row in rows
+    ]
+
+
 async def get_user_submissions_by_year(user_id: int, db: AsyncSession):
     one_year_ago = datetime.utcnow() - timedelta(days=365)
     result = await db.execute(
@@ -161,3 +246,26 @@ async def get_user_submissions_by_year(user_id: int, db: AsyncSession):
         .group_by(func.date(Submission.create_time))
         .order_by(func.date(Submission.create_time)))
     return result.all()
+
+
+async def get_submission_status(submission_id: str, user_id: int, db: AsyncSession):
+    """
+    채점 상태와 OnlineJudge의 Submission.check_user_permission에 필요한 값
+    contest_not_ended는 대회 제출이 아니면 None, problem_permission은 조회하는 사용자의 문제 관리 권한
+    """
+    problem_permission = select(User.problem_permission).where(User.id == user_id).scalar_subquery()
+    result = await db.execute(
+        select(
+            Submission.user_id,
+            Submission.result,
+            Submission.shared,
+            Problem.created_by_id.label("problem_created_by_id"),
+            Problem.share_submission,
+            (Contest.end_time > func.now()).label("contest_not_ended"),
+            problem_permission.label("problem_permission"),
+        )
+        .join(Problem, Problem.id == Submission.problem_id)
+        .outerjoin(Contest, Contest.id == Submission.contest_id)
+        .where(Submission.id == submission_id)
+    )
+    return result.first()
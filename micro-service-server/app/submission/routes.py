@@ -31,6 +31,17 @@ async def get_contest_user_scores(
     return ContestScoreBoard(contest_id=contest_id, scores=scores)
 
 
+@router.get("/{submission_id}/events")
+async def stream_submission_status(
+        submission_id: str,
+        user_data: UserData = Depends(get_userdata),
+        db: AsyncSession = Depends(get_session)):
+    """
+    채점 상태를 Server-Sent Events로 전달, 채점이 끝나면 스트림을 닫는다
+    """
+    return await submission_service.stream_submission_status(submission_id, user_data, db)
+
+
 @router.get("/contribution", response_model=List[SubmissionDailyCount])
 async def get_contribution_data(
         user_data: UserData = Depends(get_userdata),
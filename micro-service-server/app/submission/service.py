@@ -1,12 +1,27 @@
+import asyncio
+import json
+import os
+import time
 from typing import Iterable, List, Optional
 
+from dotenv import load_dotenv
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.submission import repository as submission_repo
+from app.submission.events import submission_event_hub
 from app.submission.schemas import ContestProblemStat, ContestUserScore, SubmissionDailyCount
 from app.user.schemas import UserData
 from app.utils.logging import logger
 
+load_dotenv()
+SUBMISSION_EVENT_KEEPALIVE_SECONDS = 15
+# 채점이 끝나지 않아도 이 시간이 지나면 연결을 닫는다, 클라이언트는 다시 연결하면 된다
+SUBMISSION_EVENT_TIMEOUT_SECONDS = int(os.getenv("SUBMISSION_EVENT_TIMEOUT_SECONDS", "600"))
+JUDGE_STATUS_PENDING = 6
+JUDGE_STATUS_JUDGING = 7
+
 
 async def get_contest_problem_stats(
         contest_id: int,
@@ -26,7 +41,7 @@ async def get_contest_user_scores(
         contest_id: int,
         db: AsyncSession,
 ) -> List[ContestUserScore]:
-    scores = await submission_repo.fetch_contest_user_scores(
+    scores = await submission_repo.fetch_contest_user_scores_sql(
         db,
         contest_id=contest_id,
     )
@@ -39,4 +54,60 @@ async def get_contribution_data(user_data: UserData, db: AsyncSession) -> List[S
     return [
         SubmissionDailyCount(date=row.date, count=row.count)
         for row in rows
-    ]
\ No newline at end of file
+    ]
+
+async def stream_submission_status(submission_id: str, user_data: UserData, db: AsyncSession) -> StreamingResponse:
+    # DB 조회 전에 구독해야 조회와 구독 사이에 끝난 채점 결과를 놓치지 않는다
+    queue = submission_event_hub.subscribe(submission_id)
+    try:
+        submission = await submission_repo.get_submission_status(submission_id, user_data.user_id, db)
+        if submission is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Submission not found")
+        if not _can_view_submission(submission, user_data):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission Error")
+    except Exception:
+        submission_event_hub.unsubscribe(submission_id, queue)
+        raise
+    finally:
+        # 스트림이 열려 있는 동안 DB 연결을 잡고 있지 않도록 바로 반환
+        await db.close()
+
+    first_event = {"submission_id": submission_id, "result": submission.result}
+    return StreamingResponse(
+        _submission_event_stream(submission_id, first_event, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _can_view_submission(submission, user_data: UserData) -> bool:
+    # OnlineJudge의 Submission.check_user_permission(check_share=True)과 같은 조건
+    if (submission.user_id == user_data.user_id or user_data.admin_type == "Super Admin" or
+            submission.problem_permission == "All" or submission.problem_created_by_id == user_data.user_id):
+        return True
+    # 끝나지 않은 대회의 제출은 공유되지 않는다
+    if submission.contest_not_ended:
+        return False
+    return bool(submission.share_submission or submission.shared)
+
+
+async def _submission_event_stream(submission_id: str, event: dict, queue: asyncio.Queue):
+    deadline = time.monotonic() + SUBMISSION_EVENT_TIMEOUT_SECONDS
+    try:
+        yield _format_sse(event)
+        while event["result"] in (JUDGE_STATUS_PENDING, JUDGE_STATUS_JUDGING):
+            timeout = min(SUBMISSION_EVENT_KEEPALIVE_SECONDS, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield _format_sse(event)
+    finally:
+        submission_event_hub.unsubscribe(submission_id, queue)
+
+
+def _format_sse(event: dict) -> str:
+    return f"event: status\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,105 @@
+"""
+fetch_contest_user_scores (Python 집계)와 fetch_contest_user_scores_sql (Postgres 집계) 비교
+
+합성 대회/문제/제출을 하나의 transaction 안에서 만들고 측정이 끝나면 rollback 한다.
+
+    $ python -m benchmarks.contest_user_scores --users 300 --problems 10 --submissions 30
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.config.database import SessionLocal
+from app.submission import repository as submission_repo
+
+
+async def _create_contest(db, args) -> int:
+    created_by = (await db.execute(text('SELECT id FROM public."user" ORDER BY id LIMIT 1'))).scalar()
+    if created_by is None:
+        raise SystemExit("at least one user is required")
+    now = datetime.now(timezone.utc)
+    contest_id = (await db.execute(text("""
+        INSERT INTO public.contest (title, description, real_time_rank, password, rule_type, start_time, end_time,
+                                    create_time, last_update_time, visible, created_by_id, allowed_ip_ranges)
+        VALUES ('benchmark', 'benchmark', TRUE, NULL, 'OI', :start, :end, :start, :start, FALSE, :created_by, '[]')
+        RETURNING id
+    """), {"start": now, "end": now + timedelta(hours=3), "created_by": created_by})).scalar()
+
+    problem_ids = []
+    test_case_score = [{"input_name": f"{i}.in", "output_name": f"{i}.out", "score": 10}
+                       for i in range(1, args.cases + 1)]
+    for index in range(args.problems):
+        problem_id = (await db.execute(text("""
+            INSERT INTO public.problem (_id, contest_id, is_public, title, description, input_description,
+                                        output_description, samples, test_case_id, test_case_score, hint, languages,
+                                        template, create_time, last_update_time, created_by_id, time_limit,
+                                        memory_limit, io_mode, spj, spj_compile_ok, rule_type, visible, difficulty,
+                                        total_score, submission_number, accepted_number, statistic_info,
+                                        share_submission)
+            VALUES (:display_id, :contest_id, FALSE, 'benchmark', '', '', '', '[]', '', :test_case_score, '', '[]',
+                    '{}', :now, :now, :created_by, 1000, 256, '{"io_mode": "Standard IO"}', FALSE, FALSE, 'OI',
+                    FALSE, 'Low', :total_score, 0, 0, '{}', FALSE)
+            RETURNING id
+        """), {"display_id": f"benchmark-{uuid.uuid4().hex[:8]}-{index}", "contest_id": contest_id,
+               "test_case_score": json.dumps(test_case_score), "now": now, "created_by": created_by,
+               "total_score": 10 * args.cases})).scalar()
+        problem_ids.append(problem_id)
+
+    rows = []
+    for user_id in range(1, args.users + 1):
+        for _ in range(args.submissions):
+            data = [{"test_case": str(case), "result": 0 if random.random() < 0.6 else -1,
+                     "cpu_time": 1, "memory": 1, "output": None}
+                    for case in range(1, args.cases + 1)]
+            rows.append({"id": uuid.uuid4().hex, "contest_id": contest_id, "problem_id": random.choice(problem_ids),
+                         "create_time": now, "user_id": user_id, "username": f"user{user_id}",
+                         "info": json.dumps({"err": None, "data": data})})
+    await db.execute(text("""
+        INSERT INTO public.submission (id, contest_id, problem_id, create_time, user_id, username, code, result, info,
+                                       language, shared, statistic_info)
+        VALUES (:id, :contest_id, :problem_id, :create_time, :user_id, :username, '', 8, :info, 'C', FALSE, '{}')
+    """), rows)
+    return contest_id
+
+
+async def _measure(func, db, contest_id, repeat):
+    elapsed = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = await func(db, contest_id)
+        elapsed.append(time.perf_counter() - start)
+    return result, min(elapsed), sum(elapsed) / len(elapsed)
+
+
+async def main(args):
+    async with SessionLocal() as db:
+        try:
+            contest_id = await _create_contest(db, args)
+            print(f"synthetic contest {contest_id}: {args.users} users, {args.problems} problems, "
+                  f"{args.users * args.submissions} submissions, {args.cases} test cases each")
+            results = {}
+            for name, func in (("python", submission_repo.fetch_contest_user_scores),
+                               ("sql", submission_repo.fetch_contest_user_scores_sql)):
+                result, best, avg = await _measure(func, db, contest_id, args.repeat)
+                results[name] = sorted(result, key=lambda item: item["user_id"])
+                print(f"{name:>8}: best {best * 1000:.1f}ms, avg {avg * 1000:.1f}ms")
+            print("results match" if results["python"] == results["sql"] else "RESULTS DIFFER")
+        finally:
+            await db.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--problems", type=int, default=10)
+    parser.add_argument("--submissions", type=int, default=30, help="submissions per user")
+    parser.add_argument("--cases", type=int, default=10, help="test cases per problem")
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,153 @@
+"""
+ChooseJudgeServerAsync의 이전 구현(SELECT ... FOR UPDATE + UPDATE 두 번)과 캐시된 목록 + redis 임대 구현 비교
+
+동시 요청 --concurrency 개가 각각 판정 서버를 고르고 --run-ms 동안 실행한 것처럼 기다린 뒤 반납한다.
+합성 judge_server 행을 만들고 끝나면 지우므로 운영 DB가 아닌 곳에서 실행한다.
+
+    $ python -m benchmarks.judge_server_selection --concurrency 200 --servers 4 --cpu-core 8
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+
+from app.config.database import SessionLocal
+from app.config.redis import get_redis
+from app.execution.scheduler import ChooseJudgeServerAsync, JudgeServerRegistry, SelectedServer, _lease_key
+from app.judge_server.models import JudgeServer
+
+
+class LegacyChooseJudgeServer:
+    """
+    이전 구현, 선택할 때와 반납할 때 각각 새 세션과 transaction을 연다. 비교용
+    """
+
+    def __init__(self, hostname_prefix):
+        self.hostname_prefix = hostname_prefix
+        self.server = None
+
+    async def __aenter__(self):
+        async with SessionLocal() as session:
+            async with session.begin():
+                stmt = (
+                    select(JudgeServer)
+                    .where(JudgeServer.is_disabled.is_(False), JudgeServer.hostname.startswith(self.hostname_prefix))
+                    .order_by(JudgeServer.task_number)
+                    .with_for_update()
+                )
+                servers = [s for s in (await session.execute(stmt)).scalars().all() if s.status == "normal"]
+                for s in servers:
+                    if (s.task_number or 0) <= (s.cpu_core or 0) * 2:
+                        await session.execute(
+                            update(JudgeServer).where(JudgeServer.id == s.id)
+                            .values(task_number=JudgeServer.task_number + 1)
+                        )
+                        self.server = SelectedServer(id=s.id, service_url=s.service_url, cpu_core=s.cpu_core)
+                        return self.server
+        return None
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.server:
+            async with SessionLocal() as session:
+                async with session.begin():
+                    await session.execute(
+                        update(JudgeServer).where(JudgeServer.id == self.server.id)
+                        .values(task_number=JudgeServer.task_number - 1)
+                    )
+        return False
+
+
+class BenchmarkRegistry(JudgeServerRegistry):
+    """
+    합성 서버만 보도록 목록 쿼리를 제한한다
+    """
+
+    def __init__(self, hostname_prefix):
+        super().__init__()
+        self.hostname_prefix = hostname_prefix
+
+    async def _refresh(self):
+        await super()._refresh()
+        self._servers = [s for s in self._servers if s.hostname.startswith(self.hostname_prefix)]
+
+
+async def _create_servers(args, prefix):
+    # heartbeat를 미래로 두어 측정하는 동안 normal 상태를 유지한다
+    heartbeat = datetime.utcnow() + timedelta(hours=1)
+    async with SessionLocal() as session:
+        async with session.begin():
+            servers = [JudgeServer(hostname=f"{prefix}-{i}", judger_version="benchmark", cpu_core=args.cpu_core,
+                                   memory_usage=0, cpu_usage=0, last_heartbeat=heartbeat, create_time=heartbeat,
+                                   task_number=0, service_url="http://benchmark.invalid", is_disabled=False)
+                       for i in range(args.servers)]
+            session.add_all(servers)
+        return [s.id for s in servers]
+
+
+async def _delete_servers(server_ids):
+    async with SessionLocal() as session:
+        async with session.begin():
+            await session.execute(delete(JudgeServer).where(JudgeServer.id.in_(server_ids)))
+    redis = await get_redis()
+    await redis.delete(*[_lease_key(server_id) for server_id in server_ids])
+
+
+async def _run(selector_factory, args):
+    latencies = []
+    rejected = 0
+
+    async def one():
+        nonlocal rejected
+        start = time.perf_counter()
+        async with selector_factory() as server:
+            if server is None:
+                rejected += 1
+                return
+            await asyncio.sleep(args.run_ms / 1000)
+        latencies.append(time.perf_counter() - start - args.run_ms / 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(args.concurrency)])
+    return time.perf_counter() - start, latencies, rejected
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+async def main(args):
+    prefix = f"benchmark-{uuid.uuid4().hex[:8]}"
+    server_ids = await _create_servers(args, prefix)
+    print(f"{args.servers} synthetic judge servers, {args.servers * (args.cpu_core * 2 + 1)} slots, "
+          f"{args.concurrency} concurrent runs of {args.run_ms}ms")
+    try:
+        registry = BenchmarkRegistry(prefix)
+        for name, factory in (("legacy", lambda: LegacyChooseJudgeServer(prefix)),
+                              ("registry", lambda: ChooseJudgeServerAsync(registry))):
+            for _ in range(args.repeat):
+                elapsed, latencies, rejected = await _run(factory, args)
+                # 선택과 반납에 걸린 시간 (실행 시간 제외)
+                latencies_ms = [latency * 1000 for latency in latencies]
+                print(f"{name:>8}: total {elapsed * 1000:.0f}ms, overhead p50 {_percentile(latencies_ms, 50):.1f}ms, "
+                      f"p95 {_percentile(latencies_ms, 95):.1f}ms, p99 {_percentile(latencies_ms, 99):.1f}ms, "
+                      f"mean {statistics.mean(latencies_ms) if latencies_ms else 0:.1f}ms, "
+                      f"{len(latencies)} ran, {rejected} rejected")
+    finally:
+        await _delete_servers(server_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--servers", type=int, default=4)
+    parser.add_argument("--cpu-core", type=int, default=8)
+    parser.add_argument("--run-ms", type=int, default=200, help="simulated execution time")
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
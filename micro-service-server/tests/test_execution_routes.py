@@ -0,0 +1,27 @@
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config.database import get_session
+from app.execution import routes as execution_routes
+from app.security.deps import get_userdata
+from app.user.schemas import UserData
+
+
+def _client() -> TestClient:
+    # lifespan의 listener 없이 실행 API만 올린다
+    app = FastAPI()
+    app.include_router(execution_routes.router)
+    app.dependency_overrides[get_userdata] = lambda: UserData(user_id=1, username="test", avatar="",
+                                                              admin_type="Regular User")
+    app.dependency_overrides[get_session] = lambda: None
+    return TestClient(app)
+
+
+def test_run_samples_with_invalid_language():
+    with mock.patch("app.execution.service.find_language_config", mock.AsyncMock(return_value=None)):
+        resp = _client().post("/api/execution/run-samples",
+                              json={"language": "Invalid", "code": "print(1)", "inputs": ["1"]})
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Wrong Language option"